@@ -18,17 +18,28 @@ from datetime import datetime, date, timedelta
 import ssl
 import ssl
 
+import click
 from dotenv import load_dotenv
-from flask import Flask, render_template, send_file, request, jsonify, url_for, flash, redirect, session
+from flask import Flask, render_template, send_file, request, jsonify, url_for, flash, redirect, session, g, has_app_context
 from flask_apscheduler import APScheduler
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from flask_mail import Mail, Message
 from flask_migrate import Migrate
 from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import func, or_, and_, inspect, text
+from sqlalchemy import event, func, or_, and_, case, extract, inspect, text, select, literal, exists, union_all, bindparam
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 
 from recurring_detection import detect_recurring_transactions, create_recurring_expense_from_detection
+from settlement_planner import plan_settlements
+from dashboard_cache import create_dashboard_cache
+from currency_table import CurrencyRateTable
+from category_matcher import CategoryMatcherCache, MappingRule
+from category_classifier import CategoryClassifierCache, tokenize
+from fx_rates import LocalRatesAPI, date_chunks, parse_timeseries
 from oidc_auth import setup_oidc_config, register_oidc_routes
 from oidc_user import extend_user_model
 from simplefin_client import SimpleFin
@@ -79,6 +90,27 @@ app.config['INVESTMENT_TRACKING_ENABLED'] = os.getenv('INVESTMENT_TRACKING_ENABL
 app.config['FMP_API_KEY'] = os.getenv('FMP_API_KEY', None)
 app.config['FMP_API_URL'] = os.getenv('FMP_API_URL', 'https://financialmodelingprep.com/api/v3')
 
+# Dashboard summary cache: 'memory' (per worker LRU), 'database' (shared table) or 'none'
+app.config['DASHBOARD_CACHE_BACKEND'] = os.getenv('DASHBOARD_CACHE_BACKEND', 'memory').lower()
+app.config['DASHBOARD_CACHE_SIZE'] = int(os.getenv('DASHBOARD_CACHE_SIZE', 512))
+
+# Seconds a worker trusts its in-memory currency rates before checking the shared version
+app.config['CURRENCY_TABLE_CHECK_SECONDS'] = float(os.getenv('CURRENCY_TABLE_CHECK_SECONDS', 5))
+# Seconds a worker trusts its compiled category mapping rules before checking the user's rules version
+app.config['CATEGORY_MATCHER_CHECK_SECONDS'] = float(os.getenv('CATEGORY_MATCHER_CHECK_SECONDS', 5))
+# Naive Bayes fallback for transactions no mapping matches: how sure it must be, how many
+# categorized transactions a user needs first, and how long a worker's model lives before retraining
+app.config['CATEGORY_CLASSIFIER_ENABLED'] = os.getenv('CATEGORY_CLASSIFIER_ENABLED', 'True').lower() == 'true'
+app.config['CATEGORY_CLASSIFIER_MIN_CONFIDENCE'] = float(os.getenv('CATEGORY_CLASSIFIER_MIN_CONFIDENCE', 0.6))
+app.config['CATEGORY_CLASSIFIER_MIN_HISTORY'] = int(os.getenv('CATEGORY_CLASSIFIER_MIN_HISTORY', 20))
+app.config['CATEGORY_CLASSIFIER_MAX_AGE_SECONDS'] = float(os.getenv('CATEGORY_CLASSIFIER_MAX_AGE_SECONDS', 3600))
+# Transactions per chunk of a background bulk categorization, and how long a run may go
+# without progress before it counts as abandoned and a new one can start
+app.config['BULK_CATEGORIZE_BATCH_SIZE'] = int(os.getenv('BULK_CATEGORIZE_BATCH_SIZE', 2000))
+app.config['BULK_CATEGORIZE_STALE_SECONDS'] = int(os.getenv('BULK_CATEGORIZE_STALE_SECONDS', 600))
+# Exchange rate API (Frankfurter compatible: /latest and /<start>..<end>)
+app.config['FX_RATES_API_URL'] = os.getenv('FX_RATES_API_URL', 'https://api.frankfurter.app').rstrip('/')
+
 
 
 # Email configuration from environment variables
@@ -108,6 +140,31 @@ def scheduled_simplefin_sync():
     """Run every day at 11:00 PM"""
     sync_all_simplefin_accounts()
 
+
+@scheduler.task('cron', id='balance_snapshots', hour=23, minute=55)
+def scheduled_balance_snapshots():
+    """Run every day at 11:55 PM"""
+    record_all_balance_snapshots()
+
+
+@scheduler.task('cron', id='budget_periods', hour=0, minute=5)
+def scheduled_budget_periods():
+    """Run every day at 12:05 AM"""
+    close_budget_periods()
+
+
+# Linked account balances are normally synced right after a change is committed
+# (see queue_investment_account_sync); this catches anything left flagged
+INVESTMENT_ACCOUNT_SYNC_JOB_ID = 'investment_account_sync_now'
+
+# Rewrites expenses.amount_base after the base currency changes
+AMOUNT_BASE_RECOMPUTE_JOB_ID = 'amount_base_recompute'
+
+@scheduler.task('interval', id='investment_account_sync', minutes=15)
+def scheduled_investment_account_sync():
+    """Run every 15 minutes"""
+    sync_investments_with_accounts()
+
 # Start the scheduler
 scheduler.start()
 
@@ -215,6 +272,8 @@ class User(UserMixin, db.Model):
     monthly_report_enabled = db.Column(db.Boolean, default=True)     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     timezone = db.Column(db.String(50), nullable=True, default='UTC')
+    dashboard_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Bumped on every change to the user's data
+    category_rules_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Bumped on every change to the user's category mappings
 
     def set_password(self, password):
         self.password_hash = generate_password_hash(password,method='pbkdf2:sha256')
@@ -275,6 +334,14 @@ class Currency(db.Model):
     
     def __repr__(self):
         return f"{self.code} ({self.symbol})"
+
+
+class CurrencyRate(db.Model):
+    """Daily exchange rate history; the base currency itself is never stored"""
+    __tablename__ = 'currency_rates'
+    code = db.Column(db.String(3), db.ForeignKey('currencies.code'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    rate_to_base = db.Column(db.Float, nullable=False)  # Base units per 1 unit of this currency
     
 expense_tags = db.Table('expense_tags',
     db.Column('expense_id', db.Integer, db.ForeignKey('expenses.id'), primary_key=True),
@@ -299,6 +366,17 @@ class Category(db.Model):
     def __repr__(self):
         return f"<Category: {self.name}>"
 
+class CategoryClosure(db.Model):
+    """Every (ancestor, descendant) pair of the category tree, each category also paired with itself"""
+    __tablename__ = 'category_closure'
+    ancestor_id = db.Column(db.Integer, db.ForeignKey('categories.id'), primary_key=True)
+    descendant_id = db.Column(db.Integer, db.ForeignKey('categories.id'), primary_key=True)
+    depth = db.Column(db.Integer, nullable=False)  # 0 for the category itself, 1 for its children, ...
+
+    __table_args__ = (
+        db.Index('ix_category_closure_descendant', 'descendant_id'),
+    )
+
 class CategorySplit(db.Model):
     __tablename__ = 'category_splits'
     id = db.Column(db.Integer, primary_key=True)
@@ -333,6 +411,17 @@ class Account(db.Model):
         return f"<Account {self.name} ({self.type})>"
 
 
+class BalanceSnapshot(db.Model):
+    """End-of-day balance of an account, the source of the net-worth history"""
+    __tablename__ = 'balance_snapshots'
+    account_id = db.Column(db.Integer, db.ForeignKey('accounts.id'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    balance = db.Column(db.Float, nullable=False)  # In the account's currency
+    balance_base = db.Column(db.Float, nullable=False)  # In the base currency
+
+    account = db.relationship('Account')
+
+
 
 class Expense(db.Model):
     __tablename__ = 'expenses'
@@ -354,6 +443,7 @@ class Expense(db.Model):
     # Add these fields to your existing Expense class:
     currency_code = db.Column(db.String(3), db.ForeignKey('currencies.code'), nullable=True)
     original_amount = db.Column(db.Float, nullable=True) # Amount in original currency
+    amount_base = db.Column(db.Float, nullable=True)  # Amount in the base currency at the rate of the expense date
     category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=True)
     currency = db.relationship('Currency', backref=db.backref('expenses', lazy=True))
     #imports
@@ -370,6 +460,11 @@ class Expense(db.Model):
     
     # Add to Expense class:
     has_category_splits = db.Column(db.Boolean, default=False)
+
+    # Keyset pagination of the dashboard activity feed walks (date, id) in order
+    __table_args__ = (
+        db.Index('ix_expenses_date_id', 'date', 'id'),
+    )
     
     @property
     def is_income(self):
@@ -382,20 +477,41 @@ class Expense(db.Model):
     @property
     def is_expense(self):
         return self.transaction_type == 'expense' or self.transaction_type is None
-
-    def calculate_splits(self):
+    
+    @property
+    def base_factor(self):
+        """Multiplier from this expense's currency to the base currency"""
+        if self.amount_base is None or not self.amount:
+            return 1.0
+        return self.amount_base / self.amount
+
+    def get_split_user_ids(self):
+        """Return the ids of every user referenced by this expense (payer and split_with)"""
+        user_ids = {self.paid_by}
+        if self.split_with:
+            user_ids.update(user_id.strip() for user_id in self.split_with.split(','))
+        return user_ids
+
+    def calculate_splits(self, users_by_id=None):
+        """
+        Calculate the payer's and each participant's share of this expense.
+        users_by_id maps user ids to User rows; when omitted the referenced
+        users are loaded in a single query.
+        """
+        if users_by_id is None:
+            users_by_id = get_users_by_ids(self.get_split_user_ids())
     
         # Get the user who paid
-        payer = User.query.filter_by(id=self.paid_by).first()
+        payer = users_by_id.get(self.paid_by)
         payer_name = payer.name if payer else "Unknown"
-        payer_email = payer.id
+        payer_email = payer.id if payer else self.paid_by
         
         # Get all people this expense is split with
         split_with_ids = self.split_with.split(',') if self.split_with else []
         split_users = []
         
         for user_id in split_with_ids:
-            user = User.query.filter_by(id=user_id.strip()).first()
+            user = users_by_id.get(user_id.strip())
             if user:
                 split_users.append({
                     'id': user.id,
@@ -584,6 +700,453 @@ class Expense(db.Model):
 
         return result
 
+
+def get_users_by_ids(user_ids):
+    """Load the given users with one query and return them keyed by id"""
+    user_ids = {user_id for user_id in user_ids if user_id}
+    if not user_ids:
+        return {}
+    return {user.id: user for user in User.query.filter(User.id.in_(user_ids)).all()}
+
+
+def calculate_splits_batch(expenses):
+    """
+    Calculate splits for many expenses at once.
+    Every user referenced by the expenses is resolved in a single query, so the
+    cost no longer grows with one lookup per payer and participant.
+    Returns a dict of {expense_id: splits} in the calculate_splits() format.
+    """
+    user_ids = set()
+    for expense in expenses:
+        user_ids.update(expense.get_split_user_ids())
+    
+    users_by_id = get_users_by_ids(user_ids)
+    
+    return {expense.id: expense.calculate_splits(users_by_id) for expense in expenses}
+
+
+class ExpenseShare(db.Model):
+    """Materialized share of an expense owed by one participant (payer included)"""
+    __tablename__ = 'expense_shares'
+    id = db.Column(db.Integer, primary_key=True)
+    expense_id = db.Column(db.Integer, db.ForeignKey('expenses.id'), nullable=False, index=True)
+    user_id = db.Column(db.String(120), db.ForeignKey('users.id'), nullable=False)
+    amount = db.Column(db.Float, nullable=False)  # Share in base currency
+    original_amount = db.Column(db.Float, nullable=True)  # Share in the expense's original currency
+    currency_code = db.Column(db.String(3), nullable=True)
+    paid_by = db.Column(db.String(120), db.ForeignKey('users.id'), nullable=True)  # Who this share is owed to
+
+    # Relationships
+    expense = db.relationship('Expense', backref=db.backref('shares', cascade='all, delete-orphan'))
+
+    __table_args__ = (
+        db.Index('ix_expense_shares_user_expense', 'user_id', 'expense_id'),
+    )
+
+
+def build_expense_share_rows(expenses):
+    """
+    Turn calculate_splits() output into expense_shares rows.
+    The payer's portion and their split entry are merged into one row per user,
+    and zero shares or users that no longer exist are skipped.
+    """
+    user_ids = set()
+    for expense in expenses:
+        user_ids.update(expense.get_split_user_ids())
+
+    users_by_id = get_users_by_ids(user_ids)
+
+    rows = []
+    for expense in expenses:
+        splits = expense.calculate_splits(users_by_id)
+
+        # The payer entry carries the full original amount, so scale it to the share
+        original_total = expense.original_amount if expense.original_amount is not None else expense.amount
+        original_ratio = original_total / expense.amount if expense.amount else 0
+
+        shares = {}
+        if splits['payer']['amount']:
+            payer_amount = splits['payer']['amount']
+            shares[expense.paid_by] = [payer_amount, payer_amount * original_ratio]
+
+        for split in splits['splits']:
+            share = shares.setdefault(split['email'], [0.0, 0.0])
+            share[0] += split['amount']
+            share[1] += split['original_amount']
+
+        # Shares owed to a payer that is no longer a user don't feed the pair balances
+        paid_by = expense.paid_by if expense.paid_by in users_by_id else None
+
+        for user_id, (amount, original_amount) in shares.items():
+            if not amount or user_id not in users_by_id:
+                continue
+            rows.append({
+                'expense_id': expense.id,
+                'user_id': user_id,
+                'amount': amount,
+                'original_amount': original_amount,
+                'currency_code': expense.currency_code,
+                'paid_by': paid_by
+            })
+
+    return rows
+
+
+def delete_expense_rows(model, expense_ids):
+    """Delete the rows of a per-expense table (shares, participants) for the given expense ids"""
+    for start in range(0, len(expense_ids), 500):
+        model.query.filter(
+            model.expense_id.in_(expense_ids[start:start + 500])
+        ).delete(synchronize_session=False)
+
+
+def sync_expense_shares(expenses):
+    """
+    Rewrite the expense_shares rows for the given expenses.
+    Call after creating or editing expenses, inside the same transaction.
+    """
+    if not expenses:
+        return
+
+    # Make sure new expenses have ids and edits are visible to the queries below
+    db.session.flush()
+
+    delete_expense_rows(ExpenseShare, [expense.id for expense in expenses])
+
+    rows = build_expense_share_rows(expenses)
+    if rows:
+        db.session.bulk_insert_mappings(ExpenseShare, rows)
+
+    # Budget spending is summed from the shares, which the bulk writes hide from the session events
+    for expense in expenses:
+        mark_budget_period_day(db.session, expense.user_id, expense.date)
+
+
+def expense_amount_base():
+    """Expense amount in the base currency, falling back to amount for rows not backfilled yet"""
+    return func.coalesce(Expense.amount_base, Expense.amount)
+
+
+def in_base_currency(amount):
+    """
+    Convert a column holding part of an expense (a share or a category split) from
+    the expense's currency to the base currency, using the expense's own rate
+    """
+    return amount * case((Expense.amount != 0, expense_amount_base() / Expense.amount), else_=1.0)
+
+
+def expense_share_query(user_id, *filters):
+    """Query for the user's summed share (in the base currency) of the expenses matching the filters"""
+    return db.session.query(func.coalesce(func.sum(in_base_currency(ExpenseShare.amount)), 0.0)).select_from(ExpenseShare).join(
+        Expense, ExpenseShare.expense_id == Expense.id
+    ).filter(ExpenseShare.user_id == user_id, *filters)
+
+
+class ExpenseParticipant(db.Model):
+    """Users involved in an expense: its owner and everyone it is split with"""
+    __tablename__ = 'expense_participants'
+    expense_id = db.Column(db.Integer, db.ForeignKey('expenses.id'), primary_key=True)
+    user_id = db.Column(db.String(120), db.ForeignKey('users.id'), primary_key=True)
+
+    # Relationships
+    expense = db.relationship('Expense', backref=db.backref('participants', cascade='all, delete-orphan'))
+
+    __table_args__ = (
+        db.Index('ix_expense_participants_user_expense', 'user_id', 'expense_id'),
+    )
+
+
+def build_expense_participant_rows(expenses):
+    """
+    Build expense_participants rows for the given expenses.
+    Only id, user_id and split_with are read, so column-only query rows work
+    as well as Expense objects. Ids in split_with that aren't users are skipped.
+    """
+    split_user_ids = set()
+    for expense in expenses:
+        if expense.split_with:
+            split_user_ids.update(user_id.strip() for user_id in expense.split_with.split(','))
+
+    known_user_ids = set()
+    if split_user_ids:
+        known_user_ids = {user_id for (user_id,) in db.session.query(User.id).filter(User.id.in_(split_user_ids))}
+
+    rows = []
+    for expense in expenses:
+        user_ids = {expense.user_id}
+        if expense.split_with:
+            user_ids.update(
+                user_id.strip() for user_id in expense.split_with.split(',')
+                if user_id.strip() in known_user_ids
+            )
+        rows.extend({'expense_id': expense.id, 'user_id': user_id} for user_id in user_ids)
+
+    return rows
+
+
+def sync_expense_participants(expenses):
+    """
+    Rewrite the expense_participants rows for the given expenses.
+    Call after creating or editing expenses, inside the same transaction.
+    """
+    if not expenses:
+        return
+
+    db.session.flush()
+
+    delete_expense_rows(ExpenseParticipant, [expense.id for expense in expenses])
+
+    rows = build_expense_participant_rows(expenses)
+    if rows:
+        db.session.bulk_insert_mappings(ExpenseParticipant, rows)
+
+
+class UserPairBalance(db.Model):
+    """Running net balance between two users, stored once from each side"""
+    __tablename__ = 'user_pair_balances'
+    user_id = db.Column(db.String(120), db.ForeignKey('users.id'), primary_key=True)
+    other_user_id = db.Column(db.String(120), db.ForeignKey('users.id'), primary_key=True)
+    amount = db.Column(db.Float, nullable=False, default=0.0)  # What other_user owes user (negative: user owes other_user)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+def add_pair_delta(deltas, creditor_id, debtor_id, amount):
+    """
+    Record that debtor_id now owes creditor_id `amount` more.
+    Keys are ordered so both directions of a pair accumulate into one entry,
+    whose value is what the second user owes the first.
+    """
+    if creditor_id == debtor_id or not amount:
+        return
+    if creditor_id < debtor_id:
+        deltas[(creditor_id, debtor_id)] = deltas.get((creditor_id, debtor_id), 0.0) + amount
+    else:
+        deltas[(debtor_id, creditor_id)] = deltas.get((debtor_id, creditor_id), 0.0) - amount
+
+
+def expense_pair_deltas(expense_ids):
+    """Pair balance contributions of the given expenses, read from their current expense_shares rows"""
+    deltas = {}
+    for start in range(0, len(expense_ids), 500):
+        shares = db.session.query(ExpenseShare.paid_by, ExpenseShare.user_id, ExpenseShare.amount).filter(
+            ExpenseShare.expense_id.in_(expense_ids[start:start + 500]),
+            ExpenseShare.paid_by.isnot(None)
+        )
+        for paid_by, user_id, amount in shares:
+            add_pair_delta(deltas, paid_by, user_id, amount)
+    return deltas
+
+
+def settlement_pair_deltas(settlements):
+    """Pair balance contributions of the given settlements"""
+    deltas = {}
+    for settlement in settlements:
+        # Paying someone back means they now owe the payer that much more
+        add_pair_delta(deltas, settlement.payer_id, settlement.receiver_id, settlement.amount)
+    return deltas
+
+
+def apply_pair_balance_deltas(deltas, sign=1):
+    """
+    Add the deltas to user_pair_balances (sign=-1 reverses them).
+    Each side is an upsert of `amount = amount + delta`, so concurrent writers
+    neither overwrite each other nor collide when both create a pair's first row.
+    """
+    now = datetime.utcnow()
+    rows = []
+    for (user_id, other_user_id), delta in deltas.items():
+        delta *= sign
+        if abs(delta) < 1e-9:
+            continue
+        rows.append({'user_id': user_id, 'other_user_id': other_user_id, 'amount': delta, 'updated_at': now})
+        rows.append({'user_id': other_user_id, 'other_user_id': user_id, 'amount': -delta, 'updated_at': now})
+    if not rows:
+        return
+
+    # Same lock order in every transaction, so two writers can't deadlock on a pair
+    rows.sort(key=lambda row: (row['user_id'], row['other_user_id']))
+
+    balances = UserPairBalance.__table__
+    dialect = db.session.connection().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql_insert if dialect == 'postgresql' else sqlite_insert
+        statement = insert(balances)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=[balances.c.user_id, balances.c.other_user_id],
+            set_={
+                'amount': balances.c.amount + statement.excluded.amount,
+                'updated_at': statement.excluded.updated_at
+            }
+        ), rows)
+        return
+
+    # Other databases: update, insert on the first write, and retry the update
+    # if a concurrent transaction created the row first
+    for row in rows:
+        update = balances.update().where(
+            balances.c.user_id == row['user_id'], balances.c.other_user_id == row['other_user_id']
+        ).values(amount=balances.c.amount + row['amount'], updated_at=now)
+        if db.session.execute(update).rowcount:
+            continue
+        try:
+            with db.session.begin_nested():
+                db.session.execute(balances.insert().values(**row))
+        except IntegrityError:
+            db.session.execute(update)
+
+
+def sync_expense_ledgers(expenses):
+    """
+    Rewrite every table derived from the given expenses (shares, participants
+    and the pair balances they feed).
+    This is the hook each expense write path calls before committing.
+    """
+    if not expenses:
+        return
+
+    db.session.flush()
+    expense_ids = [expense.id for expense in expenses]
+
+    # Swap the old contributions for the new ones in the pair balances
+    old_deltas = expense_pair_deltas(expense_ids)
+    sync_expense_shares(expenses)
+    new_deltas = expense_pair_deltas(expense_ids)
+
+    for pair, delta in old_deltas.items():
+        new_deltas[pair] = new_deltas.get(pair, 0.0) - delta
+    apply_pair_balance_deltas(new_deltas)
+
+    sync_expense_participants(expenses)
+
+
+def release_expense_ledgers(expense_ids):
+    """
+    Reverse the pair balance contributions of expenses that are about to be
+    deleted and drop their shares and participants.
+    """
+    expense_ids = list(expense_ids)
+    if not expense_ids:
+        return
+
+    # Bulk deletes skip the session events, so invalidate the participants' dashboards
+    # and the owners' budget periods here
+    for start in range(0, len(expense_ids), 500):
+        for user_id, day in db.session.query(Expense.user_id, Expense.date).filter(Expense.id.in_(expense_ids[start:start + 500])):
+            mark_budget_period_day(db.session, user_id, day)
+        bump_dashboard_versions(
+            user_id for (user_id,) in db.session.query(ExpenseParticipant.user_id).filter(
+                ExpenseParticipant.expense_id.in_(expense_ids[start:start + 500])
+            ).distinct()
+        )
+
+    apply_pair_balance_deltas(expense_pair_deltas(expense_ids), sign=-1)
+    delete_expense_rows(ExpenseShare, expense_ids)
+    delete_expense_rows(ExpenseParticipant, expense_ids)
+
+
+def compute_pair_balances_from_history(batch_size=1000):
+    """
+    Replay every expense and settlement to get the pair balances from scratch.
+    Works from calculate_splits() rather than expense_shares so it can check both.
+    """
+    deltas = {}
+    last_id = 0
+
+    while True:
+        expenses = Expense.query.filter(Expense.id > last_id).order_by(Expense.id).limit(batch_size).all()
+        if not expenses:
+            break
+
+        user_ids = set()
+        for expense in expenses:
+            user_ids.update(expense.get_split_user_ids())
+        users_by_id = get_users_by_ids(user_ids)
+
+        for expense in expenses:
+            if expense.paid_by not in users_by_id:
+                continue
+            splits = expense.calculate_splits(users_by_id)
+            for split in splits['splits']:
+                add_pair_delta(deltas, expense.paid_by, split['email'], split['amount'])
+
+        last_id = expenses[-1].id
+
+    for pair, delta in settlement_pair_deltas(Settlement.query.yield_per(1000)).items():
+        deltas[pair] = deltas.get(pair, 0.0) + delta
+
+    return deltas
+
+
+@app.cli.command('verify-pair-balances')
+@click.option('--rebuild', is_flag=True, help='Rewrite user_pair_balances from history instead of only reporting')
+def verify_pair_balances_command(rebuild):
+    """Compare user_pair_balances against a replay of all expenses and settlements"""
+    expected = compute_pair_balances_from_history()
+    stored = {
+        (row.user_id, row.other_user_id): row.amount
+        for row in UserPairBalance.query.all()
+        if row.user_id < row.other_user_id
+    }
+
+    mismatches = 0
+    for pair in set(expected) | set(stored):
+        if abs(expected.get(pair, 0.0) - stored.get(pair, 0.0)) > 0.01:
+            mismatches += 1
+            print(f"{pair[0]} / {pair[1]}: stored {stored.get(pair, 0.0):.2f}, expected {expected.get(pair, 0.0):.2f}")
+
+    print(f"{len(expected)} pairs checked, {mismatches} mismatched.")
+
+    if rebuild:
+        UserPairBalance.query.delete()
+        apply_pair_balance_deltas(expected)
+        db.session.commit()
+        print("user_pair_balances rebuilt from history.")
+
+
+def involved_expense_ids(user_id):
+    """Subquery of the ids of expenses the user owns or is split with"""
+    return db.session.query(ExpenseParticipant.expense_id).filter(ExpenseParticipant.user_id == user_id)
+
+
+def backfill_expense_rows(query, sync, label, batch_size=1000):
+    """Run `sync` over every row of `query` in id-ordered batches, committing after each one"""
+    last_id = 0
+    processed = 0
+
+    # Walk the expenses in id order so each batch is a cheap indexed range scan
+    while True:
+        batch = query.filter(Expense.id > last_id).order_by(Expense.id).limit(batch_size).all()
+        if not batch:
+            break
+
+        sync(batch)
+        db.session.commit()
+
+        last_id = batch[-1].id
+        processed += len(batch)
+        print(f"Backfilled {label} for {processed} expenses")
+
+    print(f"Done. {processed} expenses processed.")
+
+
+@app.cli.command('backfill-expense-shares')
+def backfill_expense_shares_command():
+    """Rebuild the expense_shares rows of every existing expense"""
+    backfill_expense_rows(Expense.query, sync_expense_shares, 'shares')
+
+
+@app.cli.command('backfill-expense-participants')
+def backfill_expense_participants_command():
+    """Rebuild the expense_participants rows of every existing expense"""
+    # Participants only need three columns, so skip loading full Expense objects
+    backfill_expense_rows(
+        db.session.query(Expense.id, Expense.user_id, Expense.split_with),
+        sync_expense_participants,
+        'participants',
+        batch_size=5000
+    )
+
+
 class RecurringExpense(db.Model):
     __tablename__ = 'recurring_expenses'
     id = db.Column(db.Integer, primary_key=True)
@@ -681,6 +1244,109 @@ class CategoryMapping(db.Model):
         return f"<CategoryMapping: '{self.keyword}' → {self.category.name}>"
 
 
+def load_category_rules(user_id):
+    """The user's active category mappings as MappingRules"""
+    rows = db.session.query(
+        CategoryMapping.id, CategoryMapping.keyword, CategoryMapping.category_id,
+        CategoryMapping.is_regex, CategoryMapping.priority, CategoryMapping.match_count
+    ).filter_by(
+        user_id=user_id,
+        active=True
+    ).order_by(CategoryMapping.priority.desc(), CategoryMapping.match_count.desc(), CategoryMapping.id).all()
+    return [MappingRule(*row) for row in rows]
+
+
+def load_category_rules_version(user_id):
+    return db.session.query(User.category_rules_version).filter_by(id=user_id).scalar() or 0
+
+
+def load_category_matcher_version(user_id):
+    """
+    (rules version, total matches) of a user's mappings; match counts only ever
+    grow, so the total moves whenever any worker commits new matches
+    """
+    total_matches = db.session.query(func.coalesce(func.sum(CategoryMapping.match_count), 0)).filter(
+        CategoryMapping.user_id == user_id
+    ).scalar_subquery()
+    version, matches = db.session.query(User.category_rules_version, total_matches).filter(User.id == user_id).first() or (0, 0)
+    return version or 0, matches
+
+
+category_matchers = CategoryMatcherCache(
+    load_category_rules,
+    load_category_matcher_version,
+    check_interval=app.config['CATEGORY_MATCHER_CHECK_SECONDS']
+)
+
+
+def load_category_history(user_id):
+    """(description, category_id) of the user's categorized transactions, to train their classifier on"""
+    return db.session.query(Expense.description, Expense.category_id).filter(
+        Expense.user_id == user_id,
+        Expense.category_id.isnot(None)
+    ).yield_per(5000)
+
+
+# Deleting a category bumps the rules version too, so models never suggest one that is gone
+category_classifiers = CategoryClassifierCache(
+    load_category_history,
+    load_category_rules_version,
+    check_interval=app.config['CATEGORY_MATCHER_CHECK_SECONDS'],
+    max_age=app.config['CATEGORY_CLASSIFIER_MAX_AGE_SECONDS']
+)
+
+
+def bump_category_rules_versions(user_ids, connection=None):
+    """Make every worker recompile the category mappings of the given users"""
+    user_ids = [user_id for user_id in set(user_ids) if user_id]
+    if not user_ids:
+        return
+    users = User.__table__
+    (connection or db.session.connection()).execute(
+        users.update().where(users.c.id.in_(user_ids)).values(category_rules_version=users.c.category_rules_version + 1)
+    )
+    # This worker needn't wait for the check interval
+    db.session.info.setdefault('category_rules_user_ids', set()).update(user_ids)
+
+
+
+class CategorizationJob(db.Model):
+    """Progress of a background bulk categorization run (see run_bulk_categorization)"""
+    __tablename__ = 'categorization_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(120), db.ForeignKey('users.id'), nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    total = db.Column(db.Integer, default=0)  # Uncategorized transactions when the run started
+    processed = db.Column(db.Integer, default=0)
+    categorized = db.Column(db.Integer, default=0)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def is_active(self):
+        """Queued or running, and not abandoned by a worker that went away"""
+        stale_before = datetime.utcnow() - timedelta(seconds=app.config['BULK_CATEGORIZE_STALE_SECONDS'])
+        return self.status in ('queued', 'running') and (self.updated_at or self.created_at) > stale_before
+
+    def get_progress_percentage(self):
+        if self.status == 'done':
+            return 100
+        return min(100, int(self.processed / self.total * 100)) if self.total else 0
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'total': self.total,
+            'processed': self.processed,
+            'categorized': self.categorized,
+            'percentage': self.get_progress_percentage(),
+            'error': self.error,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
 
 # Tag-Expense Association Table
 
@@ -773,7 +1439,11 @@ class Budget(db.Model):
     
     def get_current_period_dates(self):
         """Get start and end dates for the current budget period"""
-        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        return self.get_period_dates(datetime.utcnow())
+    
+    def get_period_dates(self, day):
+        """Get start and end dates for the budget period containing `day`"""
+        today = day.replace(hour=0, minute=0, second=0, microsecond=0)
         
         if self.period == 'weekly':
             # Start of the week (Monday)
@@ -804,120 +1474,206 @@ class Budget(db.Model):
     def calculate_spent_amount(self):
         """Calculate how much has been spent in this budget's category during the current period"""
         start_date, end_date = self.get_current_period_dates()
+        key = budget_result_key(self, start_date, end_date)
+
+        results = budget_results()
+        if key not in results:
+            evaluate_budgets([self])
+        return results[key]
+    
+    def get_remaining_amount(self):
+        """Calculate remaining budget amount"""
+        return self.amount - self.calculate_spent_amount()
+    
+    def get_progress_percentage(self):
+            spent = self.calculate_spent_amount()
+            if self.amount <= 0:
+                return 100  # Avoid division by zero
+            percentage = (spent / self.amount) * 100
+            return min(percentage, 100)  # Cap at 100%
         
-        # Base query: find all expenses in the relevant date range for this user
-        from sqlalchemy import or_
-        
-        if self.include_subcategories:
-            # If this is a parent category, include subcategories
-            subcategories = Category.query.filter_by(parent_id=self.category_id).all()
-            subcategory_ids = [subcat.id for subcat in subcategories]
-            
-            # Include the parent category itself and all subcategories
-            category_filter = or_(
-                Expense.category_id == self.category_id,
-                Expense.category_id.in_(subcategory_ids) if subcategory_ids else False
-            )
+    def get_status(self):
+        """Return the budget status: 'under', 'approaching', 'over'"""
+        percentage = self.get_progress_percentage()
+        if percentage >= 100:
+            return 'over'
+        elif percentage >= 80:
+            return 'approaching'
         else:
-            # Only include this specific category
-            category_filter = (Expense.category_id == self.category_id)
-        
-        # Get all expenses that match our criteria
-        expenses = Expense.query.filter(
-            Expense.user_id == self.user_id,
-            Expense.date >= start_date,
-            Expense.date <= end_date,
-            category_filter
-        ).all()
-        
-        # Calculate the total spent for these expenses
-        total_spent = 0.0
-        
-        # Process each expense to calculate the user's portion
-        for expense in expenses:
-            # If the expense has category splits, we need a different approach
-            if expense.has_category_splits:
-                # Handle category splits separately
-                continue
-                
-            # Get the split information for this expense
-            splits = expense.calculate_splits()
+            return 'under'
             
-            # If the user is the payer and not in the splits, add their portion
-            if expense.paid_by == self.user_id and (not expense.split_with or self.user_id not in expense.split_with.split(',')):
-                total_spent += splits['payer']['amount']
+
+
+
+class BudgetPeriodTotal(db.Model):
+    """
+    Materialized spending of a budget in one of its periods
+    The current period's row is kept up to date as expenses are written; rows of
+    earlier periods stay behind as the record of how each closed period ended.
+    """
+    __tablename__ = 'budget_period_totals'
+    budget_id = db.Column(db.Integer, db.ForeignKey('budgets.id'), primary_key=True)
+    period_start = db.Column(db.DateTime, primary_key=True)
+    period_end = db.Column(db.DateTime, nullable=False)
+    spent = db.Column(db.Float, nullable=False, default=0.0)  # In the base currency
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+def budget_results():
+    """Spent amounts worked out during this request, keyed by budget_result_key()"""
+    if 'budget_spent' not in g:
+        g.budget_spent = {}
+    return g.budget_spent
+
+
+def forget_budget_results():
+    """Drop this request's spent amounts and budget lookups, e.g. after expenses changed"""
+    if has_app_context():
+        g.pop('budget_spent', None)
+        g.pop('active_budgets_by_category', None)
+
+
+def budget_result_key(budget, start_date, end_date):
+    # Everything the spent amount depends on, so an edited budget is never read stale
+    return (budget.id, budget.user_id, budget.category_id, bool(budget.include_subcategories), start_date, end_date)
+
+
+def compute_budget_spent(windows):
+    """
+    Work out from the expenses what budgets spent in given periods
+    Windows are grouped by user and period, and each group costs one grouped query
+    over expenses without category splits and one over category splits, however
+    many budgets it holds.
+
+    Args:
+        windows: Iterable of (budget, period_start, period_end)
+
+    Returns:
+        {(budget_id, period_start): spent}
+    """
+    groups = {}
+    for budget, start_date, end_date in windows:
+        groups.setdefault((budget.user_id, start_date, end_date), []).append(budget)
+
+    spent = {}
+    if not groups:
+        return spent
+
+    # Descendants of every budget category that includes them, in one query
+    subtree_ids = category_descendant_ids(
+        {budget.category_id for group in groups.values() for budget in group if budget.include_subcategories}
+    )
+
+    for (user_id, start_date, end_date), group in groups.items():
+        category_ids = {}
+        for budget in group:
+            if budget.include_subcategories:
+                category_ids[budget.id] = subtree_ids[budget.category_id] or [budget.category_id]
             else:
-                # Check if the current user is in the splits
-                for split in splits['splits']:
-                    if split['email'] == self.user_id:
-                        total_spent += split['amount']
-                        break
-        
-        # Handle expenses with category splits
-        if self.include_subcategories:
-            category_ids = [self.category_id] + [subcat.id for subcat in subcategories]
-        else:
-            category_ids = [self.category_id]
-        
-        # Find all category splits for relevant categories
-        category_splits = CategorySplit.query.join(
+                category_ids[budget.id] = [budget.category_id]
+        all_category_ids = {category_id for ids in category_ids.values() for category_id in ids}
+
+        # The user's share of every matching expense without category splits
+        spent_by_category = {}
+        direct_rows = db.session.query(
+            Expense.category_id, func.sum(in_base_currency(ExpenseShare.amount))
+        ).select_from(ExpenseShare).join(
+            Expense, ExpenseShare.expense_id == Expense.id
+        ).filter(
+            ExpenseShare.user_id == user_id,
+            Expense.user_id == user_id,
+            Expense.date >= start_date,
+            Expense.date <= end_date,
+            Expense.category_id.in_(all_category_ids),
+            or_(Expense.has_category_splits.is_(None), Expense.has_category_splits == False)
+        ).group_by(Expense.category_id)
+
+        # The user's part of a category split is the split amount scaled by their share of the expense
+        split_rows = db.session.query(
+            CategorySplit.category_id,
+            func.sum(in_base_currency(CategorySplit.amount * ExpenseShare.amount / Expense.amount))
+        ).select_from(CategorySplit).join(
             Expense, CategorySplit.expense_id == Expense.id
+        ).join(
+            ExpenseShare, ExpenseShare.expense_id == Expense.id
         ).filter(
-            Expense.user_id == self.user_id,
+            ExpenseShare.user_id == user_id,
+            Expense.user_id == user_id,
             Expense.date >= start_date,
             Expense.date <= end_date,
-            CategorySplit.category_id.in_(category_ids)
-        ).all()
-        
-        # Process each category split
-        for cat_split in category_splits:
-            expense = Expense.query.get(cat_split.expense_id)
-            if not expense:
-                continue
-                
-            # Get the split information for this expense
-            splits = expense.calculate_splits()
-            
-            # Calculate the user's share of this category split
-            if expense.paid_by == self.user_id and (not expense.split_with or self.user_id not in expense.split_with.split(',')):
-                # User is the payer and not in splits - add their portion
-                if expense.amount > 0:
-                    user_ratio = splits['payer']['amount'] / expense.amount
-                    total_spent += cat_split.amount * user_ratio
-            else:
-                # Check if the user is in the splits
-                for split in splits['splits']:
-                    if split['email'] == self.user_id:
-                        if expense.amount > 0:
-                            user_ratio = split['amount'] / expense.amount
-                            total_spent += cat_split.amount * user_ratio
-                        break
-        
-        return total_spent
-    
-    def get_remaining_amount(self):
-        """Calculate remaining budget amount"""
-        return self.amount - self.calculate_spent_amount()
-    
-    def get_progress_percentage(self):
-            spent = self.calculate_spent_amount()
-            if self.amount <= 0:
-                return 100  # Avoid division by zero
-            percentage = (spent / self.amount) * 100
-            return min(percentage, 100)  # Cap at 100%
-        
-    def get_status(self):
-        """Return the budget status: 'under', 'approaching', 'over'"""
-        percentage = self.get_progress_percentage()
-        if percentage >= 100:
-            return 'over'
-        elif percentage >= 80:
-            return 'approaching'
-        else:
-            return 'under'
-            
+            Expense.amount > 0,
+            CategorySplit.category_id.in_(all_category_ids)
+        ).group_by(CategorySplit.category_id)
+
+        for category_id, amount in list(direct_rows) + list(split_rows):
+            spent_by_category[category_id] = spent_by_category.get(category_id, 0.0) + (amount or 0.0)
+
+        for budget_id, ids in category_ids.items():
+            spent[(budget_id, start_date)] = sum(spent_by_category.get(category_id, 0.0) for category_id in ids)
+
+    return spent
+
+
+def budget_period_spent(budgets, day=None):
+    """
+    Spent of each budget in its period containing `day` (default: the current period)
+    Read from budget_period_totals; only periods without an up-to-date row are
+    worked out from the expenses.
+
+    Returns:
+        {budget_id: spent}
+    """
+    windows = {}
+    for budget in budgets:
+        start_date, end_date = budget.get_period_dates(day) if day else budget.get_current_period_dates()
+        windows[budget.id] = (budget, start_date, end_date)
+    if not windows:
+        return {}
+
+    stored = {
+        (row.budget_id, row.period_start): row.spent
+        for row in db.session.query(BudgetPeriodTotal.budget_id, BudgetPeriodTotal.period_start, BudgetPeriodTotal.spent).filter(
+            BudgetPeriodTotal.budget_id.in_(windows),
+            BudgetPeriodTotal.period_start.in_({start_date for _, start_date, _ in windows.values()})
+        )
+    }
+
+    # Rows of users with changes waiting for the commit are not up to date yet
+    pending_user_ids = set(db.session.info.get('budget_period_days', {}))
+    pending_user_ids |= db.session.info.get('budget_refresh_user_ids', set())
+    if db.session.info.get('budget_refresh_all'):
+        stored = {}
+
+    missing = [
+        window for budget_id, window in windows.items()
+        if (budget_id, window[1]) not in stored or window[0].user_id in pending_user_ids
+    ]
+    stored.update(compute_budget_spent(missing))
+
+    return {budget_id: stored[(budget_id, start_date)] for budget_id, (_, start_date, _) in windows.items()}
 
 
+def evaluate_budgets(budgets):
+    """
+    Get the current spent amount of many budgets at once
+    The results go into the per-request cache that calculate_spent_amount() and
+    the methods built on it read.
+
+    Returns:
+        {budget_id: spent}
+    """
+    results = budget_results()
+    keys = {}
+    for budget in budgets:
+        start_date, end_date = budget.get_current_period_dates()
+        keys[budget.id] = budget_result_key(budget, start_date, end_date)
+
+    pending = [budget for budget in budgets if keys[budget.id] not in results]
+    for budget_id, spent in budget_period_spent(pending).items():
+        results[keys[budget_id]] = spent
+
+    return {budget.id: results[keys[budget.id]] for budget in budgets}
+
 
 class Portfolio(db.Model):
     __tablename__ = 'portfolios'
@@ -928,6 +1684,7 @@ class Portfolio(db.Model):
     account_id = db.Column(db.Integer, db.ForeignKey('accounts.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    account_sync_pending = db.Column(db.Boolean, nullable=False, default=False, server_default='0')  # Linked account balance is out of date
     
     # Relationships
     user = db.relationship('User', backref=db.backref('portfolios', lazy=True))
@@ -1047,6 +1804,780 @@ class UserApiSettings(db.Model):
         return base64.b64decode(self.fmp_api_key.encode()).decode()
 
 
+class DashboardCacheEntry(db.Model):
+    """Shared storage for the 'database' dashboard cache backend"""
+    __tablename__ = 'dashboard_cache_entries'
+    cache_key = db.Column(db.String(255), primary_key=True)
+    user_id = db.Column(db.String(120), nullable=False, index=True)
+    payload = db.Column(db.Text, nullable=False)  # JSON dashboard summary
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+dashboard_cache = create_dashboard_cache(
+    app.config['DASHBOARD_CACHE_BACKEND'],
+    get_engine=lambda: db.engine,
+    table=DashboardCacheEntry.__table__,
+    max_entries=app.config['DASHBOARD_CACHE_SIZE']
+)
+
+# User fields that show up in the user's own dashboard
+DASHBOARD_USER_FIELDS = ('name', 'user_color', 'default_currency_code')
+
+
+def bump_dashboard_versions(user_ids, connection=None):
+    """
+    Invalidate the cached dashboards of the given users (None means every user)
+    by bumping their data version.
+    """
+    users = User.__table__
+    statement = users.update().values(dashboard_version=users.c.dashboard_version + 1)
+
+    if user_ids is not None:
+        user_ids = [user_id for user_id in set(user_ids) if user_id]
+        if not user_ids:
+            return
+        statement = statement.where(users.c.id.in_(user_ids))
+
+    (connection or db.session.connection()).execute(statement)
+    # Budget spending read earlier in this request may no longer hold
+    forget_budget_results()
+
+
+def dashboard_user_ids(obj):
+    """
+    Users whose dashboard depends on a changed row.
+    Returns None when every user is affected and an empty set for rows the
+    dashboard doesn't read.
+    """
+    if isinstance(obj, Expense):
+        user_ids = {obj.user_id, obj.paid_by}
+        # Include users the expense was split with before this change too
+        history = inspect(obj).attrs.split_with.history
+        for split_with in (history.added or []) + (history.unchanged or []) + (history.deleted or []):
+            if split_with:
+                user_ids.update(user_id.strip() for user_id in split_with.split(','))
+        return user_ids
+    if isinstance(obj, CategorySplit):
+        return dashboard_user_ids(obj.expense) if obj.expense else set()
+    if isinstance(obj, Settlement):
+        return {obj.payer_id, obj.receiver_id}
+    if isinstance(obj, (Budget, Account, Portfolio, Category)):
+        return {obj.user_id}
+    if isinstance(obj, Investment):
+        return {obj.portfolio.user_id} if obj.portfolio else set()
+    if isinstance(obj, InvestmentTransaction):
+        return dashboard_user_ids(obj.investment) if obj.investment else set()
+    if isinstance(obj, Currency):
+        return None
+    if isinstance(obj, User):
+        state = inspect(obj)
+        if any(state.attrs[field].history.has_changes() for field in DASHBOARD_USER_FIELDS):
+            return {obj.id}
+    return set()
+
+
+@event.listens_for(db.session, 'before_flush')
+def collect_dashboard_changes(session, flush_context, instances):
+    """Remember which users' dashboards the pending changes touch"""
+    changed = list(session.new) + list(session.deleted) + [
+        obj for obj in session.dirty if session.is_modified(obj, include_collections=False)
+    ]
+
+    user_ids = session.info.setdefault('dashboard_user_ids', set())
+    for obj in changed:
+        affected = dashboard_user_ids(obj)
+        if affected is None:
+            session.info['dashboard_all_users'] = True
+        else:
+            user_ids.update(affected)
+
+
+@event.listens_for(db.session, 'after_flush')
+def bump_changed_dashboards(session, flush_context):
+    """Bump the data version of every user collected in collect_dashboard_changes()"""
+    user_ids = session.info.pop('dashboard_user_ids', None)
+    if session.info.pop('dashboard_all_users', False):
+        bump_dashboard_versions(None, connection=session.connection())
+    elif user_ids:
+        bump_dashboard_versions(user_ids, connection=session.connection())
+
+
+# CategoryMapping fields that change how transactions get categorized
+CATEGORY_RULE_FIELDS = ('user_id', 'keyword', 'category_id', 'is_regex', 'priority', 'active')
+
+
+@event.listens_for(db.session, 'before_flush')
+def collect_category_rule_changes(session, flush_context, instances):
+    """Remember whose category mappings the pending changes touch"""
+    for obj in list(session.new) + list(session.deleted) + list(session.dirty):
+        if not isinstance(obj, CategoryMapping):
+            continue
+        state = inspect(obj)
+        if obj in session.dirty and not any(state.attrs[field].history.has_changes() for field in CATEGORY_RULE_FIELDS):
+            if state.attrs.match_count.history.has_changes():
+                # Scores changed, the rules didn't: refresh the matcher but keep the classifier
+                session.info.setdefault('category_match_user_ids', set()).update(attribute_values(state, 'user_id'))
+            continue
+        session.info.setdefault('category_rules_flush', set()).update(attribute_values(state, 'user_id'))
+
+
+@event.listens_for(db.session, 'after_flush')
+def bump_changed_category_rules(session, flush_context):
+    user_ids = session.info.pop('category_rules_flush', None)
+    if user_ids:
+        bump_category_rules_versions(user_ids, connection=session.connection())
+
+
+@event.listens_for(db.session, 'after_commit')
+def refresh_category_matchers(session):
+    for user_id in session.info.pop('category_rules_user_ids', ()):
+        category_matchers.invalidate(user_id)
+        category_classifiers.invalidate(user_id)
+    for user_id in session.info.pop('category_match_user_ids', ()):
+        category_matchers.invalidate(user_id)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_category_rule_changes(session):
+    session.info.pop('category_rules_flush', None)
+    session.info.pop('category_rules_user_ids', None)
+    session.info.pop('category_match_user_ids', None)
+    session.info.pop('category_match_counts', None)
+    session.info.pop('category_training', None)
+
+
+def record_category_match(user_id, mapping_id, matches=1, session=None):
+    """Count successful matches for a mapping; written with the session's next commit"""
+    counts = (session or db.session).info.setdefault('category_match_counts', {}).setdefault(user_id, {})
+    counts[mapping_id] = counts.get(mapping_id, 0) + matches
+
+
+def pending_category_matches(user_id, session=None):
+    """{mapping_id: matches} recorded for a user but not written yet, for CategoryMatcher.best_match()"""
+    return (session or db.session).info.get('category_match_counts', {}).get(user_id)
+
+
+def write_category_match_counts(counts, connection):
+    """
+    Add {user_id: {mapping_id: matches}} to match_count, one UPDATE ... SET
+    match_count = match_count + n per mapping
+    """
+    params = [
+        {'mapping_id': mapping_id, 'matches': matches}
+        for user_counts in counts.values() for mapping_id, matches in user_counts.items()
+    ]
+    if not params:
+        return
+    mappings = CategoryMapping.__table__
+    connection.execute(
+        mappings.update()
+        .where(mappings.c.id == bindparam('mapping_id'))
+        .values(match_count=func.coalesce(mappings.c.match_count, 0) + bindparam('matches')),
+        params
+    )
+
+
+@event.listens_for(db.session, 'before_commit')
+def flush_category_match_counts(session):
+    """Write the matches counted by record_category_match() as part of the committing transaction"""
+    counts = session.info.pop('category_match_counts', None)
+    if counts:
+        write_category_match_counts(counts, session.connection())
+        # Matchers built before the commit score with the old counts
+        session.info.setdefault('category_match_user_ids', set()).update(counts)
+
+
+@app.after_request
+def save_category_match_counts(response):
+    """Keep the matches of a request that categorized transactions without committing"""
+    counts = db.session.info.pop('category_match_counts', None) if db.session.registry.has() else None
+    if counts:
+        try:
+            # Own transaction, so whatever the request left pending is never committed here
+            with db.engine.begin() as connection:
+                write_category_match_counts(counts, connection)
+            for user_id in counts:
+                category_matchers.invalidate(user_id)
+        except Exception as e:
+            app.logger.warning(f"Could not save category match counts: {str(e)}")
+    return response
+
+
+# Expense fields the category classifiers learn from
+CATEGORY_TRAINING_FIELDS = ('user_id', 'description', 'category_id')
+
+
+def previous_training_values(session, obj):
+    """(user_id, description, category_id) of an expense as it was before this flush"""
+    state = inspect(obj)
+    values = []
+    for field in CATEGORY_TRAINING_FIELDS:
+        history = state.attrs[field].history
+        if history.deleted or history.unchanged:
+            values.append((history.deleted or history.unchanged)[0])
+        elif not history.added:
+            values.append(getattr(obj, field))
+        else:
+            # Set while expired, so the old value was never loaded; the row still has it
+            expenses = Expense.__table__
+            return tuple(session.connection().execute(
+                select(*(expenses.c[name] for name in CATEGORY_TRAINING_FIELDS)).where(expenses.c.id == obj.id)
+            ).first() or (None, None, None))
+    return tuple(values)
+
+
+@event.listens_for(db.session, 'before_flush')
+def collect_category_training(session, flush_context, instances):
+    """Remember categorized transactions the pending changes add, move or remove, for the classifiers"""
+    changes = session.info.setdefault('category_training', [])
+    for obj in list(session.new) + list(session.deleted) + list(session.dirty):
+        if not isinstance(obj, Expense):
+            continue
+        if obj in session.new:
+            changes.append((obj.user_id, obj.description, obj.category_id, 1))
+        elif obj in session.deleted:
+            changes.append((obj.user_id, obj.description, obj.category_id, -1))
+        else:
+            state = inspect(obj)
+            if not any(state.attrs[field].history.has_changes() for field in CATEGORY_TRAINING_FIELDS):
+                continue
+            changes.append(previous_training_values(session, obj) + (-1,))
+            changes.append((obj.user_id, obj.description, obj.category_id, 1))
+
+
+@event.listens_for(db.session, 'after_commit')
+def train_category_classifiers(session):
+    """Teach this worker's models what was just categorized (or recategorized)"""
+    changes_by_user = {}
+    for user_id, description, category_id, weight in session.info.pop('category_training', ()):
+        if category_id is not None:
+            changes_by_user.setdefault(user_id, []).append((description, category_id, weight))
+    for user_id, changes in changes_by_user.items():
+        category_classifiers.learn(user_id, changes)
+
+
+def predict_category(description, user_id):
+    """
+    Category a user's history suggests for a description no mapping matches.
+    Returns None until the user has enough categorized transactions, or when
+    the model isn't confident enough.
+    """
+    if not description or not app.config['CATEGORY_CLASSIFIER_ENABLED']:
+        return None
+
+    model = category_classifiers.get(user_id)
+    if model.documents < app.config['CATEGORY_CLASSIFIER_MIN_HISTORY']:
+        return None
+
+    prediction = model.predict(tokenize(description))
+    if prediction is None or prediction[1] < app.config['CATEGORY_CLASSIFIER_MIN_CONFIDENCE']:
+        return None
+    return prediction[0]
+
+
+# Investment fields that change what a portfolio is worth
+PORTFOLIO_VALUE_FIELDS = ('shares', 'current_price', 'portfolio_id')
+
+
+@event.listens_for(db.session, 'before_flush')
+def flag_portfolio_account_changes(session, flush_context, instances):
+    """Flag portfolios whose value or account link changed so their account gets re-synced"""
+    portfolio_ids = set()
+
+    for obj in list(session.new) + list(session.deleted) + list(session.dirty):
+        if isinstance(obj, Investment):
+            state = inspect(obj)
+            if obj in session.dirty and not any(state.attrs[field].history.has_changes() for field in PORTFOLIO_VALUE_FIELDS):
+                continue
+            # An investment moved between portfolios changes both of them
+            portfolio_ids.update(state.attrs.portfolio_id.history.deleted or [])
+            portfolio_ids.add(obj.portfolio.id if obj.portfolio else obj.portfolio_id)
+        elif isinstance(obj, Portfolio):
+            if obj in session.new or inspect(obj).attrs.account_id.history.has_changes():
+                obj.account_sync_pending = bool(obj.account_id)
+                if obj.account_id:
+                    session.info['investment_account_sync'] = True
+
+    for portfolio_id in portfolio_ids:
+        portfolio = session.get(Portfolio, portfolio_id) if portfolio_id else None
+        if portfolio is not None and portfolio.account_id and portfolio not in session.deleted:
+            portfolio.account_sync_pending = True
+            # Always written, even if already flagged, so a sync in progress sees the change
+            portfolio.updated_at = datetime.utcnow()
+            session.info['investment_account_sync'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def start_portfolio_account_sync(session):
+    """Queue the background account sync once the flagged changes are committed"""
+    if session.info.pop('investment_account_sync', False):
+        queue_investment_account_sync()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_portfolio_account_sync(session):
+    session.info.pop('investment_account_sync', None)
+
+
+class CurrencyTableVersion(db.Model):
+    """Single-row version stamp of the currencies table, shared by every worker"""
+    __tablename__ = 'currency_table_version'
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+def load_currency_rates():
+    """All currency rates and the base currency code, for the rate table"""
+    rows = db.session.query(Currency.code, Currency.rate_to_base, Currency.is_base).all()
+    base_code = next((code for code, _, is_base in rows if is_base), None)
+    return {code: rate_to_base for code, rate_to_base, _ in rows}, base_code
+
+
+def load_currency_table_version():
+    version = db.session.query(CurrencyTableVersion.version).filter_by(id=1).scalar()
+    return version or 0
+
+
+def load_currency_rate_history():
+    """Every stored historical rate, sorted for the as-of index"""
+    return db.session.query(CurrencyRate.code, CurrencyRate.date, CurrencyRate.rate_to_base).order_by(
+        CurrencyRate.code, CurrencyRate.date
+    ).all()
+
+
+currency_table = CurrencyRateTable(
+    load_currency_rates,
+    load_currency_table_version,
+    load_history=load_currency_rate_history,
+    check_interval=app.config['CURRENCY_TABLE_CHECK_SECONDS']
+)
+
+
+def bump_currency_table_version(connection):
+    """Bump the shared stamp so every worker reloads its rates"""
+    versions = CurrencyTableVersion.__table__
+    bumped = connection.execute(versions.update().where(versions.c.id == 1).values(
+        version=versions.c.version + 1,
+        updated_at=datetime.utcnow()
+    )).rowcount
+    if not bumped:
+        connection.execute(versions.insert().values(id=1, version=1, updated_at=datetime.utcnow()))
+
+
+@event.listens_for(db.session, 'before_flush')
+def collect_currency_changes(session, flush_context, instances):
+    """Note whether the pending changes touch the currencies or their rate history"""
+    if any(isinstance(obj, (Currency, CurrencyRate)) for obj in list(session.new) + list(session.deleted) + list(session.dirty)):
+        session.info['currency_table_flush'] = True
+
+
+@event.listens_for(db.session, 'after_flush')
+def bump_changed_currency_table(session, flush_context):
+    if not session.info.pop('currency_table_flush', False):
+        return
+    session.info['currency_table_changed'] = True
+    bump_currency_table_version(session.connection())
+
+
+@event.listens_for(db.session, 'after_commit')
+def refresh_currency_table(session):
+    """This worker reloads its rates right away; others notice the new version"""
+    if session.info.pop('currency_table_changed', False):
+        currency_table.invalidate()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_currency_table_change(session):
+    session.info.pop('currency_table_flush', None)
+    session.info.pop('currency_table_changed', None)
+
+
+# Expense fields that amount_base is derived from
+AMOUNT_BASE_FIELDS = ('amount', 'currency_code', 'date')
+
+
+@event.listens_for(db.session, 'before_flush')
+def set_expense_amount_base(session, flush_context, instances):
+    """Keep amount_base in step with the amount, currency and date of every written expense"""
+    base_code = None
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, Expense):
+            continue
+        if obj not in session.new:
+            state = inspect(obj)
+            if not any(state.attrs[field].history.has_changes() for field in AMOUNT_BASE_FIELDS):
+                continue
+
+        base_code = base_code or currency_table.base_currency_code()
+        obj.amount_base = convert_currency(obj.amount, obj.currency_code, base_code, on_date=obj.date)
+
+
+def update_amount_base_rows(rows):
+    """Recompute amount_base for (id, amount, currency_code, date) rows in one bulk update"""
+    base_code = currency_table.base_currency_code()
+    db.session.bulk_update_mappings(Expense, [
+        {'id': row.id, 'amount_base': convert_currency(row.amount, row.currency_code, base_code, on_date=row.date)}
+        for row in rows
+    ])
+
+
+def recompute_amount_base(batch_size=5000):
+    """Recompute amount_base of every expense, e.g. after the base currency changed"""
+    backfill_expense_rows(
+        db.session.query(Expense.id, Expense.amount, Expense.currency_code, Expense.date),
+        update_amount_base_rows,
+        'amount_base',
+        batch_size=batch_size
+    )
+
+    # Bulk updates skip the session events, so refresh every dashboard and budget total
+    bump_dashboard_versions(None)
+    queue_budget_total_refresh(None)
+    db.session.commit()
+
+
+def recompute_amount_base_job():
+    """Background job run after the base currency changes"""
+    with app.app_context():
+        try:
+            recompute_amount_base()
+            app.logger.info("Recomputed amount_base for the new base currency")
+        except Exception as e:
+            app.logger.error(f"Error recomputing amount_base: {str(e)}")
+            db.session.rollback()
+
+
+def queue_amount_base_recompute():
+    """Run recompute_amount_base_job() in the scheduler as soon as possible"""
+    try:
+        scheduler.add_job(
+            id=AMOUNT_BASE_RECOMPUTE_JOB_ID,
+            func=recompute_amount_base_job,
+            trigger='date',
+            replace_existing=True
+        )
+    except Exception as e:
+        app.logger.error(f"Error queueing amount_base recompute: {str(e)}")
+
+
+@app.cli.command('backfill-amount-base')
+@click.option('--batch-size', default=5000, help='Expenses updated per transaction')
+def backfill_amount_base_command(batch_size):
+    """Fill expenses.amount_base from the rate in force on each expense's date"""
+    recompute_amount_base(batch_size=batch_size)
+
+
+def build_category_closure_rows(categories):
+    """
+    category_closure rows for (id, parent_id) pairs of whole category trees.
+    A parent outside the given categories ends the walk up, and so does a cycle.
+    """
+    parents = dict(categories)
+    rows = []
+    for category_id in parents:
+        ancestor_id, depth, seen = category_id, 0, set()
+        while ancestor_id in parents and ancestor_id not in seen:
+            seen.add(ancestor_id)
+            rows.append({'ancestor_id': ancestor_id, 'descendant_id': category_id, 'depth': depth})
+            ancestor_id = parents[ancestor_id]
+            depth += 1
+    return rows
+
+
+def rebuild_category_closure(user_ids, connection=None):
+    """Rewrite the category_closure rows of the given users' categories (None means every user)"""
+    connection = connection or db.session.connection()
+    categories = Category.__table__
+    closure = CategoryClosure.__table__
+
+    category_ids = select(categories.c.id)
+    if user_ids is not None:
+        user_ids = [user_id for user_id in set(user_ids) if user_id]
+        if not user_ids:
+            return
+        category_ids = category_ids.where(categories.c.user_id.in_(user_ids))
+
+    rows = build_category_closure_rows(
+        connection.execute(select(categories.c.id, categories.c.parent_id).where(categories.c.id.in_(category_ids))).fetchall()
+    )
+    connection.execute(closure.delete().where(closure.c.descendant_id.in_(category_ids)))
+    if rows:
+        connection.execute(closure.insert(), rows)
+
+
+@event.listens_for(db.session, 'before_flush')
+def collect_category_tree_changes(session, flush_context, instances):
+    """Note whose category tree the pending changes reshape, and drop the closure rows of deleted categories"""
+    deleted_ids = []
+    for obj in list(session.new) + list(session.deleted) + list(session.dirty):
+        if not isinstance(obj, Category):
+            continue
+        if obj in session.dirty and not inspect(obj).attrs.parent_id.history.has_changes():
+            continue
+        session.info.setdefault('category_tree_user_ids', set()).add(obj.user_id)
+        if obj in session.deleted and obj.id is not None:
+            deleted_ids.append(obj.id)
+
+    # Before the categories themselves go, so the foreign keys never dangle
+    if deleted_ids:
+        closure = CategoryClosure.__table__
+        session.connection().execute(closure.delete().where(
+            or_(closure.c.ancestor_id.in_(deleted_ids), closure.c.descendant_id.in_(deleted_ids))
+        ))
+
+
+@event.listens_for(db.session, 'after_flush')
+def rebuild_changed_category_closures(session, flush_context):
+    user_ids = session.info.pop('category_tree_user_ids', None)
+    if user_ids:
+        rebuild_category_closure(user_ids, connection=session.connection())
+
+
+def delete_category_closure(user_id):
+    """Drop the closure rows of a user's categories, ahead of bulk deleting the categories"""
+    CategoryClosure.query.filter(
+        CategoryClosure.descendant_id.in_(db.session.query(Category.id).filter_by(user_id=user_id))
+    ).delete(synchronize_session=False)
+
+
+def category_subtree(category_id):
+    """Subquery of the ids of a category and all its descendants, for `column.in_(...)` filters"""
+    return db.session.query(CategoryClosure.descendant_id).filter(CategoryClosure.ancestor_id == category_id)
+
+
+def category_descendant_ids(category_ids):
+    """{category_id: [its own id and the ids of all its descendants]}, in one query"""
+    descendants = {category_id: [] for category_id in category_ids}
+    if descendants:
+        for ancestor_id, descendant_id in db.session.query(CategoryClosure.ancestor_id, CategoryClosure.descendant_id).filter(
+            CategoryClosure.ancestor_id.in_(descendants)
+        ):
+            descendants[ancestor_id].append(descendant_id)
+    return descendants
+
+
+def top_level_category_ids(user_id):
+    """{category_id: id of the top-level category it sits under} for all of a user's categories"""
+    ancestor = db.aliased(Category)
+    return dict(db.session.query(CategoryClosure.descendant_id, CategoryClosure.ancestor_id).join(
+        ancestor, ancestor.id == CategoryClosure.ancestor_id
+    ).filter(
+        ancestor.user_id == user_id,
+        ancestor.parent_id.is_(None)
+    ))
+
+
+@app.cli.command('rebuild-category-closure')
+def rebuild_category_closure_command():
+    """Rebuild category_closure from the parent links of every category"""
+    rebuild_category_closure(None)
+    db.session.commit()
+    print(f"Done. {CategoryClosure.query.count()} category_closure rows.")
+
+
+# Budget fields that decide which expenses a budget covers
+BUDGET_SCOPE_FIELDS = ('user_id', 'category_id', 'include_subcategories', 'period')
+
+# session.info keys holding budget changes that wait for the commit
+BUDGET_CHANGE_KEYS = ('budget_period_days', 'budget_refresh_user_ids', 'budget_refresh_all', 'budget_reset_ids')
+
+
+def mark_budget_period_day(session, user_id, day):
+    """Refresh the periods of the user's budgets that contain `day` at the next commit"""
+    if user_id and day:
+        session.info.setdefault('budget_period_days', {}).setdefault(user_id, set()).add(day)
+
+
+def queue_budget_total_refresh(user_ids, session=None):
+    """
+    Recompute every recorded period of the given users' budgets (None means every
+    user) at the next commit, for bulk writes that skip the session events
+    """
+    session = session or db.session
+    if user_ids is None:
+        session.info['budget_refresh_all'] = True
+    else:
+        session.info.setdefault('budget_refresh_user_ids', set()).update(user_id for user_id in user_ids if user_id)
+
+
+def delete_budget_period_totals(user_id):
+    """Drop the period totals of a user's budgets, ahead of bulk deleting the budgets"""
+    BudgetPeriodTotal.query.filter(
+        BudgetPeriodTotal.budget_id.in_(db.session.query(Budget.id).filter_by(user_id=user_id))
+    ).delete(synchronize_session=False)
+
+
+def refresh_budget_period_totals(budgets, days=None, connection=None):
+    """
+    Recompute budget_period_totals rows of the given budgets from the expenses.
+    With days, only the periods containing those days are recomputed, otherwise every
+    recorded period. The current period is always written; other periods only
+    when they already have a row, so editing an old expense never starts a history.
+    """
+    budgets = list(budgets)
+    if not budgets:
+        return
+    connection = connection or db.session.connection()
+    totals = BudgetPeriodTotal.__table__
+
+    recorded = {}
+    for budget_id, period_start in connection.execute(
+        select(totals.c.budget_id, totals.c.period_start).where(totals.c.budget_id.in_([budget.id for budget in budgets]))
+    ):
+        recorded.setdefault(budget_id, set()).add(period_start)
+
+    windows = {}
+    for budget in budgets:
+        current_start, current_end = budget.get_current_period_dates()
+        windows[(budget.id, current_start)] = (budget, current_start, current_end)
+        if days is None:
+            periods = [budget.get_period_dates(period_start) for period_start in recorded.get(budget.id, ())]
+        else:
+            periods = [budget.get_period_dates(day) for day in days]
+        for start_date, end_date in periods:
+            if start_date in recorded.get(budget.id, ()):
+                windows[(budget.id, start_date)] = (budget, start_date, end_date)
+
+    spent = compute_budget_spent(windows.values())
+    now = datetime.utcnow()
+    for (budget_id, start_date), (_, _, end_date) in windows.items():
+        values = {'period_end': end_date, 'spent': spent[(budget_id, start_date)], 'updated_at': now}
+        updated = connection.execute(totals.update().where(
+            totals.c.budget_id == budget_id,
+            totals.c.period_start == start_date
+        ).values(**values)).rowcount
+        if not updated:
+            connection.execute(totals.insert().values(budget_id=budget_id, period_start=start_date, **values))
+
+    forget_budget_results()
+
+
+def attribute_values(state, name):
+    """Current and previous values of an attribute within this flush"""
+    history = state.attrs[name].history
+    return (history.added or []) + (history.unchanged or []) + (history.deleted or [])
+
+
+@event.listens_for(db.session, 'before_flush')
+def collect_budget_period_changes(session, flush_context, instances):
+    """Note which budget periods the pending changes move, for update_budget_period_totals()"""
+    for obj in list(session.new) + list(session.deleted) + list(session.dirty):
+        if isinstance(obj, Expense):
+            if obj in session.dirty and not session.is_modified(obj, include_collections=False):
+                continue
+            # Both where the expense was and where it is now
+            state = inspect(obj)
+            for user_id in attribute_values(state, 'user_id'):
+                for day in attribute_values(state, 'date'):
+                    mark_budget_period_day(session, user_id, day)
+        elif isinstance(obj, CategorySplit):
+            if obj.expense:
+                mark_budget_period_day(session, obj.expense.user_id, obj.expense.date)
+        elif isinstance(obj, Budget):
+            state = inspect(obj)
+            if obj in session.deleted:
+                if obj.id is not None:
+                    totals = BudgetPeriodTotal.__table__
+                    session.connection().execute(totals.delete().where(totals.c.budget_id == obj.id))
+            elif obj in session.new:
+                queue_budget_total_refresh([obj.user_id], session=session)
+            elif any(state.attrs[field].history.has_changes() for field in BUDGET_SCOPE_FIELDS):
+                # Totals of the old definition mean nothing for the new one
+                session.info.setdefault('budget_reset_ids', set()).add(obj.id)
+                queue_budget_total_refresh(attribute_values(state, 'user_id'), session=session)
+        elif isinstance(obj, Category):
+            # Moving a category changes what every budget above it covers
+            if obj in session.new or obj in session.deleted or inspect(obj).attrs.parent_id.history.has_changes():
+                queue_budget_total_refresh([obj.user_id], session=session)
+
+
+@event.listens_for(db.session, 'before_commit')
+def update_budget_period_totals(session):
+    """Bring the periods collected in collect_budget_period_changes() up to date, in the same transaction"""
+    if not any(key in session.info for key in BUDGET_CHANGE_KEYS):
+        return
+    session.flush()
+
+    days_by_user = session.info.pop('budget_period_days', {})
+    refresh_user_ids = session.info.pop('budget_refresh_user_ids', set())
+    refresh_all = session.info.pop('budget_refresh_all', False)
+    reset_ids = session.info.pop('budget_reset_ids', set())
+    connection = session.connection()
+
+    if reset_ids:
+        totals = BudgetPeriodTotal.__table__
+        connection.execute(totals.delete().where(totals.c.budget_id.in_(reset_ids)))
+
+    if refresh_all:
+        refresh_budget_period_totals(Budget.query.all(), connection=connection)
+        return
+    if refresh_user_ids:
+        refresh_budget_period_totals(Budget.query.filter(Budget.user_id.in_(refresh_user_ids)).all(), connection=connection)
+
+    budgets_by_user = {}
+    day_user_ids = set(days_by_user) - refresh_user_ids
+    if day_user_ids:
+        for budget in Budget.query.filter(Budget.user_id.in_(day_user_ids)):
+            budgets_by_user.setdefault(budget.user_id, []).append(budget)
+    for user_id, budgets in budgets_by_user.items():
+        refresh_budget_period_totals(budgets, days=days_by_user[user_id], connection=connection)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_budget_period_changes(session):
+    for key in BUDGET_CHANGE_KEYS:
+        session.info.pop(key, None)
+
+
+def close_budget_periods():
+    """
+    Finalize the period that ended yesterday and start the current one for every
+    active budget - runs on a schedule
+    """
+    with app.app_context():
+        try:
+            budgets = Budget.query.filter_by(active=True).all()
+            refresh_budget_period_totals(budgets, days=[datetime.utcnow() - timedelta(days=1)])
+            db.session.commit()
+            app.logger.info(f"Updated budget period totals for {len(budgets)} budgets")
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error closing budget periods: {str(e)}")
+
+
+@app.cli.command('verify-budget-totals')
+@click.option('--rebuild', is_flag=True, help='Rewrite mismatched rows instead of only reporting')
+def verify_budget_totals_command(rebuild):
+    """Compare budget_period_totals against spending recomputed from the expenses"""
+    budgets = {budget.id: budget for budget in Budget.query.all()}
+    rows = BudgetPeriodTotal.query.all()
+
+    windows = []
+    for row in rows:
+        budget = budgets.get(row.budget_id)
+        if budget:
+            windows.append((budget,) + budget.get_period_dates(row.period_start))
+    expected = compute_budget_spent(windows)
+
+    mismatched = []
+    for row in rows:
+        spent = expected.get((row.budget_id, row.period_start))
+        if spent is not None and abs(spent - row.spent) > 0.01:
+            mismatched.append(row)
+            print(f"Budget {row.budget_id} from {row.period_start:%Y-%m-%d}: stored {row.spent:.2f}, expected {spent:.2f}")
+
+    print(f"{len(rows)} periods checked, {len(mismatched)} mismatched.")
+
+    if rebuild:
+        for row in mismatched:
+            row.spent = expected[(row.budget_id, row.period_start)]
+            row.updated_at = datetime.utcnow()
+        refresh_budget_period_totals(budgets.values(), days=[])
+        db.session.commit()
+        print("Done. Mismatched periods rewritten and current periods recorded.")
+
+
 #--------------------
 # AUTH AND UTILITIES
 #--------------------
@@ -1116,200 +2647,348 @@ def restrict_demo_access(f):
 
 
 #  sync investments with accounts
-def sync_investments_with_accounts(user_id):
-    """Sync investment portfolios with their linked accounts, but only for manually added accounts"""
+def sync_investments_with_accounts():
+    """
+    Sync the portfolios flagged with account_sync_pending with their linked accounts,
+    but only for manually added accounts.
+    Runs as a background job after investment prices, shares or links change,
+    so page views never recalculate portfolio values.
+    """
+    with app.app_context():
+        try:
+            # updated_at of each flagged portfolio as we found it
+            flagged = dict(
+                db.session.query(Portfolio.id, Portfolio.updated_at).filter(Portfolio.account_sync_pending == True)
+            )
+            if not flagged:
+                return  # Nothing changed since the last sync
+            portfolio_ids = list(flagged)
+
+            portfolios = Portfolio.query.options(
+                selectinload(Portfolio.investments),
+                joinedload(Portfolio.account)
+            ).filter(Portfolio.id.in_(portfolio_ids)).all()
+
+            for portfolio in portfolios:
+                account = portfolio.account
+                if not account:
+                    continue
+
+                # CRITICAL: Skip accounts that came from SimpleFin
+                if account.import_source == 'simplefin':
+                    continue
+
+                # Update the account balance to match the portfolio value
+                account.balance = portfolio.calculate_total_value()
+
+            for user_id in {portfolio.account.user_id for portfolio in portfolios if portfolio.account}:
+                record_balance_snapshots(user_id)
+
+            # Clear the flags in the same commit as the balances, and only where the
+            # portfolio is unchanged since we read it; a change committed while we
+            # worked moved updated_at, so that portfolio stays flagged for the next run
+            portfolio_table = Portfolio.__table__
+            db.session.execute(
+                portfolio_table.update()
+                .where(portfolio_table.c.id == bindparam('portfolio_id'))
+                .where(portfolio_table.c.updated_at.is_not_distinct_from(bindparam('seen_updated_at')))
+                .values(account_sync_pending=False, updated_at=portfolio_table.c.updated_at),
+                [{'portfolio_id': portfolio_id, 'seen_updated_at': updated_at} for portfolio_id, updated_at in flagged.items()]
+            )
+
+            # Save all changes
+            db.session.commit()
+            app.logger.info(f"Synced {len(portfolios)} changed portfolios with their accounts")
+
+        except Exception as e:
+            app.logger.error(f"Error syncing investments with accounts: {str(e)}")
+            db.session.rollback()  # Rollback on error
+
+
+def queue_investment_account_sync():
+    """Run sync_investments_with_accounts() in the scheduler as soon as possible"""
     try:
-        # Get all portfolios for the user that are linked to accounts
-        portfolios = Portfolio.query.filter(
-            Portfolio.user_id == user_id,
-            Portfolio.account_id.isnot(None)
-        ).all()
-        
-        if not portfolios:
-            return  # No linked portfolios, nothing to sync
-            
-        for portfolio in portfolios:
-            # Skip if no linked account
-            if not portfolio.account_id:
-                continue
-                
-            account = Account.query.get(portfolio.account_id)
-            if not account:
-                continue
-                
-            # CRITICAL: Skip accounts that came from SimpleFin
-            if account.import_source == 'simplefin':
-                continue
-                
-            # Calculate current portfolio value
-            portfolio_value = portfolio.calculate_total_value()
-            
-            # Update the account balance to match the portfolio value
-            account.balance = portfolio_value
-            
-        # Save all changes
-        db.session.commit()
-        
+        # A single job id means bursts of changes collapse into one pending run
+        scheduler.add_job(
+            id=INVESTMENT_ACCOUNT_SYNC_JOB_ID,
+            func=sync_investments_with_accounts,
+            trigger='date',
+            replace_existing=True
+        )
     except Exception as e:
-        app.logger.error(f"Error syncing investments with accounts: {str(e)}")
-        db.session.rollback()  # Rollback on error
+        app.logger.error(f"Error queueing investment account sync: {str(e)}")
+
+
+
+#for investment api
+def check_fmp_api_key(user_id):
+    """Check if the user has a valid FMP API key set up"""
+    api_settings = UserApiSettings.query.filter_by(user_id=user_id).first()
+    
+    if not api_settings or not api_settings.fmp_api_key:
+        return False
+    
+    # Test the API key with a simple request
+    api_key = api_settings.get_api_key()
+    test_url = f"{app.config['FMP_API_URL']}/stock/list?apikey={api_key}"
+    
+    try:
+        response = requests.get(test_url)
+        if response.status_code == 200:
+            # Update last used timestamp
+            api_settings.last_used = datetime.utcnow()
+            db.session.commit()
+            return True
+        return False
+    except:
+        return False
+
+
+
+
+
+def get_base_currency_code():
+    """Code of the system base currency, or None if none is configured"""
+    base_currency = Currency.query.filter_by(is_base=True).first()
+    return base_currency.code if base_currency else None
+
+
+def record_balance_snapshots(user_id, day=None):
+    """
+    Store the current balance of each of a user's accounts as its snapshot for
+    `day` (today by default), replacing one taken earlier that day.
+    The caller commits.
+    """
+    day = day or datetime.now().date()
+    user = User.query.get(user_id)
+    accounts = Account.query.filter_by(user_id=user_id).all()
+    if not user or not accounts:
+        return
+
+    base_code = get_base_currency_code()
+    existing = {
+        snapshot.account_id: snapshot
+        for snapshot in BalanceSnapshot.query.filter(
+            BalanceSnapshot.account_id.in_([account.id for account in accounts]),
+            BalanceSnapshot.date == day
+        )
+    }
+
+    for account in accounts:
+        balance = account.balance or 0
+        currency_code = account.currency_code or user.default_currency_code or base_code
+        balance_base = convert_currency(balance, currency_code, base_code) if base_code else balance
+
+        snapshot = existing.get(account.id)
+        if snapshot:
+            snapshot.balance = balance
+            snapshot.balance_base = balance_base
+        else:
+            db.session.add(BalanceSnapshot(
+                account_id=account.id,
+                date=day,
+                balance=balance,
+                balance_base=balance_base
+            ))
+
+
+def record_all_balance_snapshots():
+    """Snapshot the balance of every account - runs on a schedule"""
+    with app.app_context():
+        try:
+            user_ids = [user_id for (user_id,) in db.session.query(Account.user_id).distinct()]
+            for user_id in user_ids:
+                record_balance_snapshots(user_id)
+            db.session.commit()
+            app.logger.info(f"Recorded balance snapshots for {len(user_ids)} users")
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error recording balance snapshots: {str(e)}")
 
 
+@app.cli.command('backfill-balance-snapshots')
+@click.option('--days', default=365, help='How many days of history to reconstruct')
+def backfill_balance_snapshots_command(days):
+    """
+    Reconstruct daily balance_snapshots by walking each account's transactions
+    back from its current balance. Days that already have a snapshot keep it,
+    and the walk continues from that recorded balance.
+    """
+    today = datetime.now().date()
+    start_day = today - timedelta(days=days)
+    base_code = get_base_currency_code()
+    created = 0
 
-#for investment api
-def check_fmp_api_key(user_id):
-    """Check if the user has a valid FMP API key set up"""
-    api_settings = UserApiSettings.query.filter_by(user_id=user_id).first()
-    
-    if not api_settings or not api_settings.fmp_api_key:
-        return False
-    
-    # Test the API key with a simple request
-    api_key = api_settings.get_api_key()
-    test_url = f"{app.config['FMP_API_URL']}/stock/list?apikey={api_key}"
-    
-    try:
-        response = requests.get(test_url)
-        if response.status_code == 200:
-            # Update last used timestamp
-            api_settings.last_used = datetime.utcnow()
-            db.session.commit()
-            return True
-        return False
-    except:
-        return False
+    accounts = Account.query.options(joinedload(Account.user)).order_by(Account.id).all()
+    for account in accounts:
+        currency_code = account.currency_code or account.user.default_currency_code or base_code
+        to_base = convert_currency(1.0, currency_code, base_code) if base_code else 1.0
+        rates = {}  # Transaction currency -> account currency
+
+        recorded = {
+            snapshot.date: snapshot.balance
+            for snapshot in BalanceSnapshot.query.filter(
+                BalanceSnapshot.account_id == account.id,
+                BalanceSnapshot.date >= start_day
+            )
+        }
 
+        # Net effect of each day's transactions on the balance, in the account's currency
+        changes = {}
+        transactions = Expense.query.filter(
+            or_(Expense.account_id == account.id, Expense.destination_account_id == account.id),
+            Expense.date >= datetime.combine(start_day + timedelta(days=1), datetime.min.time())
+        ).all()
+        for transaction in transactions:
+            amount = transaction.amount
+            if transaction.currency_code and transaction.currency_code != currency_code:
+                if transaction.currency_code not in rates:
+                    rates[transaction.currency_code] = convert_currency(1.0, transaction.currency_code, currency_code)
+                amount *= rates[transaction.currency_code]
+
+            day = transaction.date.date()
+            if transaction.account_id == account.id:
+                if transaction.transaction_type == 'income':
+                    changes[day] = changes.get(day, 0) + amount
+                elif transaction.transaction_type in ('expense', 'transfer'):
+                    changes[day] = changes.get(day, 0) - amount
+            if transaction.transaction_type == 'transfer' and transaction.destination_account_id == account.id:
+                changes[day] = changes.get(day, 0) + amount
+
+        # Walk back one day at a time, undoing each day's transactions
+        rows = []
+        balance = account.balance or 0
+        day = today
+        while day >= start_day:
+            if day in recorded:
+                balance = recorded[day]
+            else:
+                rows.append({
+                    'account_id': account.id,
+                    'date': day,
+                    'balance': balance,
+                    'balance_base': balance * to_base
+                })
+            balance -= changes.get(day, 0)
+            day -= timedelta(days=1)
 
+        db.session.bulk_insert_mappings(BalanceSnapshot, rows)
+        db.session.commit()
+        created += len(rows)
+        print(f"{account.name}: {len(rows)} snapshots")
 
+    # Past months of the net-worth chart changed for everyone
+    bump_dashboard_versions(None)
+    db.session.commit()
+    print(f"Done. {created} snapshots created for {len(accounts)} accounts.")
 
 
 def calculate_asset_debt_trends(current_user):
     """
-    Calculate asset and debt trends for a user's accounts, including investments
+    Calculate asset and debt trends for a user's accounts, including investments.
+    Past months use each account's last balance snapshot of the month, read in a
+    single range query; the current month uses the live balances.
     """
-    from datetime import datetime, timedelta
-    
     # Initialize tracking
     monthly_assets = {}
     monthly_debts = {}
     
     # Get today's date and calculate a reasonable historical range (last 12 months)
     today = datetime.now()
-    twelve_months_ago = today - timedelta(days=365)
+    current_month = today.strftime('%Y-%m')
+    month_start = today.date().replace(day=1)
+    range_start = month_start.replace(year=month_start.year - 1)
     
     # Get all accounts for the user
     accounts = Account.query.filter_by(user_id=current_user.id).all()
     
     # Get all portfolios for the user
-    portfolios = Portfolio.query.filter_by(user_id=current_user.id).all()
+    portfolios = Portfolio.query.options(selectinload(Portfolio.investments)).filter_by(user_id=current_user.id).all()
     
     # Get user's preferred currency code
     user_currency_code = current_user.default_currency_code or 'USD'
     
+    # Snapshots are stored in the base currency, so one factor converts them all
+    base_code = get_base_currency_code()
+    from_base = convert_currency(1.0, base_code, user_currency_code) if base_code else 1.0
+    
     # Calculate true total assets and debts directly from accounts (for accurate current total)
     direct_total_assets = 0
     direct_total_debts = 0
     investment_total = 0
     
-    for account in accounts:
-        # Get account's currency code, default to user's preferred currency
-        account_currency_code = account.currency_code or user_currency_code
-        
-        # Convert account balance to user's currency if needed
-        if account_currency_code != user_currency_code:
-            converted_balance = convert_currency(account.balance, account_currency_code, user_currency_code)
-        else:
-            converted_balance = account.balance
-        
+    # Categorize account types by their current balance
+    asset_account_ids = set()
+    debt_account_ids = set()
+    
+    # Convert every account balance to user's currency at once,
+    # defaulting the account's currency to user's preferred currency
+    converted_balances = convert_many(
+        [account.balance or 0 for account in accounts],
+        [account.currency_code or user_currency_code for account in accounts],
+        user_currency_code
+    ).tolist()
+    
+    for account, converted_balance in zip(accounts, converted_balances):
         if account.type in ['checking', 'savings', 'investment'] and converted_balance > 0:
             direct_total_assets += converted_balance
         elif account.type in ['credit'] or converted_balance < 0:
             # For credit cards with negative balances (standard convention)
             direct_total_debts += abs(converted_balance)
-    
-    # Add investment values to assets - calculate once to avoid duplication
-    account_linked_portfolios = []
+        
+        # Skip accounts with zero or near-zero balance
+        if abs(account.balance or 0) < 0.01:
+            continue
+        
+        if account.type in ['checking', 'savings', 'investment'] and account.balance > 0:
+            asset_account_ids.add(account.id)
+            monthly_assets[current_month] = monthly_assets.get(current_month, 0) + converted_balance
+        elif account.type in ['credit'] or account.balance < 0:
+            debt_account_ids.add(account.id)
+            monthly_debts[current_month] = monthly_debts.get(current_month, 0) + abs(converted_balance)
     
     # Calculate investment total
     for portfolio in portfolios:
-        portfolio_value = portfolio.calculate_total_value()
-        
-        # Check if this portfolio is linked to an account
-        if portfolio.account_id:
-            # If linked to an account, keep track but don't add to assets yet
-            account_linked_portfolios.append({
-                'account_id': portfolio.account_id,
-                'value': portfolio_value
-            })
-        else:
-            # If not linked to an account, add directly to assets
-            investment_total += portfolio_value
+        # Portfolios linked to an account are already counted in its balance
+        if not portfolio.account_id:
+            investment_total += portfolio.calculate_total_value()
     
     # Add investment total to assets - only those not linked to accounts
     direct_total_assets += investment_total
     
-    # Process each account for historical trends
-    for account in accounts:
-        # Get account's currency code, default to user's preferred currency
-        account_currency_code = account.currency_code or user_currency_code
-        
-        # Categorize account types
-        is_asset = account.type in ['checking', 'savings', 'investment'] and account.balance > 0
-        is_debt = account.type in ['credit'] or account.balance < 0
-        
-        # Skip accounts with zero or near-zero balance
-        if abs(account.balance or 0) < 0.01:
-            continue
-        
-        # Get monthly transactions for this account
-        transactions = Expense.query.filter(
-            Expense.account_id == account.id,
-            Expense.user_id == current_user.id,
-            Expense.date >= twelve_months_ago
-        ).order_by(Expense.date).all()
-        
-        # Track balance over time
-        balance_history = {}
-        current_balance = account.balance or 0
-        
-        # Start with the most recent balance
-        balance_history[today.strftime('%Y-%m')] = current_balance
-        
-        # Process transactions to track historical balances
-        for transaction in transactions:
-            month_key = transaction.date.strftime('%Y-%m')
-            
-            # Consider currency conversion for each transaction if needed
-            transaction_amount = transaction.amount
-            if transaction.currency_code and transaction.currency_code != account_currency_code:
-                transaction_amount = convert_currency(transaction_amount, transaction.currency_code, account_currency_code)
-            
-            # Adjust balance based on transaction
-            if transaction.transaction_type == 'income':
-                current_balance += transaction_amount
-            elif transaction.transaction_type == 'expense' or transaction.transaction_type == 'transfer':
-                current_balance -= transaction_amount
-            
-            # Update monthly balance
-            balance_history[month_key] = current_balance
-        
-        # Convert balance history to user currency if needed
-        if account_currency_code != user_currency_code:
-            for month, balance in balance_history.items():
-                balance_history[month] = convert_currency(balance, account_currency_code, user_currency_code)
-        
-        # Categorize and store balances
-        for month, balance in balance_history.items():
-            if is_asset:
-                # For asset accounts, add positive balances to the monthly total
-                monthly_assets[month] = monthly_assets.get(month, 0) + balance
-            elif is_debt:
-                # For debt accounts or negative balances, add the absolute value to the debt total
-                monthly_debts[month] = monthly_debts.get(month, 0) + abs(balance)
+    # Last snapshot of each account in each past month of the range
+    year, month = extract('year', BalanceSnapshot.date), extract('month', BalanceSnapshot.date)
+    month_ends = db.session.query(
+        BalanceSnapshot.account_id,
+        func.max(BalanceSnapshot.date).label('date')
+    ).join(Account, Account.id == BalanceSnapshot.account_id).filter(
+        Account.user_id == current_user.id,
+        BalanceSnapshot.date >= range_start,
+        BalanceSnapshot.date < month_start
+    ).group_by(BalanceSnapshot.account_id, year, month).subquery()
+    
+    snapshots = db.session.query(
+        BalanceSnapshot.account_id,
+        BalanceSnapshot.date,
+        BalanceSnapshot.balance_base
+    ).join(month_ends, and_(
+        BalanceSnapshot.account_id == month_ends.c.account_id,
+        BalanceSnapshot.date == month_ends.c.date
+    )).all()
+    
+    for account_id, snapshot_date, balance_base in snapshots:
+        month_key = snapshot_date.strftime('%Y-%m')
+        balance = balance_base * from_base
+        if account_id in asset_account_ids:
+            # For asset accounts, add positive balances to the monthly total
+            monthly_assets[month_key] = monthly_assets.get(month_key, 0) + balance
+        elif account_id in debt_account_ids:
+            # For debt accounts or negative balances, add the absolute value to the debt total
+            monthly_debts[month_key] = monthly_debts.get(month_key, 0) + abs(balance)
     
     # Add investment values to monthly trends
-    # This is a simplification - we don't have historical investment data
-    # so we'll just use the current value for all months
+    # This is a simplification - we don't have historical values for portfolios
+    # that aren't linked to an account, so we use the current value for all months
     for month in monthly_assets.keys():
         monthly_assets[month] += investment_total
     
@@ -1474,58 +3153,13 @@ def auto_categorize_transaction(description, user_id):
     # Standardize description - lowercase and remove extra spaces
     description = description.strip().lower()
     
-    # Get all active category mappings for the user
-    mappings = CategoryMapping.query.filter_by(
-        user_id=user_id,
-        active=True
-    ).order_by(CategoryMapping.priority.desc(), CategoryMapping.match_count.desc()).all()
-    
-    # Keep track of matches and their scores
-    matches = []
-    
-    # Check each mapping
-    for mapping in mappings:
-        matched = False
-        if mapping.is_regex:
-            # Use regex pattern matching
-            try:
-                import re
-                pattern = re.compile(mapping.keyword, re.IGNORECASE)
-                if pattern.search(description):
-                    matched = True
-            except:
-                # If regex is invalid, fall back to simple substring search
-                matched = mapping.keyword.lower() in description
-        else:
-            # Simple substring matching
-            matched = mapping.keyword.lower() in description
-            
-        if matched:
-            # Calculate match score based on:
-            # 1. Priority (user-defined importance)
-            # 2. Usage count (previous successful matches)
-            # 3. Keyword length (longer keywords are more specific)
-            # 4. Keyword position (earlier in the string is better)
-            score = (mapping.priority * 100) + (mapping.match_count * 10) + len(mapping.keyword)
-            
-            # Adjust score based on position (if simple keyword)
-            if not mapping.is_regex:
-                position = description.find(mapping.keyword.lower())
-                if position == 0:  # Matches at the start
-                    score += 50
-                elif position > 0:  # Adjust based on how early it appears
-                    score += max(0, 30 - position)
-                    
-            matches.append((mapping, score))
-    
-    # Sort matches by score, descending
-    matches.sort(key=lambda x: x[1], reverse=True)
+    # The user's mappings, compiled once and reused until they change
+    best_mapping = category_matchers.get(user_id).best_match(description, pending_category_matches(user_id))
     
-    # If we have any matches, increment the match count for the winner and return its category ID
-    if matches:
-        best_mapping = matches[0][0]
-        best_mapping.match_count += 1
-        db.session.commit()
+    # If we have a match, count it for the winner and return its category ID
+    if best_mapping:
+        # Written with the caller's commit, so an import isn't committed halfway through
+        record_category_match(user_id, best_mapping.id)
         return best_mapping.category_id
     
     return None
@@ -1597,6 +3231,53 @@ def extract_keywords(description):
     return max(filtered_words, key=len)
 
 
+def mine_category_patterns(rows, min_count=3, max_patterns=100000):
+    """
+    Count how often each extract_keywords() keyword appears per category in a
+    stream of (description, category_id, amount) rows.
+    Keeps at most max_patterns (keyword, category_id) counters, dropping the
+    rarest first when there are more, so counts are exact unless the history
+    has that many distinct patterns. Returns patterns seen at least min_count
+    times, most frequent first.
+    """
+    patterns = {}  # (keyword, category_id) -> [count, total_amount]
+    keywords = {}  # Description -> keyword, since imports repeat the same descriptions
+
+    for description, category_id, amount in rows:
+        # Skip transactions without descriptions
+        if not description:
+            continue
+
+        keyword = keywords.get(description)
+        if keyword is None:
+            if len(keywords) >= max_patterns:
+                keywords.clear()
+            keyword = keywords[description] = extract_keywords(description)
+        if not keyword:
+            continue
+
+        counter = patterns.get((keyword, category_id))
+        if counter is None:
+            if len(patterns) >= max_patterns:
+                # Evict the rarest counters, least frequent first, until half the room is free
+                floor = 1
+                while len(patterns) > max_patterns // 2:
+                    patterns = {key: value for key, value in patterns.items() if value[0] > floor}
+                    floor += 1
+            counter = patterns[(keyword, category_id)] = [0, 0.0]
+        counter[0] += 1
+        counter[1] += amount or 0
+
+    significant = [
+        {'keyword': keyword, 'category_id': category_id, 'count': count, 'total_amount': total_amount}
+        for (keyword, category_id), (count, total_amount) in patterns.items()
+        if count >= min_count
+    ]
+    # Sort by frequency
+    significant.sort(key=lambda pattern: pattern['count'], reverse=True)
+    return significant
+
+
 
 def get_category_id(category_name, description=None, user_id=None):
     """Find, create, or auto-suggest a category based on name and description"""
@@ -1605,8 +3286,8 @@ def get_category_id(category_name, description=None, user_id=None):
     
     # If we have a user ID and no category name but have a description
     if user_id and not category_name and description:
-        # Try to auto-categorize based on description
-        auto_category_id = auto_categorize_transaction(description, user_id)
+        # Try to auto-categorize based on description, then on the user's history
+        auto_category_id = auto_categorize_transaction(description, user_id) or predict_category(description, user_id)
         if auto_category_id:
             return auto_category_id
     
@@ -1664,9 +3345,9 @@ def get_category_id(category_name, description=None, user_id=None):
             return new_category.id
     
     # If we still don't have a category, try auto-categorization again with the description
-    if description and user_id:
-        # Try to auto-categorize based on description
-        auto_category_id = auto_categorize_transaction(description, user_id)
+    if description and user_id and category_name:
+        # Try to auto-categorize based on description, then on the user's history
+        auto_category_id = auto_categorize_transaction(description, user_id) or predict_category(description, user_id)
         if auto_category_id:
             return auto_category_id
     
@@ -2107,9 +3788,9 @@ def create_default_budgets(user_id):
         
     return budgets_added
 
-def update_currency_rates():
+def update_currency_rates(http=requests):
     """
-    Update currency exchange rates using a public API
+    Update currency exchange rates using a public API, recording them in the history too
     Returns the number of currencies updated or -1 on error
     """
     try:
@@ -2121,9 +3802,8 @@ def update_currency_rates():
             
         base_code = base_currency.code
         
-        # Use ExchangeRate-API (free tier - https://www.exchangerate-api.com/)
-        # Or you can use another free API like https://frankfurter.app/
-        response = requests.get(f'https://api.frankfurter.app/latest?from={base_code}')
+        # Frankfurter API (https://frankfurter.app/) or anything serving the same JSON
+        response = http.get(f"{app.config['FX_RATES_API_URL']}/latest?from={base_code}", timeout=30)
         
         if response.status_code != 200:
             app.logger.error(f"API request failed with status code {response.status_code}")
@@ -2131,6 +3811,7 @@ def update_currency_rates():
         
         data = response.json()
         rates = data.get('rates', {})
+        rate_date = datetime.strptime(data['date'], '%Y-%m-%d').date() if data.get('date') else date.today()
         
         # Get all currencies except base
         currencies = Currency.query.filter(Currency.code != base_code).all()
@@ -2141,6 +3822,7 @@ def update_currency_rates():
             if currency.code in rates:
                 currency.rate_to_base = 1 / rates[currency.code]  # Convert to base currency rate
                 currency.last_updated = datetime.utcnow()
+                db.session.merge(CurrencyRate(code=currency.code, date=rate_date, rate_to_base=currency.rate_to_base))
                 updated_count += 1
             else:
                 app.logger.warning(f"No rate found for {currency.code}")
@@ -2153,6 +3835,101 @@ def update_currency_rates():
     except Exception as e:
         app.logger.error(f"Error updating currency rates: {str(e)}")
         return -1
+
+
+def ingest_currency_rates(start, end, http=requests, chunk_days=90):
+    """
+    Fetch the daily rates of every currency between start and end (inclusive) and
+    store them in currency_rates, replacing rows already stored for those days.
+    Returns the number of rows written or -1 on error.
+    """
+    base_code = get_base_currency_code()
+    if not base_code:
+        app.logger.error("No base currency found. Cannot ingest rates.")
+        return -1
+
+    codes = {code for (code,) in db.session.query(Currency.code).filter(Currency.code != base_code)}
+    written = 0
+
+    # One request and one bulk write per chunk keeps responses and transactions small
+    for chunk_start, chunk_end in date_chunks(start, end, chunk_days):
+        url = f"{app.config['FX_RATES_API_URL']}/{chunk_start.isoformat()}..{chunk_end.isoformat()}?from={base_code}"
+        response = http.get(url, timeout=30)
+        if response.status_code != 200:
+            app.logger.error(f"Rate history request for {chunk_start}..{chunk_end} failed with status code {response.status_code}")
+            return -1
+
+        rows = parse_timeseries(response.json(), codes)
+        CurrencyRate.query.filter(
+            CurrencyRate.code.in_(codes),
+            CurrencyRate.date.between(chunk_start, chunk_end)
+        ).delete(synchronize_session=False)
+        db.session.bulk_insert_mappings(CurrencyRate, [
+            {'code': code, 'date': day, 'rate_to_base': rate_to_base}
+            for code, day, rate_to_base in rows
+        ])
+        written += len(rows)
+
+        # Bulk writes skip the session events, so bump the version here
+        bump_currency_table_version(db.session.connection())
+        db.session.commit()
+
+    currency_table.invalidate()
+    return written
+
+
+def rebase_currency_rate_history(old_base_code, new_base_code):
+    """
+    Re-express the stored rate history against a new base currency (caller commits).
+    Each rate is divided by the new base's rate on the same day, and days without
+    a rate for the new base are dropped because they can't be converted.
+    """
+    rates = CurrencyRate.__table__
+    new_base = rates.alias('new_base')
+    new_base_rate = select(new_base.c.rate_to_base).where(
+        new_base.c.code == new_base_code,
+        new_base.c.date == rates.c.date
+    ).scalar_subquery()
+    connection = db.session.connection()
+
+    # The old base becomes an ordinary currency worth 1 / rate(new base)
+    if old_base_code:
+        connection.execute(rates.insert().from_select(
+            ['code', 'date', 'rate_to_base'],
+            select(literal(old_base_code), rates.c.date, 1.0 / rates.c.rate_to_base).where(rates.c.code == new_base_code)
+        ))
+    connection.execute(rates.delete().where(
+        rates.c.code != new_base_code,
+        rates.c.code != old_base_code,
+        ~exists().where(new_base.c.code == new_base_code, new_base.c.date == rates.c.date)
+    ))
+    connection.execute(rates.update().where(
+        rates.c.code != new_base_code,
+        rates.c.code != old_base_code
+    ).values(rate_to_base=rates.c.rate_to_base / new_base_rate))
+    connection.execute(rates.delete().where(rates.c.code == new_base_code))
+    bump_currency_table_version(connection)
+
+
+@app.cli.command('ingest-currency-rates')
+@click.option('--start', required=True, type=click.DateTime(formats=['%Y-%m-%d']), help='First day to fetch')
+@click.option('--end', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='Last day to fetch (default today)')
+@click.option('--offline', is_flag=True, help='Use the local stand-in API, quoting the current rates for every day')
+def ingest_currency_rates_command(start, end, offline):
+    """Bulk-load historical exchange rates into currency_rates"""
+    http = requests
+    if offline:
+        base_code = get_base_currency_code()
+        http = LocalRatesAPI({
+            currency.code: 1 / currency.rate_to_base
+            for currency in Currency.query.filter(Currency.code != base_code) if currency.rate_to_base
+        }, base=base_code)
+
+    written = ingest_currency_rates(start.date(), (end or datetime.now()).date(), http=http)
+    if written < 0:
+        print("Rate ingestion failed, see the log for details.")
+    else:
+        print(f"Done. {written} daily rates stored.")
 def init_default_currencies():
     """Initialize the default currencies in the database"""
     with app.app_context():
@@ -2205,41 +3982,19 @@ def init_default_currencies():
                 print(f"Error initializing currencies: {str(e)}")
 
 
-def convert_currency(amount, from_code, to_code):
-    """Convert an amount from one currency to another"""
-    if from_code == to_code:
-        return amount
-    
-    from_currency = Currency.query.filter_by(code=from_code).first()
-    to_currency = Currency.query.filter_by(code=to_code).first()
-    
-    if not from_currency or not to_currency:
-        return amount  # Return original if either currency not found
-    
-    # Get base currency for reference
-    base_currency = Currency.query.filter_by(is_base=True).first()
-    if not base_currency:
-        return amount  # Cannot convert without a base currency
-    
-    # First convert amount to base currency
-    if from_code == base_currency.code:
-        # Amount is already in base currency
-        amount_in_base = amount
-    else:
-        # Convert from source currency to base currency
-        # The rate_to_base represents how much of the base currency 
-        # equals 1 unit of this currency
-        amount_in_base = amount * from_currency.rate_to_base
-    
-    # Then convert from base currency to target currency
-    if to_code == base_currency.code:
-        # Target is base currency, so we're done
-        return amount_in_base
-    else:
-        # Convert from base currency to target currency
-        # We divide by the target currency's rate_to_base to get 
-        # the equivalent amount in the target currency
-        return amount_in_base / to_currency.rate_to_base
+def convert_currency(amount, from_code, to_code, on_date=None):
+    """Convert an amount from one currency to another, at the rates of on_date if given"""
+    # Rates come from the in-memory table, refreshed when the currencies table changes
+    return currency_table.convert(amount, from_code, to_code, on_date=on_date)
+
+
+def convert_many(amounts, from_codes, to_code):
+    """
+    Convert a column of amounts to one currency in a single vectorized step
+    from_codes is one currency code for all amounts or one code per amount.
+    Returns a NumPy array.
+    """
+    return currency_table.convert_many(amounts, from_codes, to_code)
 
 def create_scheduled_expenses():
     """Create expense instances for active recurring expenses"""
@@ -2247,6 +4002,7 @@ def create_scheduled_expenses():
     
     # Find active recurring expenses
     active_recurring = RecurringExpense.query.filter_by(active=True).all()
+    created_expenses = []
     
     for recurring in active_recurring:
         # Skip if end date is set and passed
@@ -2287,9 +4043,11 @@ def create_scheduled_expenses():
         if create_expense:
             expense = recurring.create_expense_instance(today)
             db.session.add(expense)
+            created_expenses.append(expense)
     
     # Commit all changes
     if active_recurring:
+        sync_expense_ledgers(created_expenses)
         db.session.commit()
 def calculate_iou_data(expenses, users):
     """Calculate who owes whom money based on expenses"""
@@ -2300,9 +4058,11 @@ def calculate_iou_data(expenses, users):
         'net_balance': 0  # Overall balance (positive if owed money)
     }
     
+    expense_splits = calculate_splits_batch(expenses)
+    
     # Calculate balances
     for expense in expenses:
-        splits = expense.calculate_splits()
+        splits = expense_splits[expense.id]
         
         # If current user is the payer
         if expense.paid_by == current_user.id:
@@ -2319,13 +4079,13 @@ def calculate_iou_data(expenses, users):
         # If current user is in the splits (but not the payer)
         elif current_user.id in [split['email'] for split in splits['splits']]:
             payer_id = expense.paid_by
-            payer = User.query.filter_by(id=payer_id).first()
+            payer_name = splits['payer']['name']
             
             # Find current user's split amount
             current_user_split = next((split['amount'] for split in splits['splits'] if split['email'] == current_user.id), 0)
             
             if payer_id not in iou_data['i_owe']:
-                iou_data['i_owe'][payer_id] = {'name': payer.name, 'amount': 0}
+                iou_data['i_owe'][payer_id] = {'name': payer_name, 'amount': 0}
             iou_data['i_owe'][payer_id]['amount'] += current_user_split
     
     # Calculate net balance
@@ -2337,99 +4097,68 @@ def calculate_iou_data(expenses, users):
 
 def calculate_balances(user_id):
     """Calculate balances between the current user and all other users"""
-    balances = {}
-    
-    # Step 1: Calculate balances from expenses
-    expenses = Expense.query.filter(
-        or_(
-            Expense.paid_by == user_id,
-            Expense.split_with.like(f'%{user_id}%')
-        )
+    # Net amounts are maintained incrementally in user_pair_balances, so this
+    # only reads one row per counterparty instead of replaying the user's history
+    pair_balances = UserPairBalance.query.filter(
+        UserPairBalance.user_id == user_id,
+        func.abs(UserPairBalance.amount) > 0.01
     ).all()
     
-    for expense in expenses:
-        splits = expense.calculate_splits()
-        
-        # If current user paid for the expense
-        if expense.paid_by == user_id:
-            # Add what others owe to current user
-            for split in splits['splits']:
-                other_user_id = split['email']
-                if other_user_id != user_id:
-                    if other_user_id not in balances:
-                        other_user = User.query.filter_by(id=other_user_id).first()
-                        balances[other_user_id] = {
-                            'user_id': other_user_id,
-                            'name': other_user.name if other_user else 'Unknown',
-                            'email': other_user_id,
-                            'amount': 0
-                        }
-                    balances[other_user_id]['amount'] += split['amount']
-        else:
-            # If someone else paid and current user owes them
-            payer_id = expense.paid_by
-            
-            # Find current user's portion
-            current_user_portion = 0
-            
-            # Check if current user is in the splits
-            for split in splits['splits']:
-                if split['email'] == user_id:
-                    current_user_portion = split['amount']
-                    break
-            
-            if current_user_portion > 0:
-                if payer_id not in balances:
-                    payer = User.query.filter_by(id=payer_id).first()
-                    balances[payer_id] = {
-                        'user_id': payer_id,
-                        'name': payer.name if payer else 'Unknown',
-                        'email': payer_id,
-                        'amount': 0
-                    }
-                balances[payer_id]['amount'] -= current_user_portion
+    users_by_id = get_users_by_ids([pair.other_user_id for pair in pair_balances])
     
-    # Step 2: Adjust balances based on settlements
-    settlements = Settlement.query.filter(
-        or_(
-            Settlement.payer_id == user_id,
-            Settlement.receiver_id == user_id
-        )
-    ).all()
+    balances = []
+    for pair in pair_balances:
+        other_user = users_by_id.get(pair.other_user_id)
+        balances.append({
+            'user_id': pair.other_user_id,
+            'name': other_user.name if other_user else 'Unknown',
+            'email': pair.other_user_id,
+            'amount': pair.amount
+        })
     
-    for settlement in settlements:
-        if settlement.payer_id == user_id:
-            # Current user paid money to someone else
-            other_user_id = settlement.receiver_id
-            if other_user_id not in balances:
-                other_user = User.query.filter_by(id=other_user_id).first()
-                balances[other_user_id] = {
-                    'user_id': other_user_id,
-                    'name': other_user.name if other_user else 'Unknown',
-                    'email': other_user_id,
-                    'amount': 0
-                }
-            # FIX: When current user pays someone, it INCREASES how much they owe the current user
-            # Change from -= to += 
-            balances[other_user_id]['amount'] += settlement.amount
-            
-        elif settlement.receiver_id == user_id:
-            # Current user received money from someone else
-            other_user_id = settlement.payer_id
-            if other_user_id not in balances:
-                other_user = User.query.filter_by(id=other_user_id).first()
-                balances[other_user_id] = {
-                    'user_id': other_user_id,
-                    'name': other_user.name if other_user else 'Unknown',
-                    'email': other_user_id,
-                    'amount': 0
-                }
-            # FIX: When current user receives money, it DECREASES how much they're owed
-            # Change from += to -=
-            balances[other_user_id]['amount'] -= settlement.amount
+    return balances
+
+def calculate_group_settlement_plan(group):
+    """
+    Net each member's balance with the rest of the group and plan the fewest
+    transfers that settle it. Balances come from user_pair_balances, so they
+    cover every debt between the members - shared expenses outside the group
+    included - and settlements already recorded between them, which carry no
+    group to scope by.
+    """
+    members_by_id = {member.id: member for member in group.members}
+    
+    # One grouped query: each member's net position against the other members
+    net_rows = db.session.query(
+        UserPairBalance.user_id,
+        func.sum(UserPairBalance.amount)
+    ).filter(
+        UserPairBalance.user_id.in_(members_by_id),
+        UserPairBalance.other_user_id.in_(members_by_id)
+    ).group_by(UserPairBalance.user_id).all()
+    net_balances = {user_id: amount for user_id, amount in net_rows}
+    
+    balances = [
+        {
+            'user_id': member_id,
+            'name': member.name,
+            'amount': net_balances.get(member_id, 0.0)
+        }
+        for member_id, member in members_by_id.items()
+    ]
+    
+    transfers = [
+        {
+            'payer_id': payer_id,
+            'payer_name': members_by_id[payer_id].name,
+            'receiver_id': receiver_id,
+            'receiver_name': members_by_id[receiver_id].name,
+            'amount': amount
+        }
+        for payer_id, receiver_id, amount in plan_settlements(net_balances)
+    ]
     
-    # Return only non-zero balances
-    return [balance for balance in balances.values() if abs(balance['amount']) > 0.01]
+    return {'balances': balances, 'transfers': transfers}
 
 def get_base_currency():
     """Get the current user's default currency or fall back to base currency if not set"""
@@ -2671,6 +4400,51 @@ def check_db_structure():
             db.session.execute(text('ALTER TABLE users ADD COLUMN last_login TIMESTAMP'))
             db.session.commit()
             app.logger.info("Added last_login column to users table")
+        
+        if 'dashboard_version' not in users_columns:
+            app.logger.warning("Missing dashboard_version column in users table - adding it now")
+            db.session.execute(text('ALTER TABLE users ADD COLUMN dashboard_version INTEGER NOT NULL DEFAULT 0'))
+            db.session.commit()
+            app.logger.info("Added dashboard_version column to users table")
+        
+        if 'category_rules_version' not in users_columns:
+            app.logger.warning("Missing category_rules_version column in users table - adding it now")
+            db.session.execute(text('ALTER TABLE users ADD COLUMN category_rules_version INTEGER NOT NULL DEFAULT 0'))
+            db.session.commit()
+            app.logger.info("Added category_rules_version column to users table")
+        
+        # Check expense_shares for the paid_by column used by the pair balances
+        if 'expense_shares' in inspector.get_table_names():
+            share_columns = [col['name'] for col in inspector.get_columns('expense_shares')]
+            if 'paid_by' not in share_columns:
+                app.logger.warning("Missing paid_by column in expense_shares table - adding it now")
+                db.session.execute(text('ALTER TABLE expense_shares ADD COLUMN paid_by VARCHAR(120)'))
+                db.session.commit()
+                app.logger.info("Added paid_by column to expense_shares table. Run 'flask backfill-expense-shares' and 'flask verify-pair-balances --rebuild'")
+            
+        # Check portfolios for the flag used by the background account sync
+        portfolio_columns = [col['name'] for col in inspector.get_columns('portfolios')]
+        if 'account_sync_pending' not in portfolio_columns:
+            app.logger.warning("Missing account_sync_pending column in portfolios table - adding it now")
+            db.session.execute(text('ALTER TABLE portfolios ADD COLUMN account_sync_pending BOOLEAN NOT NULL DEFAULT FALSE'))
+            db.session.execute(text('UPDATE portfolios SET account_sync_pending = TRUE WHERE account_id IS NOT NULL'))
+            db.session.commit()
+            app.logger.info("Added account_sync_pending column to portfolios table")
+            
+        # Check expenses for the precomputed base currency amount
+        expense_columns = [col['name'] for col in inspector.get_columns('expenses')]
+        if 'amount_base' not in expense_columns:
+            app.logger.warning("Missing amount_base column in expenses table - adding it now")
+            db.session.execute(text('ALTER TABLE expenses ADD COLUMN amount_base FLOAT'))
+            db.session.commit()
+            app.logger.info("Added amount_base column to expenses table. Run 'flask backfill-amount-base'")
+            
+        # A category_closure table made by create_all() starts out empty
+        if not CategoryClosure.query.first() and Category.query.first():
+            app.logger.warning("Empty category_closure table - rebuilding it now")
+            rebuild_category_closure(None)
+            db.session.commit()
+            app.logger.info("Rebuilt category_closure from the category parent links")
             
         app.logger.info("Database structure check completed")
 
@@ -2757,30 +4531,6 @@ def utility_processor():
 
         return result
     
-    def get_budget_status_for_category(category_id):
-        """Get budget status for a specific category"""
-        if not current_user.is_authenticated:
-            return None
-            
-        # Find active budget for this category
-        budget = Budget.query.filter_by(
-            user_id=current_user.id,
-            category_id=category_id,
-            active=True
-        ).first()
-        
-        if not budget:
-            return None
-            
-        return {
-            'id': budget.id,
-            'percentage': budget.get_progress_percentage(),
-            'status': budget.get_status(),
-            'amount': budget.amount,
-            'spent': budget.calculate_spent_amount(),
-            'remaining': budget.get_remaining_amount()
-        }
-    
     def get_account_by_id(account_id):
         """Retrieve an account by its ID"""
         return Account.query.get(account_id)
@@ -2801,18 +4551,11 @@ def get_transaction_details(other_user_id):
     """
     Fetch transaction details (expenses and settlements) between current user and another user
     """
-    # Query expenses involving both users
+    # Query expenses owned by one of the users and split with the other
     expenses = Expense.query.filter(
-        or_(
-            and_(
-                Expense.user_id == current_user.id, 
-                Expense.split_with.like(f'%{other_user_id}%')
-            ),
-            and_(
-                Expense.user_id == other_user_id, 
-                Expense.split_with.like(f'%{current_user.id}%')
-            )
-        )
+        Expense.user_id.in_([current_user.id, other_user_id]),
+        Expense.id.in_(involved_expense_ids(current_user.id)),
+        Expense.id.in_(involved_expense_ids(other_user_id))
     ).order_by(Expense.date.desc()).limit(20).all()
 
     # Query settlements between both users
@@ -2825,10 +4568,11 @@ def get_transaction_details(other_user_id):
 
     # Prepare transaction details
     transactions = []
+    expense_splits = calculate_splits_batch(expenses)
     
     # Add expenses
     for expense in expenses:
-        splits = expense.calculate_splits()
+        splits = expense_splits[expense.id]
         transactions.append({
             'type': 'expense',
             'date': expense.date.strftime('%Y-%m-%d'),
@@ -2839,14 +4583,15 @@ def get_transaction_details(other_user_id):
         })
     
     # Add settlements
+    settlement_users = get_users_by_ids([current_user.id, other_user_id])
     for settlement in settlements:
         transactions.append({
             'type': 'settlement',
             'date': settlement.date.strftime('%Y-%m-%d'),
             'description': settlement.description,
             'amount': settlement.amount,
-            'payer': User.query.get(settlement.payer_id).name,
-            'receiver': User.query.get(settlement.receiver_id).name
+            'payer': settlement_users[settlement.payer_id].name,
+            'receiver': settlement_users[settlement.receiver_id].name
         })
     
     # Sort transactions by date, most recent first
@@ -3254,6 +4999,9 @@ def create_demo_data(user_id):
         )
         db.session.add(transfer3)
     
+    # Record shares and participants for the demo transactions created above
+    sync_expense_ledgers(Expense.query.filter_by(user_id=user_id).all())
+    
     # 4. Create recurring expenses
     netflix_recurring = RecurringExpense.query.filter_by(
         description="Netflix Subscription", user_id=user_id).first()
@@ -3375,6 +5123,9 @@ def reset_demo_data(user_id):
             split_count = CategorySplit.query.filter(CategorySplit.expense_id.in_(expense_ids)).delete(synchronize_session=False)
             logger.info(f"Deleted {split_count} category splits")
             
+            # Reverse their balance contributions and delete their shares and participants
+            release_expense_ledgers(expense_ids)
+            
         # 3. Delete tags associations for these expenses
         if expense_ids:
             from sqlalchemy import text
@@ -3392,13 +5143,15 @@ def reset_demo_data(user_id):
         recurring_count = RecurringExpense.query.filter_by(user_id=user_id).delete()
         logger.info(f"Deleted {recurring_count} recurring expenses")
         
-        # 6. Delete budgets
+        # 6. Delete budgets and their period totals
+        delete_budget_period_totals(user_id)
         budget_count = Budget.query.filter_by(user_id=user_id).delete()
         logger.info(f"Deleted {budget_count} budgets")
         
-        # 7. Delete category mappings
+        # 7. Delete category mappings and bulk categorization runs
         mapping_count = CategoryMapping.query.filter_by(user_id=user_id).delete()
         logger.info(f"Deleted {mapping_count} category mappings")
+        CategorizationJob.query.filter_by(user_id=user_id).delete()
         
         # 8. Delete ignored patterns
         pattern_count = IgnoredRecurringPattern.query.filter_by(user_id=user_id).delete()
@@ -3408,14 +5161,19 @@ def reset_demo_data(user_id):
         simplefin_count = SimpleFin.query.filter_by(user_id=user_id).delete()
         logger.info(f"Deleted {simplefin_count} SimpleFin settings")
         
-        # 10. Delete settlements
+        # 10. Delete settlements (reversing them in the pair balances first)
         from sqlalchemy import or_
-        settlement_count = Settlement.query.filter(
+        settlement_query = Settlement.query.filter(
             or_(Settlement.payer_id == user_id, Settlement.receiver_id == user_id)
-        ).delete(synchronize_session=False)
+        )
+        apply_pair_balance_deltas(settlement_pair_deltas(settlement_query.all()), sign=-1)
+        settlement_count = settlement_query.delete(synchronize_session=False)
         logger.info(f"Deleted {settlement_count} settlements")
         
-        # 11. Delete all accounts
+        # 11. Delete all accounts and their balance snapshots
+        BalanceSnapshot.query.filter(
+            BalanceSnapshot.account_id.in_(db.session.query(Account.id).filter_by(user_id=user_id))
+        ).delete(synchronize_session=False)
         account_count = Account.query.filter_by(user_id=user_id).delete()
         logger.info(f"Deleted {account_count} accounts")
         
@@ -3423,10 +5181,14 @@ def reset_demo_data(user_id):
         tag_count = Tag.query.filter_by(user_id=user_id).delete()
         logger.info(f"Deleted {tag_count} tags")
         
-        # 13. Delete all categories
+        # 13. Delete all categories and their closure rows
+        delete_category_closure(user_id)
         category_count = Category.query.filter_by(user_id=user_id).delete()
         logger.info(f"Deleted {category_count} categories")
         
+        # 14. Invalidate the cached dashboard (bulk deletes don't trigger the session events)
+        bump_dashboard_versions([user_id])
+        
         # Commit the transaction
         db.session.commit()
         logger.info("Demo data reset successful")
@@ -3579,7 +5341,6 @@ def login():
             login_user(user)
             # Update last login time
             user.last_login = datetime.utcnow()
-            sync_investments_with_accounts(user.id)
             if app.config.get('SIMPLEFIN_ENABLED', False):
                 try:
                     # Check if user has SimpleFin connection
@@ -3681,83 +5442,192 @@ def logout():
 
 
 #--------------------
-# ROUTES: DASHBOARD
+# DASHBOARD AGGREGATES
 #--------------------
-@app.route('/dashboard')
-@login_required_dev
-@demo_time_limited
-def dashboard():
-    now = datetime.now()
-    base_currency = get_base_currency()
-    # Fetch all expenses where the user is either the creator or a split participant
-    expenses = Expense.query.filter(
-        or_(
-            Expense.user_id == current_user.id,
-            Expense.split_with.like(f'%{current_user.id}%')
-        )
-    ).order_by(Expense.date.desc()).all()
-    
-    users = User.query.all()
-    groups = Group.query.join(group_users).filter(group_users.c.user_id == current_user.id).all()
-    # Synchronize investment portfolios with linked accounts
-    sync_investments_with_accounts(current_user.id)
-    # Pre-calculate expense splits to avoid repeated calculations in template
-    expense_splits = {}
-    for expense in expenses:
-        expense_splits[expense.id] = expense.calculate_splits()
-    
-    # Calculate monthly totals with contributors
+def month_key_columns():
+    """Year and month of Expense.date as portable SQL expressions"""
+    return extract('year', Expense.date), extract('month', Expense.date)
+
+
+def format_month_key(year, month):
+    """'YYYY-MM' key for a year/month pair returned by month_key_columns()"""
+    return f"{int(year):04d}-{int(month):02d}"
+
+
+def get_dashboard_monthly_totals(user_id):
+    """
+    Monthly totals of the expenses a user is involved in, broken down by card,
+    account, contributor and category. Each breakdown is one GROUP BY query, so
+    the cost no longer depends on loading every expense into Python.
+    Amounts are summed in the base currency.
+    """
+    involved = involved_expense_ids(user_id)
+    year, month = month_key_columns()
+    is_expense = Expense.transaction_type == 'expense'
+
+    # Every month with activity gets an entry, even if it only has income or transfers
     monthly_totals = {}
-    if expenses:
-        for expense in expenses:
-            month_key = expense.date.strftime('%Y-%m')
-            if month_key not in monthly_totals:
-                monthly_totals[month_key] = {
-                    'total': 0.0,
-                    'by_card': {},
-                    'contributors': {},
-                    'by_account': {}  # New: track by account
-                }
-            
-            # Add to total - MODIFIED: Only add expenses, not income or transfers
-            if not hasattr(expense, 'transaction_type') or expense.transaction_type == 'expense':
-                monthly_totals[month_key]['total'] += expense.amount
-                
-                # Add to card totals
-                if expense.card_used not in monthly_totals[month_key]['by_card']:
-                    monthly_totals[month_key]['by_card'][expense.card_used] = 0
-                monthly_totals[month_key]['by_card'][expense.card_used] += expense.amount
-                
-                # Add to account totals if available
-                if hasattr(expense, 'account') and expense.account:
-                    account_name = expense.account.name
-                    if account_name not in monthly_totals[month_key]['by_account']:
-                        monthly_totals[month_key]['by_account'][account_name] = 0
-                    monthly_totals[month_key]['by_account'][account_name] += expense.amount
-                
-                # Calculate splits and add to contributors
-                splits = expense_splits[expense.id]
-                
-                # Add payer's portion
-                if splits['payer']['amount'] > 0:
-                    payer_email = splits['payer']['email']
-                    if payer_email not in monthly_totals[month_key]['contributors']:
-                        monthly_totals[month_key]['contributors'][payer_email] = 0
-                    monthly_totals[month_key]['contributors'][payer_email] += splits['payer']['amount']
-                
-                # Add other contributors' portions
-                for split in splits['splits']:
-                    if split['email'] not in monthly_totals[month_key]['contributors']:
-                        monthly_totals[month_key]['contributors'][split['email']] = 0
-                    monthly_totals[month_key]['contributors'][split['email']] += split['amount']
-    
-    # Calculate total expenses for current user (only their portions for the current year)
-    current_year = now.year
-    total_expenses = 0
-    total_expenses_only = 0  # NEW: For expenses only
-    # Add these calculations for income and transfers
-    total_income = 0
-    total_transfers = 0
+    month_rows = db.session.query(
+        year, month, func.sum(case((is_expense, expense_amount_base()), else_=0.0))
+    ).filter(Expense.id.in_(involved)).group_by(year, month)
+
+    for row_year, row_month, total in month_rows:
+        monthly_totals[format_month_key(row_year, row_month)] = {
+            'total': total or 0.0,
+            'by_card': {},
+            'contributors': {},
+            'by_account': {},
+            'by_category': {}
+        }
+
+    # Card totals
+    card_rows = db.session.query(
+        year, month, Expense.card_used, func.sum(expense_amount_base())
+    ).filter(Expense.id.in_(involved), is_expense).group_by(year, month, Expense.card_used)
+
+    for row_year, row_month, card_used, amount in card_rows:
+        monthly_totals[format_month_key(row_year, row_month)]['by_card'][card_used] = amount
+
+    # Account totals, keyed by account name
+    account_rows = db.session.query(
+        year, month, Account.name, func.sum(expense_amount_base())
+    ).select_from(Expense).join(
+        Account, Expense.account_id == Account.id
+    ).filter(Expense.id.in_(involved), is_expense).group_by(year, month, Account.name)
+
+    for row_year, row_month, account_name, amount in account_rows:
+        monthly_totals[format_month_key(row_year, row_month)]['by_account'][account_name] = amount
+
+    # Contributors are everyone with a share of the month's expenses
+    contributor_rows = db.session.query(
+        year, month, ExpenseShare.user_id, func.sum(in_base_currency(ExpenseShare.amount))
+    ).select_from(ExpenseShare).join(
+        Expense, ExpenseShare.expense_id == Expense.id
+    ).filter(Expense.id.in_(involved), is_expense).group_by(year, month, ExpenseShare.user_id)
+
+    for row_year, row_month, contributor_id, amount in contributor_rows:
+        monthly_totals[format_month_key(row_year, row_month)]['contributors'][contributor_id] = amount
+
+    for month_key, category_totals in get_dashboard_category_totals(involved).items():
+        monthly_totals[month_key]['by_category'] = category_totals
+
+    return monthly_totals
+
+
+def get_dashboard_category_totals(involved):
+    """
+    Per-month category totals of the given expense ids (expenses only).
+    Expenses with category splits count each split under its own category,
+    the rest count their full amount under the expense's category.
+    """
+    year, month = month_key_columns()
+    is_expense = Expense.transaction_type == 'expense'
+
+    split_rows = db.session.query(
+        year, month, CategorySplit.category_id, func.sum(in_base_currency(CategorySplit.amount))
+    ).select_from(CategorySplit).join(
+        Expense, CategorySplit.expense_id == Expense.id
+    ).filter(Expense.id.in_(involved), is_expense).group_by(year, month, CategorySplit.category_id)
+
+    has_splits = db.session.query(CategorySplit.id).filter(CategorySplit.expense_id == Expense.id).exists()
+    category_rows = db.session.query(
+        year, month, Expense.category_id, func.sum(expense_amount_base())
+    ).filter(
+        Expense.id.in_(involved), is_expense, Expense.category_id.isnot(None), ~has_splits
+    ).group_by(year, month, Expense.category_id)
+
+    rows = split_rows.all() + category_rows.all()
+    categories = {
+        category.id: category
+        for category in Category.query.filter(Category.id.in_({row[2] for row in rows})).all()
+    } if rows else {}
+
+    # Categories are shown by name, so same-named categories of different users are merged
+    totals = {}
+    for row_year, row_month, category_id, amount in rows:
+        category = categories.get(category_id)
+        if not category:
+            continue
+        month_totals = totals.setdefault(format_month_key(row_year, row_month), {})
+        if category.name not in month_totals:
+            month_totals[category.name] = {
+                'amount': 0,
+                'color': category.color,
+                'icon': category.icon
+            }
+        month_totals[category.name]['amount'] += amount
+
+    return totals
+
+
+def get_dashboard_type_totals(user_id):
+    """All-time totals per transaction type of the expenses a user is involved in"""
+    rows = db.session.query(
+        Expense.transaction_type, func.sum(expense_amount_base())
+    ).filter(Expense.id.in_(involved_expense_ids(user_id))).group_by(Expense.transaction_type)
+
+    return {transaction_type: amount or 0 for transaction_type, amount in rows}
+
+
+def get_dashboard_period_totals(user_id, now):
+    """
+    The user's portion of this year's and this month's transactions.
+    Expenses the user paid count in full, others count only the user's share.
+    """
+    year_start = datetime(now.year, 1, 1)
+    next_year_start = datetime(now.year + 1, 1, 1)
+    _, month = month_key_columns()
+
+    rows = db.session.query(
+        month, Expense.transaction_type, func.sum(in_base_currency(ExpenseShare.amount))
+    ).select_from(ExpenseShare).join(
+        Expense, ExpenseShare.expense_id == Expense.id
+    ).filter(
+        Expense.id.in_(involved_expense_ids(user_id)),
+        Expense.date >= year_start,
+        Expense.date < next_year_start,
+        or_(Expense.paid_by == user_id, ExpenseShare.user_id == user_id)
+    ).group_by(month, Expense.transaction_type)
+
+    totals = {
+        'year_total': 0,
+        'year_expenses_only': 0,
+        'month_total': 0,
+        'month_expenses_only': 0
+    }
+    for row_month, transaction_type, amount in rows:
+        amount = amount or 0
+        is_expense = transaction_type == 'expense'
+        totals['year_total'] += amount
+        if is_expense:
+            totals['year_expenses_only'] += amount
+        if int(row_month) == now.month:
+            totals['month_total'] += amount
+            if is_expense:
+                totals['month_expenses_only'] += amount
+
+    return totals
+
+
+def get_dashboard_unique_cards(user_id):
+    """Cards used on the involved expenses the user paid for"""
+    rows = db.session.query(Expense.card_used).filter(
+        Expense.id.in_(involved_expense_ids(user_id)),
+        Expense.paid_by == user_id
+    ).distinct()
+
+    return {card_used for (card_used,) in rows}
+
+
+def build_dashboard_summary(user, now):
+    """
+    Everything the dashboard shows apart from the activity feed: monthly totals,
+    period totals, IOU data, budget summary and asset/debt trends.
+    The result is plain JSON-serializable data so it can be cached.
+    """
+    # Monthly totals by card, account, contributor and category from grouped queries
+    monthly_totals = get_dashboard_monthly_totals(user.id)
+    current_month = now.strftime('%Y-%m')
     monthly_labels = []
     monthly_amounts = []
 
@@ -3767,13 +5637,12 @@ def dashboard():
     for month, data in sorted_monthly_totals:
         monthly_labels.append(month)
         monthly_amounts.append(data['total'])
-        # Calculate totals for each transaction type
-    for expense in expenses:
-        if hasattr(expense, 'transaction_type'):
-            if expense.transaction_type == 'income':
-                total_income += expense.amount
-            elif expense.transaction_type == 'transfer':
-                total_transfers += expense.amount
+    
+    # Calculate totals for each transaction type
+    type_totals = get_dashboard_type_totals(user.id)
+    total_income = type_totals.get('income', 0)
+    total_transfers = type_totals.get('transfer', 0)
+    total_expenses_only = 0
     
     # Calculate derived metrics
     net_cash_flow = total_income - total_expenses_only
@@ -3783,77 +5652,19 @@ def dashboard():
         savings_rate = (net_cash_flow / total_income) * 100
     else:
         savings_rate = 0
-    for expense in expenses:
-        # Skip if not in current year
-        if expense.date.year != current_year:
-            continue
-        
-        # NEW: Check if it's an expense
-        is_expense = not hasattr(expense, 'transaction_type') or expense.transaction_type == 'expense'
-            
-        splits = expense_splits[expense.id]
-        
-        if expense.paid_by == current_user.id:
-            # If user paid, add their own portion
-            total_expenses += splits['payer']['amount']
-            if is_expense:
-                total_expenses_only += splits['payer']['amount']
-            
-            # Also add what others owe them (the entire expense)
-            for split in splits['splits']:
-                total_expenses += split['amount']
-                if is_expense:
-                    total_expenses_only += split['amount']
-        else:
-            # If someone else paid, add only this user's portion
-            for split in splits['splits']:
-                if split['email'] == current_user.id:
-                    total_expenses += split['amount']
-                    if is_expense:
-                        total_expenses_only += split['amount']
-                    break
-        
-    # Calculate current month's total for the current user
-    current_month_total = 0
-    current_month_expenses_only = 0  # NEW: For expenses only
-    current_month = now.strftime('%Y-%m')
     
-    for expense in expenses:
-        # Skip if not in current month
-        if expense.date.strftime('%Y-%m') != current_month:
-            continue
-            
-        # NEW: Check if it's an expense
-        is_expense = not hasattr(expense, 'transaction_type') or expense.transaction_type == 'expense'
-            
-        splits = expense_splits[expense.id]
-        
-        if expense.paid_by == current_user.id:
-            # If user paid, add their own portion
-            current_month_total += splits['payer']['amount']
-            if is_expense:
-                current_month_expenses_only += splits['payer']['amount']
-            
-            # Also add what others owe them (the entire expense)
-            for split in splits['splits']:
-                current_month_total += split['amount']
-                if is_expense:
-                    current_month_expenses_only += split['amount']
-        else:
-            # If someone else paid, add only this user's portion
-            for split in splits['splits']:
-                if split['email'] == current_user.id:
-                    current_month_total += split['amount']
-                    if is_expense:
-                        current_month_expenses_only += split['amount']
-                    break
-
+    # The user's portion of this year's and this month's transactions
+    period_totals = get_dashboard_period_totals(user.id, now)
+    total_expenses = period_totals['year_total']
+    total_expenses_only = period_totals['year_expenses_only']
+    current_month_total = period_totals['month_total']
+    current_month_expenses_only = period_totals['month_expenses_only']
 
     # Get unique cards (only where current user paid)
-    unique_cards = set(expense.card_used for expense in expenses if expense.paid_by == current_user.id)
+    unique_cards = get_dashboard_unique_cards(user.id)
     
     # Calculate balances using the settlements method
-    balances = calculate_balances(current_user.id)
+    balances = calculate_balances(user.id)
     
     # Sort into "you owe" and "you are owed" categories
     you_owe = []
@@ -3889,87 +5700,211 @@ def dashboard():
 
     budget_summary = get_budget_summary()
 
-    categories = Category.query.filter_by(user_id=current_user.id).order_by(Category.name).all()
-    currencies = Currency.query.all()
-    
 
     # Calculate asset and debt trends
-    asset_debt_trends = calculate_asset_debt_trends(current_user)
+    asset_debt_trends = calculate_asset_debt_trends(user)
+
+    return {
+        'top_categories': get_category_spending(monthly_totals.get(current_month, {}).get('by_category', {})),
+        'monthly_totals': monthly_totals,
+        'total_expenses': total_expenses,
+        'total_expenses_only': total_expenses_only,
+        'current_month_total': current_month_total,
+        'current_month_expenses_only': current_month_expenses_only,
+        'unique_cards': sorted(card for card in unique_cards if card),
+        'iou_data': iou_data,
+        'budget_summary': budget_summary,
+        'monthly_labels': monthly_labels,
+        'monthly_amounts': monthly_amounts,
+        'total_income': total_income,
+        'total_transfers': total_transfers,
+        'net_cash_flow': net_cash_flow,
+        'savings_rate': savings_rate,
+        'asset_trends_months': asset_debt_trends['months'],
+        'asset_trends': asset_debt_trends['assets'],
+        'debt_trends': asset_debt_trends['debts'],
+        'total_assets': asset_debt_trends['total_assets'],
+        'total_debts': asset_debt_trends['total_debts'],
+        'net_worth': asset_debt_trends['net_worth']
+    }
+
+
+#--------------------
+# DASHBOARD ACTIVITY FEED
+#--------------------
+ACTIVITY_PAGE_SIZE = 25
+
+
+def encode_activity_cursor(expense):
+    """Keyset cursor pointing just past an expense in (date, id) descending order"""
+    return f"{expense.date.isoformat()}_{expense.id}"
+
+
+def decode_activity_cursor(cursor):
+    """Parse a cursor from encode_activity_cursor(); raises ValueError if it is malformed"""
+    date_part, _, id_part = cursor.rpartition('_')
+    return datetime.fromisoformat(date_part), int(id_part)
+
+
+def get_activity_page(user_id, cursor=None, limit=ACTIVITY_PAGE_SIZE, month=None, expenses_only=False):
+    """
+    One page of the expenses a user is involved in, newest first.
+    Pages are keyset-paginated on (date, id), so every page costs the same no
+    matter how far back it is. Returns (expenses, next_cursor); next_cursor is
+    None on the last page.
+    """
+    query = Expense.query.options(
+        joinedload(Expense.category),
+        selectinload(Expense.category_splits).joinedload(CategorySplit.category)
+    ).filter(Expense.id.in_(involved_expense_ids(user_id)))
+
+    if month:
+        month_start = datetime.strptime(month, '%Y-%m')
+        next_month_start = (month_start + timedelta(days=32)).replace(day=1)
+        query = query.filter(Expense.date >= month_start, Expense.date < next_month_start)
+
+    if expenses_only:
+        query = query.filter(Expense.transaction_type == 'expense')
 
+    if cursor:
+        cursor_date, cursor_id = decode_activity_cursor(cursor)
+        query = query.filter(or_(
+            Expense.date < cursor_date,
+            and_(Expense.date == cursor_date, Expense.id < cursor_id)
+        ))
+
+    # Fetch one extra row to know whether another page follows
+    expenses = query.order_by(Expense.date.desc(), Expense.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_activity_cursor(expenses[limit - 1]) if len(expenses) > limit else None
+
+    return expenses[:limit], next_cursor
+
+
+# Colors are stored as typed into forms, so only #rgb/#rrggbb values ever reach a style attribute
+HEX_COLOR_PATTERN = re.compile(r'^#(?:[0-9a-fA-F]{3}){1,2}$')
+
+
+def safe_color(value, default):
+    """value if it is a hex color, otherwise default"""
+    return value if value and HEX_COLOR_PATTERN.match(value) else default
+
+
+def serialize_activity(expenses):
+    """Activity feed rows for the dashboard, shared by the template and the JSON endpoint"""
+    expense_splits = calculate_splits_batch(expenses)
+
+    user_ids = set()
+    for splits in expense_splits.values():
+        user_ids.add(splits['payer']['email'])
+        user_ids.update(split['email'] for split in splits['splits'])
+    users_by_id = get_users_by_ids(user_ids)
+
+    def portion(entry):
+        user = users_by_id.get(entry['email'])
+        return {
+            'name': entry['name'],
+            'amount': entry['amount'],
+            'color': safe_color(user.user_color if user else None, '#15803d')
+        }
+
+    items = []
+    for expense in expenses:
+        splits = expense_splits[expense.id]
+
+        if expense.category_splits:
+            categories = [
+                {'name': split.category.name, 'color': safe_color(split.category.color, '#6c757d'), 'icon': split.category.icon, 'amount': split.amount}
+                for split in expense.category_splits if split.category
+            ]
+        elif expense.category:
+            categories = [{'name': expense.category.name, 'color': safe_color(expense.category.color, '#6c757d'), 'icon': expense.category.icon, 'amount': None}]
+        else:
+            categories = []
+
+        # The payer's portion is only listed when they kept part of the expense
+        portions = [portion(splits['payer'])] if splits['payer']['amount'] > 0 else []
+        portions.extend(portion(split) for split in splits['splits'])
+
+        items.append({
+            'id': expense.id,
+            'date': expense.date.strftime('%Y-%m-%d'),
+            'day': expense.date.strftime('%d'),
+            'description': expense.description,
+            'amount': expense.amount,
+            'transaction_type': expense.transaction_type or 'expense',
+            'card_used': expense.card_used,
+            'payer': splits['payer']['name'],
+            'has_category_splits': bool(expense.category_splits),
+            'categories': categories,
+            'portions': portions
+        })
+
+    return items
+
+
+#--------------------
+# ROUTES: DASHBOARD
+#--------------------
+@app.route('/dashboard')
+@login_required_dev
+@demo_time_limited
+def dashboard():
+    now = datetime.now()
     base_currency = get_base_currency()
+    # Only the first page of activity is rendered, the rest is loaded from /dashboard/activity
+    recent_expenses, activity_cursor = get_activity_page(current_user.id)
+    
+    users = User.query.all()
+    groups = Group.query.join(group_users).filter(group_users.c.user_id == current_user.id).all()
+    
+    categories = Category.query.filter_by(user_id=current_user.id).order_by(Category.name).all()
+    currencies = Currency.query.all()
+    
+    # The summary widgets only change with the user's data, so cache them per data version
+    version = current_user.dashboard_version or 0
+    day = now.strftime('%Y-%m-%d')
+    summary = dashboard_cache.get(current_user.id, version, day)
+    if summary is None:
+        summary = build_dashboard_summary(current_user, now)
+        dashboard_cache.set(current_user.id, version, day, summary)
 
     return render_template('dashboard.html', 
-                         expenses=expenses,
-                         expense_splits=expense_splits,
-                         top_categories = get_category_spending(expenses, expense_splits),
-                         monthly_totals=monthly_totals,
-                         total_expenses=total_expenses,
-                         total_expenses_only=total_expenses_only,  # NEW: For expenses only
-                         current_month_total=current_month_total,
-                         current_month_expenses_only=current_month_expenses_only,  # NEW: For expenses only
-                         unique_cards=unique_cards,
+                         recent_activity=serialize_activity(recent_expenses),
+                         activity_cursor=activity_cursor,
                          users=users,
                          groups=groups,
-                         iou_data=iou_data,
                          base_currency=base_currency,
-                         budget_summary=budget_summary,
                          currencies=currencies,
                          categories=categories,
-                         monthly_labels=monthly_labels,
-                         monthly_amounts=monthly_amounts,
-                         total_income=total_income,
-                         total_transfers=total_transfers,
-                         net_cash_flow=net_cash_flow,
-                         savings_rate=savings_rate,
-                         asset_trends_months=asset_debt_trends['months'],
-                         asset_trends=asset_debt_trends['assets'],
-                         debt_trends=asset_debt_trends['debts'],
-                         total_assets=asset_debt_trends['total_assets'],
-                         total_debts=asset_debt_trends['total_debts'],
-                         net_worth=asset_debt_trends['net_worth'],
-                         now=now)
+                         now=now,
+                         **summary)
+
+@app.route('/dashboard/activity')
+@login_required_dev
+def dashboard_activity():
+    """Next page of the dashboard activity feed as JSON"""
+    cursor = request.args.get('cursor') or None
+    month = request.args.get('month') or None
+    expenses_only = request.args.get('expenses_only') == '1'
+    limit = min(request.args.get('limit', ACTIVITY_PAGE_SIZE, type=int), 100)
+
+    try:
+        expenses, next_cursor = get_activity_page(
+            current_user.id, cursor=cursor, limit=max(limit, 1), month=month, expenses_only=expenses_only
+        )
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid cursor or month'}), 400
+
+    return jsonify({
+        'success': True,
+        'transactions': serialize_activity(expenses),
+        'next_cursor': next_cursor
+    })
 
 from datetime import datetime
 
-def get_category_spending(expenses, expense_splits):
-    current_month = datetime.now().month
-    current_year = datetime.now().year
-    
-    category_totals = {}
-    
-    for expense in expenses:
-        # Skip non-expenses
-        if hasattr(expense, 'transaction_type') and expense.transaction_type != 'expense':
-            continue
-        
-        # Filter expenses for the current month and year
-        if expense.date.month != current_month or expense.date.year != current_year:
-            continue
-        
-        # Handle category splits first
-        if expense.category_splits:
-            for split in expense.category_splits:
-                if split.category:
-                    category_name = split.category.name
-                    if category_name not in category_totals:
-                        category_totals[category_name] = {
-                            'amount': 0,
-                            'color': split.category.color,
-                            'icon': split.category.icon
-                        }
-                    category_totals[category_name]['amount'] += split.amount
-        
-        # Handle regular category if no splits
-        elif expense.category:
-            category_name = expense.category.name
-            if category_name not in category_totals:
-                category_totals[category_name] = {
-                    'amount': 0,
-                    'color': expense.category.color,
-                    'icon': expense.category.icon
-                }
-            category_totals[category_name]['amount'] += expense.amount
-    
+def get_category_spending(category_totals, limit=6):
+    """Top categories by amount from a {name: {'amount', 'color', 'icon'}} breakdown"""
     # Sort and return top categories
     sorted_categories = sorted(
         [
@@ -3983,7 +5918,7 @@ def get_category_spending(expenses, expense_splits):
         ], 
         key=lambda x: x['amount'],
         reverse=True
-    )[:6]
+    )[:limit]
     
     return sorted_categories
 
@@ -4293,6 +6228,9 @@ def add_expense():
                     )
                     db.session.add(category_split)
         
+        # Record each participant and their share
+        sync_expense_ledgers([expense])
+        
         # Update account balances
         if account_id:
             source_account = Account.query.get(account_id)
@@ -4393,7 +6331,8 @@ def delete_expense(expense_id):
                     if dest_account:
                         dest_account.balance -= amount  # Remove from destination
         
-        # Delete the expense
+        # Reverse its effect on balances, then delete the expense
+        release_expense_ledgers([expense.id])
         db.session.delete(expense)
         db.session.commit()
         
@@ -4706,6 +6645,9 @@ def update_expense(expense_id):
                         if dest_account:
                             dest_account.balance += expense.amount
         
+        # Re-derive participants and shares from the updated splits
+        sync_expense_ledgers([expense])
+        
         # Save all changes
         db.session.commit()
         
@@ -4977,6 +6919,7 @@ def add_recurring():
         if start_date <= today:
             expense = recurring_expense.create_expense_instance(start_date)
             db.session.add(expense)
+            sync_expense_ledgers([expense])
             db.session.commit()
         
         flash('Recurring transaction added successfully!')
@@ -5764,11 +7707,15 @@ def group_details(group_id):
     categories = Category.query.filter_by(user_id=current_user.id).order_by(Category.name).all()
     
     expenses = Expense.query.filter_by(group_id=group_id).order_by(Expense.date.desc()).all()
+    expense_splits = calculate_splits_batch(expenses)
+    settlement_plan = calculate_group_settlement_plan(group)
     all_users = User.query.all()
     currencies = Currency.query.all()
     return render_template('group_details.html', 
                            group=group, 
                            expenses=expenses,
+                           expense_splits=expense_splits,
+                           settlement_plan=settlement_plan,
                            currencies=currencies, 
                            base_currency=base_currency,
                            categories=categories,
@@ -5844,7 +7791,8 @@ def delete_group(group_id):
         group_name = session.get('delete_group_name', group.name)
         expense_count = session.get('delete_group_expense_count', 0)
         
-        # Delete associated expenses first
+        # Delete associated expenses (reversing their balances and derived rows) first
+        release_expense_ledgers(expense_id for (expense_id,) in db.session.query(Expense.id).filter_by(group_id=group_id))
         Expense.query.filter_by(group_id=group_id).delete()
         
         # Delete the group
@@ -5969,6 +7917,33 @@ def get_group_details_api(group_id):
             'members': [member.id for member in group.members]
         }
     })
+
+@app.route('/groups/<int:group_id>/settlement_plan', methods=['GET'])
+@login_required_dev
+def group_settlement_plan(group_id):
+    """
+    API endpoint returning the fewest transfers that settle up what a group's
+    members owe each other, across all their shared expenses (not only this group's)
+    """
+    group = Group.query.get_or_404(group_id)
+    
+    # Check if user is a member of the group
+    if current_user not in group.members:
+        return jsonify({
+            'success': False,
+            'message': 'Access denied. You are not a member of this group.'
+        }), 403
+    
+    plan = calculate_group_settlement_plan(group)
+    
+    return jsonify({
+        'success': True,
+        'group_id': group.id,
+        'scope': 'all_shared_expenses',  # Members' debts from any expense, not only this group's
+        'balances': plan['balances'],
+        'transfers': plan['transfers']
+    })
+
 #--------------------
 # ROUTES: ADMIN
 #--------------------
@@ -5983,6 +7958,25 @@ def admin():
     users = User.query.all()
     return render_template('admin.html', users=users)
 
+@app.route('/admin/dashboard_cache')
+@login_required_dev
+def admin_dashboard_cache():
+    """Dashboard cache hit/miss counters (counted per worker process)"""
+    if not current_user.is_admin:
+        return jsonify({'success': False, 'message': 'Admin privileges required'}), 403
+
+    return jsonify({'success': True, 'stats': dashboard_cache.get_stats()})
+
+@app.route('/admin/dashboard_cache/clear', methods=['POST'])
+@login_required_dev
+def admin_clear_dashboard_cache():
+    """Drop every cached dashboard summary"""
+    if not current_user.is_admin:
+        return jsonify({'success': False, 'message': 'Admin privileges required'}), 403
+
+    count = dashboard_cache.clear()
+    return jsonify({'success': True, 'message': f'Cleared {count} cached dashboards'})
+
 @app.route('/admin/add_user', methods=['POST'])
 @login_required_dev
 def admin_add_user():
@@ -6054,14 +8048,30 @@ def admin_delete_user(user_id):
         # Delete all related data in the correct order
         # 1. First handle budgets (they reference categories)
         app.logger.info("Deleting budgets...")
+        delete_budget_period_totals(user_id)
         Budget.query.filter_by(user_id=user_id).delete()
         
         # 2. Delete recurring expenses
         app.logger.info("Deleting recurring expenses...")
         RecurringExpense.query.filter_by(user_id=user_id).delete()
         
-        # 3. Delete expenses
+        # 3. Delete expenses along with their derived rows, then the user's rows on other expenses
         app.logger.info("Deleting expenses...")
+        # Other users' expenses this user was part of get re-split once they're gone
+        affected_expense_ids = {
+            expense_id for (expense_id,) in db.session.query(Expense.id).filter(
+                Expense.user_id != user_id,
+                or_(Expense.paid_by == user_id, Expense.id.in_(involved_expense_ids(user_id)))
+            )
+        }
+        release_expense_ledgers(expense_id for (expense_id,) in db.session.query(Expense.id).filter_by(user_id=user_id))
+        ExpenseShare.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+        ExpenseShare.query.filter_by(paid_by=user_id).update({ExpenseShare.paid_by: None}, synchronize_session=False)
+        ExpenseParticipant.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+        UserPairBalance.query.filter(or_(
+            UserPairBalance.user_id == user_id,
+            UserPairBalance.other_user_id == user_id
+        )).delete(synchronize_session=False)
         Expense.query.filter_by(user_id=user_id).delete()
         
         # 4. Delete settlements
@@ -6070,9 +8080,10 @@ def admin_delete_user(user_id):
             or_(Settlement.payer_id == user_id, Settlement.receiver_id == user_id)
         ).delete(synchronize_session=False)
         
-        # 5. Delete category mappings
+        # 5. Delete category mappings and bulk categorization runs
         app.logger.info("Deleting category mappings...")
         CategoryMapping.query.filter_by(user_id=user_id).delete()
+        CategorizationJob.query.filter_by(user_id=user_id).delete()
         
         # 6. Delete SimpleFin settings
         app.logger.info("Deleting SimpleFin settings...")
@@ -6084,6 +8095,9 @@ def admin_delete_user(user_id):
         
         # 8. Handle user's accounts
         app.logger.info("Deleting accounts...")
+        BalanceSnapshot.query.filter(
+            BalanceSnapshot.account_id.in_(db.session.query(Account.id).filter_by(user_id=user_id))
+        ).delete(synchronize_session=False)
         Account.query.filter_by(user_id=user_id).delete()
         
         # 9. Handle tags - first remove from association table
@@ -6099,6 +8113,7 @@ def admin_delete_user(user_id):
         
         # 10. Categories can now be deleted
         app.logger.info("Deleting categories...")
+        delete_category_closure(user_id)
         Category.query.filter_by(user_id=user_id).delete()
         
         # 11. Handle group memberships
@@ -6126,6 +8141,10 @@ def admin_delete_user(user_id):
         app.logger.info("Deleting user...")
         db.session.delete(user)
         
+        # 13. Recompute shares and pair balances of the expenses the user was split on
+        if affected_expense_ids:
+            sync_expense_ledgers(Expense.query.filter(Expense.id.in_(affected_expense_ids)).all())
+        
         # Commit all changes
         db.session.commit()
         app.logger.info(f"User {user_id} deleted successfully")
@@ -6263,6 +8282,7 @@ def add_settlement():
         )
         
         db.session.add(settlement)
+        apply_pair_balance_deltas(settlement_pair_deltas([settlement]))
         db.session.commit()
         flash('Settlement recorded successfully!')
         
@@ -6323,6 +8343,8 @@ def add_currency():
     
     try:
         db.session.commit()
+        if is_base:
+            queue_amount_base_recompute()
         flash(f'Currency {code} added successfully')
     except Exception as e:
         db.session.rollback()
@@ -6346,7 +8368,8 @@ def update_currency(code):
     new_is_base = request.form.get('is_base') == 'on'
     
     # If setting as base, update all existing base currencies
-    if new_is_base and not currency.is_base:
+    base_changed = new_is_base and not currency.is_base
+    if base_changed:
         for curr in Currency.query.filter_by(is_base=True).all():
             curr.is_base = False
     
@@ -6355,6 +8378,8 @@ def update_currency(code):
     
     try:
         db.session.commit()
+        if base_changed:
+            queue_amount_base_recompute()
         flash(f'Currency {code} updated successfully')
     except Exception as e:
         db.session.rollback()
@@ -6394,7 +8419,8 @@ def delete_currency(code):
             }), 400
         
         
-        # Remove the currency
+        # Remove the currency and its rate history
+        CurrencyRate.query.filter_by(code=code).delete()
         db.session.delete(currency)
         db.session.commit()
         
@@ -6441,6 +8467,10 @@ def set_base_currency(code):
         if current_base_currency:
             # Unset current base currency
             current_base_currency.is_base = False
+            
+            # Historical rates are stored against the base, so re-express them
+            if current_base_currency.code != code:
+                rebase_currency_rate_history(current_base_currency.code, code)
         
         # Set new base currency
         new_base_currency.is_base = True
@@ -6458,6 +8488,9 @@ def set_base_currency(code):
         # Commit changes
         db.session.commit()
         
+        # Every stored base amount is now in the old currency
+        queue_amount_base_recompute()
+        
         flash(f'Base currency successfully changed to {code}.', 'success')
     except Exception as e:
         # Rollback in case of error
@@ -6518,18 +8551,13 @@ def transactions():
     # Fetch all expenses where the user is either the creator or a split participant
     base_currency = get_base_currency()
     expenses = Expense.query.filter(
-        or_(
-            Expense.user_id == current_user.id,
-            Expense.split_with.like(f'%{current_user.id}%')
-        )
+        Expense.id.in_(involved_expense_ids(current_user.id))
     ).order_by(Expense.date.desc()).all()
     
     users = User.query.all()
     
     # Pre-calculate all expense splits to avoid repeated calculations
-    expense_splits = {}
-    for expense in expenses:
-        expense_splits[expense.id] = expense.calculate_splits()
+    expense_splits = calculate_splits_batch(expenses)
     
     # Calculate total expenses for current user (similar to dashboard calculation)
     now = datetime.now()
@@ -6765,23 +8793,18 @@ def accounts():
     total_assets = 0
     total_liabilities = 0
     
-    for account in user_accounts:
-        # Get account balance in account's currency
-        balance = account.balance or 0
-        
+    # Convert all balances to user's preferred currency in one go
+    converted_balances = convert_many(
+        [account.balance or 0 for account in user_accounts],
+        [account.currency_code or user_currency_code for account in user_accounts],
+        user_currency_code
+    ).tolist()
+    
+    for account, converted_balance in zip(user_accounts, converted_balances):
         # Skip near-zero balances
-        if abs(balance) < 0.01:
+        if abs(account.balance or 0) < 0.01:
             continue
             
-        # Get account's currency code
-        account_currency = account.currency_code or user_currency_code
-        
-        # Convert to user's preferred currency if different
-        if account_currency != user_currency_code:
-            converted_balance = convert_currency(balance, account_currency, user_currency_code)
-        else:
-            converted_balance = balance
-            
         # Add to appropriate total
         if account.type in ['checking', 'savings', 'investment'] and converted_balance > 0:
             total_assets += converted_balance
@@ -6950,6 +8973,7 @@ def delete_account(account_id):
                 'message': 'You do not have permission to delete this account'
             }), 403
         
+        BalanceSnapshot.query.filter_by(account_id=account.id).delete()
         db.session.delete(account)
         db.session.commit()
         
@@ -7227,6 +9251,10 @@ def import_csv():
                 app.logger.error(f"Error processing CSV row: {str(row_error)}")
                 continue
         
+        # Record shares and participants for the imported transactions
+        sync_expense_ledgers(imported_expenses)
+        record_balance_snapshots(current_user.id)
+        
         # Commit all transactions
         db.session.commit()
         
@@ -7429,6 +9457,7 @@ def simplefin_add_accounts():
         # Count for success message
         accounts_added = 0
         transactions_added = 0
+        added_expenses = []
         
         # Get the user's default currency
         default_currency = current_user.default_currency_code or 'USD'
@@ -7489,7 +9518,8 @@ def simplefin_add_accounts():
                 current_user.id,
                 detect_internal_transfer,  # Your transfer detection function
                 auto_categorize_transaction,  # Your auto-categorization function
-                get_category_id  # Your function to find/create categories
+                get_category_id,  # Your function to find/create categories
+                predict_category  # Fallback from the user's categorized history
             )
             
             # Check for existing transactions to avoid duplicates
@@ -7508,6 +9538,7 @@ def simplefin_add_accounts():
             for transaction in transaction_objects_filtered:
                 db.session.add(transaction)
                 transactions_added += 1
+                added_expenses.append(transaction)
                 
                 # Handle account balance updates for transfers
                 if transaction.transaction_type == 'transfer' and transaction.destination_account_id:
@@ -7517,6 +9548,10 @@ def simplefin_add_accounts():
                         # For transfers, add to destination account balance
                         to_account.balance += transaction.amount
         
+        # Record shares and participants for the imported transactions
+        sync_expense_ledgers(added_expenses)
+        record_balance_snapshots(current_user.id)
+        
         # Commit all changes
         db.session.commit()
         
@@ -7600,10 +9635,12 @@ def sync_account(account_id):
             current_user.id,
             detect_internal_transfer,
             auto_categorize_transaction,
-            get_category_id
+            get_category_id,
+            predict_category
         )
         
         # Track new transactions
+        added_expenses = []
         new_transactions = 0
         
         # Filter out existing transactions and add new ones
@@ -7618,6 +9655,7 @@ def sync_account(account_id):
             if not existing:
                 db.session.add(transaction)
                 new_transactions += 1
+                added_expenses.append(transaction)
                 
                 # Handle account balance updates for transfers
                 if transaction.transaction_type == 'transfer' and transaction.destination_account_id:
@@ -7627,6 +9665,10 @@ def sync_account(account_id):
                         # For transfers, add to destination account balance
                         to_account.balance += transaction.amount
         
+        # Record shares and participants for the imported transactions
+        sync_expense_ledgers(added_expenses)
+        record_balance_snapshots(current_user.id)
+        
         # Commit changes
         db.session.commit()
         
@@ -7853,6 +9895,7 @@ def sync_all_simplefin_accounts():
                 account_map = {acc.external_id: acc for acc in user_accounts if acc.external_id}
                 
                 # Track statistics
+                added_expenses = []
                 accounts_updated = 0
                 transactions_added = 0
                 
@@ -7878,7 +9921,8 @@ def sync_all_simplefin_accounts():
                             settings.user_id,
                             detect_internal_transfer,
                             auto_categorize_transaction,
-                            get_category_id
+                            get_category_id,
+                            predict_category
                         )
                         
                         # Filter out existing transactions and add new ones
@@ -7893,6 +9937,7 @@ def sync_all_simplefin_accounts():
                             if not existing:
                                 db.session.add(transaction)
                                 transactions_added += 1
+                                added_expenses.append(transaction)
                                 
                                 # Handle account balance updates for transfers
                                 if transaction.transaction_type == 'transfer' and transaction.destination_account_id:
@@ -7904,6 +9949,8 @@ def sync_all_simplefin_accounts():
                 
                 # Commit changes for this user
                 if accounts_updated > 0 or transactions_added > 0:
+                    sync_expense_ledgers(added_expenses)
+                    record_balance_snapshots(settings.user_id)
                     db.session.commit()
                     
                     # Update the SimpleFin settings last_sync time
@@ -7957,6 +10004,7 @@ def sync_simplefin_for_user(user_id):
             # Create a mapping of external IDs to account objects
             account_map = {acc.external_id: acc for acc in user_accounts if acc.external_id}
             
+            added_expenses = []
             # Track statistics
             accounts_updated = 0
             transactions_added = 0
@@ -7983,7 +10031,8 @@ def sync_simplefin_for_user(user_id):
                         user_id,
                         detect_internal_transfer,
                         auto_categorize_transaction,
-                        get_category_id
+                        get_category_id,
+                        predict_category
                     )
                     
                     # Filter out existing transactions and add new ones
@@ -7998,6 +10047,7 @@ def sync_simplefin_for_user(user_id):
                         if not existing:
                             db.session.add(transaction)
                             transactions_added += 1
+                            added_expenses.append(transaction)
                             
                             # Handle account balance updates for transfers
                             if transaction.transaction_type == 'transfer' and transaction.destination_account_id:
@@ -8009,6 +10059,8 @@ def sync_simplefin_for_user(user_id):
             
             # Commit changes for this user
             if accounts_updated > 0 or transactions_added > 0:
+                sync_expense_ledgers(added_expenses)
+                record_balance_snapshots(user_id)
                 db.session.commit()
                 
                 # Update the SimpleFin settings last_sync time
@@ -8069,47 +10121,152 @@ def create_default_mappings_route():
             'message': f'Error creating default mappings: {str(e)}'
         }), 500
     
-@app.route('/bulk_categorize_transactions', methods=['POST'])
-@login_required_dev
-def bulk_categorize_transactions():
-    """Categorize all uncategorized transactions using category mapping rules"""
-    try:
-        # Get all uncategorized transactions for the current user
-        uncategorized = Expense.query.filter_by(
-            user_id=current_user.id,
-            category_id=None
-        ).all()
-        
-        # Track statistics
-        total_count = len(uncategorized)
-        categorized_count = 0
-        
-        # Process each transaction
-        for expense in uncategorized:
-            # Skip if no description
-            if not expense.description:
-                continue
-                
-            # Try to auto-categorize
-            category_id = auto_categorize_transaction(expense.description, current_user.id)
-            
-            # If we found a category, update the transaction
-            if category_id:
-                expense.category_id = category_id
-                categorized_count += 1
-        
-        # Save all changes
+def write_expense_categories(category_id, expense_ids, connection):
+    """
+    Set category_id on the given expenses with one UPDATE.
+    Expenses categorized by someone else in the meantime are left alone.
+    Returns how many expenses were updated.
+    """
+    expenses = Expense.__table__
+    return connection.execute(
+        expenses.update()
+        .where(expenses.c.id.in_(expense_ids), expenses.c.category_id.is_(None))
+        .values(category_id=category_id)
+    ).rowcount
+
+
+def run_bulk_categorization(job_id):
+    """
+    Background job: categorize every uncategorized transaction of the job's user
+    with their mapping rules in id-ordered chunks, recording progress on the job
+    """
+    with app.app_context():
+        job = CategorizationJob.query.get(job_id)
+        if job is None:
+            return
+        user_id = job.user_id
+        batch_size = app.config['BULK_CATEGORIZE_BATCH_SIZE']
+        affected_user_ids = {user_id}
+
+        try:
+            uncategorized = db.session.query(
+                Expense.id, Expense.description, Expense.paid_by, Expense.split_with
+            ).filter(Expense.user_id == user_id, Expense.category_id.is_(None))
+
+            job.status = 'running'
+            job.total = uncategorized.count()
+            job.updated_at = datetime.utcnow()
+            db.session.commit()
+
+            # One compiled matcher for the whole run, scored with the run's own matches on top
+            matcher = category_matchers.get(user_id)
+            run_counts = {}
+            last_id = 0
+
+            # Walk the expenses in id order, like backfill_expense_rows
+            while True:
+                batch = uncategorized.filter(Expense.id > last_id).order_by(Expense.id).limit(batch_size).all()
+                if not batch:
+                    break
+
+                updates = {}  # mapping id -> (mapping, [expense ids])
+                learned = {}  # mapping id -> [(description, category_id, 1)] for this worker's classifier
+                for row in batch:
+                    if not row.description:
+                        continue
+                    # Scored with the matches so far, like categorizing one at a time
+                    mapping = matcher.best_match(row.description.strip().lower(), run_counts)
+                    if mapping is None:
+                        continue
+                    run_counts[mapping.id] = run_counts.get(mapping.id, 0) + 1
+                    updates.setdefault(mapping.id, (mapping, []))[1].append(row.id)
+                    learned.setdefault(mapping.id, []).append((row.description, mapping.category_id, 1))
+                    affected_user_ids.add(row.paid_by)
+                    if row.split_with:
+                        affected_user_ids.update(split_id.strip() for split_id in row.split_with.split(','))
+
+                # One UPDATE per mapping, so its row count is exactly the matches to record
+                learned_rows = []
+                for mapping, expense_ids in updates.values():
+                    updated = write_expense_categories(mapping.category_id, expense_ids, db.session.connection())
+                    job.categorized += updated
+                    run_counts[mapping.id] -= len(expense_ids) - updated
+                    if updated:
+                        record_category_match(user_id, mapping.id, matches=updated)
+                    # Rows someone else categorized meanwhile aren't known one by one; if the
+                    # mapping lost any, its rows reach the classifier when it is next retrained
+                    if updated == len(expense_ids):
+                        learned_rows.extend(learned[mapping.id])
+
+                job.processed += len(batch)
+                job.updated_at = datetime.utcnow()
+                # Each chunk commits on its own, together with its match counts
+                db.session.commit()
+                # The bulk UPDATE skips the session events the classifiers learn from
+                category_classifiers.learn(user_id, learned_rows)
+                last_id = batch[-1].id
+
+            job.status = 'done'
+            app.logger.info(f"Bulk categorized {job.categorized} of {job.total} transactions for user {user_id}")
+
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error bulk categorizing transactions: {str(e)}")
+            job = CategorizationJob.query.get(job_id)
+            job.status = 'failed'
+            job.error = str(e)
+
+        # Bulk updates skip the session events, so refresh what the committed chunks changed
+        bump_dashboard_versions(affected_user_ids)
+        queue_budget_total_refresh(affected_user_ids)
+        job.finished_at = job.updated_at = datetime.utcnow()
         db.session.commit()
-        
-        flash(f'Successfully categorized {categorized_count} out of {total_count} transactions!')
-        
+
+
+def queue_bulk_categorization(user_id):
+    """Start run_bulk_categorization() for a user in the scheduler, or return the run already in progress"""
+    job = CategorizationJob.query.filter_by(user_id=user_id).order_by(CategorizationJob.id.desc()).first()
+    if job and job.is_active():
+        return job
+
+    job = CategorizationJob(user_id=user_id)
+    db.session.add(job)
+    db.session.commit()
+
+    try:
+        scheduler.add_job(
+            id=f'bulk_categorize_{job.id}',
+            func=run_bulk_categorization,
+            args=[job.id],
+            trigger='date'
+        )
     except Exception as e:
-        db.session.rollback()
-        app.logger.error(f"Error bulk categorizing transactions: {str(e)}")
-        flash(f'Error: {str(e)}')
-        
+        app.logger.error(f"Error queueing bulk categorization: {str(e)}")
+        job.status = 'failed'
+        job.error = str(e)
+        db.session.commit()
+    return job
+
+
+@app.route('/bulk_categorize_transactions', methods=['POST'])
+@login_required_dev
+def bulk_categorize_transactions():
+    """Categorize all uncategorized transactions using category mapping rules, in the background"""
+    job = queue_bulk_categorization(current_user.id)
+
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return jsonify({
+            'success': job.status != 'failed',
+            'job': job.to_dict()
+        }), (500 if job.status == 'failed' else 202)
+
+    if job.status == 'failed':
+        flash(f'Error: {job.error}')
+    else:
+        flash('Categorizing your uncategorized transactions in the background. Refresh in a moment to see the results.')
+
     # Determine where to redirect based on the referrer
-    referrer = request.referrer
+    referrer = request.referrer or ''
     if 'transactions' in referrer:
         return redirect(url_for('transactions'))
     elif 'category_mappings' in referrer:
@@ -8118,6 +10275,22 @@ def bulk_categorize_transactions():
         return redirect(url_for('dashboard'))
 
 
+@app.route('/bulk_categorize_transactions/status')
+@login_required_dev
+def bulk_categorize_status():
+    """Progress of the user's latest bulk categorization, or of ?job_id="""
+    query = CategorizationJob.query.filter_by(user_id=current_user.id)
+    job_id = request.args.get('job_id', type=int)
+    if job_id:
+        job = query.filter_by(id=job_id).first()
+    else:
+        job = query.order_by(CategorizationJob.id.desc()).first()
+
+    if job is None:
+        return jsonify({'success': False, 'message': 'No bulk categorization found'}), 404
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+
 @app.route('/category_mappings/add', methods=['POST'])
 @login_required_dev
 @demo_time_limited
@@ -8229,59 +10402,27 @@ def learn_from_transaction_history():
     # Calculate start date
     start_date = datetime.utcnow() - timedelta(days=days)
     
-    # Get transactions from the specified period that have categories
-    transactions = Expense.query.filter(
+    # Stream only the columns the miner needs from the categorized transactions of the period
+    rows = db.session.query(Expense.description, Expense.category_id, Expense.amount).filter(
         Expense.user_id == current_user.id,
         Expense.date >= start_date,
         Expense.category_id.isnot(None)
-    ).all()
-    
-    # Group transactions by category and description pattern
-    patterns = {}
-    for transaction in transactions:
-        # Skip transactions without descriptions
-        if not transaction.description:
-            continue
-            
-        # Clean up description and extract a key word/phrase
-        keyword = extract_keywords(transaction.description)
-        if not keyword:
-            continue
-            
-        # Create a unique key for this keyword + category combo
-        key = f"{keyword}_{transaction.category_id}"
-        
-        if key not in patterns:
-            patterns[key] = {
-                'keyword': keyword,
-                'category_id': transaction.category_id,
-                'count': 0,
-                'total_amount': 0,
-                'transactions': []
-            }
-            
-        # Update the pattern
-        patterns[key]['count'] += 1
-        patterns[key]['total_amount'] += transaction.amount
-        patterns[key]['transactions'].append(transaction.id)
-    
-    # Find significant patterns (occurred at least 3 times)
-    significant_patterns = [p for p in patterns.values() if p['count'] >= 3]
-    
-    # Sort by frequency
-    significant_patterns.sort(key=lambda x: x['count'], reverse=True)
-    
+    ).yield_per(5000)
+
+    # Find significant patterns (occurred at least 3 times), most frequent first
+    significant_patterns = mine_category_patterns(rows, min_count=3)
+
+    # Every keyword/category pair the user already has a mapping for, in one query
+    existing = {
+        (keyword, category_id) for keyword, category_id in db.session.query(
+            CategoryMapping.keyword, CategoryMapping.category_id
+        ).filter_by(user_id=current_user.id)
+    }
+
     # Create mappings for these patterns (only if they don't already exist)
     created_count = 0
     for pattern in significant_patterns[:15]:  # Limit to top 15
-        # Check if this pattern already exists
-        existing = CategoryMapping.query.filter_by(
-            user_id=current_user.id,
-            keyword=pattern['keyword'],
-            category_id=pattern['category_id']
-        ).first()
-        
-        if not existing:
+        if (pattern['keyword'], pattern['category_id']) not in existing:
             # Create a new mapping
             mapping = CategoryMapping(
                 user_id=current_user.id,
@@ -8536,10 +10677,7 @@ def export_transactions():
         
         # Build query with SQLAlchemy
         query = Expense.query.filter(
-            or_(
-                Expense.user_id == user_id,
-                Expense.split_with.like(f'%{user_id}%')
-            )
+            Expense.id.in_(involved_expense_ids(user_id))
         )
         
         # Apply filters
@@ -8570,16 +10708,29 @@ def export_transactions():
         output = io.StringIO()
         writer = csv.writer(output)
         
+        # Amounts in the user's currency, converted for every row in one pass
+        display_currency_code = get_base_currency()['code']
+        converted_amounts = convert_many(
+            [expense.amount for expense in expenses],
+            [expense.currency_code or display_currency_code for expense in expenses],
+            display_currency_code
+        ).tolist()
+        
         # Write header row
         writer.writerow([
             'Date', 'Description', 'Amount', 'Card Used', 'Paid By', 
-            'Split Method', 'Group', 'Your Role', 'Your Share', 'Total Expense'
+            'Split Method', 'Group', 'Your Role', 'Your Share', 'Total Expense',
+            'Currency', f'Amount ({display_currency_code})'
         ])
         
+        # Calculate split info and resolve payers for every row up front
+        expense_splits = calculate_splits_batch(expenses)
+        payers_by_id = get_users_by_ids({expense.paid_by for expense in expenses})
+        
         # Write data rows
-        for expense in expenses:
+        for expense, converted_amount in zip(expenses, converted_amounts):
             # Calculate split info
-            splits = expense.calculate_splits()
+            splits = expense_splits[expense.id]
             
             # Get group name if applicable
             group_name = expense.group.name if expense.group else "No Group"
@@ -8599,7 +10750,7 @@ def export_transactions():
                         break
             
             # Find the name of who paid
-            payer = User.query.filter_by(id=expense.paid_by).first()
+            payer = payers_by_id.get(expense.paid_by)
             payer_name = payer.name if payer else expense.paid_by
             
             writer.writerow([
@@ -8612,7 +10763,9 @@ def export_transactions():
                 group_name,
                 user_role,
                 f"{user_share:.2f}",
-                f"{expense.amount:.2f}"
+                f"{expense.amount:.2f}",
+                expense.currency_code or display_currency_code,
+                f"{converted_amount:.2f}"
             ])
         
         # Rewind the string buffer
@@ -8703,7 +10856,7 @@ def add_category():
     """Add a new category or subcategory"""
     name = request.form.get('name')
     icon = request.form.get('icon', 'fa-tag')
-    color = request.form.get('color', "#6c757d")
+    color = safe_color(request.form.get('color'), "#6c757d")
     parent_id = request.form.get('parent_id')
     if parent_id == "":
         parent_id = None
@@ -8750,7 +10903,7 @@ def edit_category(category_id):
 
     category.name = request.form.get('name', category.name)
     category.icon = request.form.get('icon', category.icon)
-    category.color = request.form.get('color', category.color)
+    category.color = safe_color(request.form.get('color'), category.color)
 
     db.session.commit()
 
@@ -8798,10 +10951,16 @@ def delete_category(category_id):
         
         app.logger.info(f"Other category found: {bool(other_category)}")
         
-        # Subcategories handling
-        if category.subcategories:
-            app.logger.info(f"Handling {len(category.subcategories)} subcategories")
-            for subcategory in category.subcategories:
+        # Subcategories handling (at any depth, deepest first)
+        subcategories = Category.query.join(
+            CategoryClosure, CategoryClosure.descendant_id == Category.id
+        ).filter(
+            CategoryClosure.ancestor_id == category.id,
+            CategoryClosure.depth > 0
+        ).order_by(CategoryClosure.depth.desc()).all()
+        if subcategories:
+            app.logger.info(f"Handling {len(subcategories)} subcategories")
+            for subcategory in subcategories:
                 # Update or delete related records for subcategory
                 Expense.query.filter_by(category_id=subcategory.id).update({
                     'category_id': other_category.id if other_category else None
@@ -8825,7 +10984,9 @@ def delete_category(category_id):
         Budget.query.filter_by(category_id=category_id).update({
             'category_id': other_category.id if other_category else None
         })
+        queue_budget_total_refresh([current_user.id])
         CategoryMapping.query.filter_by(category_id=category_id).delete()
+        bump_category_rules_versions([current_user.id])
         
         # Actually delete the category
         db.session.delete(category)
@@ -8860,7 +11021,8 @@ def budgets():
     # Get all categories for the form
     categories = Category.query.filter_by(user_id=current_user.id).order_by(Category.name).all()
     
-    # Calculate budget progress for each budget
+    # Calculate budget progress for each budget (spent for all of them in a few grouped queries)
+    evaluate_budgets(user_budgets)
     budget_data = []
     total_month_budget = 0
     total_month_spent = 0
@@ -9113,6 +11275,42 @@ def get_budget(budget_id):
         }), 500
 
 
+def active_budgets_by_category():
+    """
+    {category_id: active budget} for the current user, loaded with one query and
+    evaluated in one batch the first time a request asks
+    """
+    if 'active_budgets_by_category' not in g:
+        budgets = Budget.query.filter_by(user_id=current_user.id, active=True).order_by(Budget.id).all()
+        evaluate_budgets(budgets)
+        by_category = {}
+        for budget in budgets:
+            by_category.setdefault(budget.category_id, budget)
+        g.active_budgets_by_category = by_category
+    return g.active_budgets_by_category
+
+
+def get_budget_status_for_category(category_id):
+    """Get budget status for a specific category"""
+    if not current_user.is_authenticated:
+        return None
+        
+    # Find active budget for this category
+    budget = active_budgets_by_category().get(category_id)
+    
+    if not budget:
+        return None
+        
+    return {
+        'id': budget.id,
+        'percentage': budget.get_progress_percentage(),
+        'status': budget.get_status(),
+        'amount': budget.amount,
+        'spent': budget.calculate_spent_amount(),
+        'remaining': budget.get_remaining_amount()
+    }
+
+
 def get_budget_summary():
     """Get budget summary for current user"""
     # Get all active budgets
@@ -9130,6 +11328,7 @@ def get_budget_summary():
         'alert_budgets': []  # For budgets that are over or approaching limit
     }
     
+    evaluate_budgets(active_budgets)
     for budget in active_budgets:
         status = budget.get_status()
         if status == 'over':
@@ -9197,10 +11396,13 @@ def get_subcategory_spending(budget_id):
         # Get period dates for this budget
         period_start, period_end = budget.get_current_period_dates()
         
+        # Spending of the category and everything under it in one query
+        spending = calculate_category_tree_spending(category.id, period_start, period_end)
+        
         # If this budget includes the parent category directly
         if not budget.include_subcategories:
             # Only include the parent category itself
-            spent = calculate_category_spending(category.id, period_start, period_end)
+            spent = spending.get(category.id, (0.0, 0.0))[0]
             
             subcategories.append({
                 'id': category.id,
@@ -9212,7 +11414,7 @@ def get_subcategory_spending(budget_id):
         else:
             # Include all subcategories
             for subcategory in category.subcategories:
-                spent = calculate_category_spending(subcategory.id, period_start, period_end)
+                spent = spending.get(subcategory.id, (0.0, 0.0))[0]
                 
                 subcategories.append({
                     'id': subcategory.id,
@@ -9223,7 +11425,7 @@ def get_subcategory_spending(budget_id):
                 })
                 
             # If the parent category itself has direct expenses, add it too
-            spent = calculate_category_spending(category.id, period_start, period_end, include_subcategories=False)
+            spent = spending.get(category.id, (0.0, 0.0))[1]
             
             if spent > 0:
                 subcategories.append({
@@ -9252,110 +11454,71 @@ def get_subcategory_spending(budget_id):
             'message': f'Error: {str(e)}'
         }), 500
 
-def calculate_category_spending(category_id, start_date, end_date, include_subcategories=True):
-    """Calculate total spending for a category within a date range"""
-    
-    # Get the category
-    category = Category.query.get(category_id)
-    if not category:
-        return 0
-    
-    total_spent = 0
+def calculate_category_tree_spending(category_id, start_date, end_date):
+    """
+    Spending in a category and in each of its descendants within a date range.
+    Direct expenses and category splits are summed together in one grouped query.
+
+    Returns:
+        {category_id: (spent, direct)} for every category in the tree with spending,
+        where spent includes the category's descendants and direct only what is
+        assigned to the category itself
+    """
+    subtree = category_subtree(category_id)
     
-    # 1. Get direct expenses (transactions directly assigned to this category without splits)
-    direct_expenses = Expense.query.filter(
+    # 1. Direct expenses (transactions directly assigned to a category without splits)
+    direct_amounts = select(
+        Expense.category_id.label('category_id'), expense_amount_base().label('amount')
+    ).where(
         Expense.user_id == current_user.id,
-        Expense.category_id == category_id,
+        Expense.category_id.in_(subtree),
         Expense.date >= start_date,
         Expense.date <= end_date,
         Expense.has_category_splits == False  # Important: only include non-split expenses
-    ).all()
-    
-    # Add up direct expenses
-    for expense in direct_expenses:
-        # Use amount_base if available (for currency conversion), otherwise use amount
-        amount = getattr(expense, 'amount_base', expense.amount)
-        total_spent += amount
+    )
     
-    # 2. Get category splits assigned to this category
-    category_splits = CategorySplit.query.join(Expense).filter(
+    # 2. Category splits, converted at their expense's rate
+    split_amounts = select(
+        CategorySplit.category_id.label('category_id'), in_base_currency(CategorySplit.amount).label('amount')
+    ).select_from(CategorySplit).join(
+        Expense, CategorySplit.expense_id == Expense.id
+    ).where(
         Expense.user_id == current_user.id,
-        CategorySplit.category_id == category_id,
+        CategorySplit.category_id.in_(subtree),
         Expense.date >= start_date,
         Expense.date <= end_date
-    ).all()
-    
-    # Add up split amounts
-    for split in category_splits:
-        # Use split amount directly - these should already be in the correct currency
-        total_spent += split.amount
-    
-    # 3. Include subcategories if requested and if this is a parent category
-    if include_subcategories and not category.parent_id:
-        subcategory_ids = [subcat.id for subcat in category.subcategories]
-        
-        for subcategory_id in subcategory_ids:
-            # For each subcategory, repeat the process
-            # Process direct expenses
-            subcat_direct = Expense.query.filter(
-                Expense.user_id == current_user.id,
-                Expense.category_id == subcategory_id,
-                Expense.date >= start_date,
-                Expense.date <= end_date,
-                Expense.has_category_splits == False
-            ).all()
-            
-            for expense in subcat_direct:
-                amount = getattr(expense, 'amount_base', expense.amount)
-                total_spent += amount
-            
-            # Process split expenses
-            subcat_splits = CategorySplit.query.join(Expense).filter(
-                Expense.user_id == current_user.id,
-                CategorySplit.category_id == subcategory_id,
-                Expense.date >= start_date,
-                Expense.date <= end_date
-            ).all()
-            
-            for split in subcat_splits:
-                total_spent += split.amount
+    )
+    amounts = union_all(direct_amounts, split_amounts).subquery()
+    
+    # Each amount counts towards its own category and every ancestor in the tree
+    rows = db.session.query(
+        CategoryClosure.ancestor_id,
+        func.sum(amounts.c.amount),
+        func.sum(case((CategoryClosure.depth == 0, amounts.c.amount), else_=0.0))
+    ).select_from(CategoryClosure).join(
+        amounts, amounts.c.category_id == CategoryClosure.descendant_id
+    ).filter(
+        CategoryClosure.ancestor_id.in_(subtree)
+    ).group_by(CategoryClosure.ancestor_id)
     
-    return total_spent
+    return {ancestor_id: (spent or 0.0, direct or 0.0) for ancestor_id, spent, direct in rows}
+
+def calculate_category_spending(category_id, start_date, end_date, include_subcategories=True):
+    """Calculate total spending for a category (and its descendants, at any depth) within a date range"""
+    spent, direct = calculate_category_tree_spending(category_id, start_date, end_date).get(category_id, (0.0, 0.0))
+    return spent if include_subcategories else direct
 
-# Add to utility_processor to make budget info available in templates
+# Add to utility_processor to make currency conversion available in templates
+# (get_budget_status_for_category is registered by the first utility_processor)
 @app.context_processor
 def utility_processor():
     # Previous utility functions...
     
-    def get_budget_status_for_category(category_id):
-        """Get budget status for a specific category"""
-        if not current_user.is_authenticated:
-            return None
-            
-        # Find active budget for this category
-        budget = Budget.query.filter_by(
-            user_id=current_user.id,
-            category_id=category_id,
-            active=True
-        ).first()
-        
-        if not budget:
-            return None
-            
-        return {
-            'id': budget.id,
-            'percentage': budget.get_progress_percentage(),
-            'status': budget.get_status(),
-            'amount': budget.amount,
-            'spent': budget.calculate_spent_amount(),
-            'remaining': budget.get_remaining_amount()
-        }
     def template_convert_currency(amount, from_code, to_code):
         """Make convert_currency available to templates"""
         return convert_currency(amount, from_code, to_code)
     return {
         # Previous functions...
-        'get_budget_status_for_category': get_budget_status_for_category,
         'convert_currency': template_convert_currency 
     }
 @app.context_processor
@@ -9365,6 +11528,67 @@ def inject_app_version():
         'app_version': APP_VERSION
     }
 
+def budget_monthly_rates(budgets):
+    """
+    Normalize budgets to a month once: monthly and yearly budgets give a fixed
+    amount per month, weekly ones an amount per week to scale by the month's length.
+
+    Returns:
+        (per_month, per_week)
+    """
+    per_month = sum(budget.amount for budget in budgets if budget.period == 'monthly')
+    per_month += sum(budget.amount / 12 for budget in budgets if budget.period == 'yearly')
+    per_week = sum(budget.amount for budget in budgets if budget.period == 'weekly')
+    return per_month, per_week
+
+
+def monthly_share_totals(user_id, range_start, range_end, category_ids=None):
+    """
+    The user's share (in the base currency) of their own expenses per month over
+    [range_start, range_end), optionally only in the given categories.
+    One grouped query for expenses without category splits and one for category splits.
+
+    Returns:
+        {'YYYY-MM': spent}
+    """
+    year, month = month_key_columns()
+    filters = [
+        ExpenseShare.user_id == user_id,
+        Expense.user_id == user_id,
+        Expense.date >= range_start,
+        Expense.date < range_end
+    ]
+
+    direct_rows = db.session.query(
+        year, month, func.sum(in_base_currency(ExpenseShare.amount))
+    ).select_from(ExpenseShare).join(
+        Expense, ExpenseShare.expense_id == Expense.id
+    ).filter(
+        *filters,
+        or_(Expense.has_category_splits.is_(None), Expense.has_category_splits == False),
+        *([Expense.category_id.in_(category_ids)] if category_ids is not None else [])
+    ).group_by(year, month)
+
+    # The user's part of a category split is the split amount scaled by their share of the expense
+    split_rows = db.session.query(
+        year, month, func.sum(in_base_currency(CategorySplit.amount * ExpenseShare.amount / Expense.amount))
+    ).select_from(CategorySplit).join(
+        Expense, CategorySplit.expense_id == Expense.id
+    ).join(
+        ExpenseShare, ExpenseShare.expense_id == Expense.id
+    ).filter(
+        *filters,
+        Expense.amount > 0,
+        *([CategorySplit.category_id.in_(category_ids)] if category_ids is not None else [])
+    ).group_by(year, month)
+
+    totals = {}
+    for row_year, row_month, spent in list(direct_rows) + list(split_rows):
+        month_key = format_month_key(row_year, row_month)
+        totals[month_key] = totals.get(month_key, 0.0) + (spent or 0.0)
+    return totals
+
+
 @app.route('/budgets/trends-data')
 @login_required_dev
 def budget_trends_data():
@@ -9383,179 +11607,21 @@ def budget_trends_data():
         'colors': []
     }
     
-    # Generate monthly labels
-    current_date = start_date
+    # Generate monthly labels, keeping each month's start to bucket by
+    month_starts = []
+    current_date = start_date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     while current_date <= end_date:
-        month_label = current_date.strftime('%b %Y')
-        response['labels'].append(month_label)
+        response['labels'].append(current_date.strftime('%b %Y'))
+        month_starts.append(current_date)
         current_date = (current_date.replace(day=28) + timedelta(days=4)).replace(day=1)
+    range_end = current_date
     
     # If no budget selected, return all budgets aggregated by month
     if not budget_id:
         # Get all active budgets
         budgets = Budget.query.filter_by(user_id=current_user.id, active=True).all()
         app.logger.debug(f"Found {len(budgets)} active budgets")
-        
-        # For each month, calculate total budget and spending
-        for i, month in enumerate(response['labels']):
-            month_date = datetime.strptime(month, '%b %Y')
-            month_start = month_date.replace(day=1)
-            if month_date.month == 12:
-                month_end = month_date.replace(year=month_date.year+1, month=1, day=1) - timedelta(days=1)
-            else:
-                month_end = month_date.replace(month=month_date.month+1, day=1) - timedelta(days=1)
-            
-            # Sum all budgets for this month
-            monthly_budget = 0
-            for budget in budgets:
-                if budget.period == 'monthly':
-                    monthly_budget += budget.amount
-                elif budget.period == 'yearly':
-                    monthly_budget += budget.amount / 12
-                elif budget.period == 'weekly':
-                    # Calculate weeks in this month
-                    weeks_in_month = (month_end - month_start).days / 7
-                    monthly_budget += budget.amount * weeks_in_month
-            
-            response['budget'].append(monthly_budget)
-            app.logger.debug(f"Month {month}: Budget amount = {monthly_budget}")
-            
-            # Calculate actual spending for this month
-            monthly_spent = 0
-            
-            # 1. Get regular expenses without splits (no category splits, no user splits)
-            direct_expenses = Expense.query.filter(
-                Expense.user_id == current_user.id,
-                Expense.date >= month_start,
-                Expense.date <= month_end,
-                Expense.has_category_splits == False,
-                Expense.split_with.is_(None) | (Expense.split_with == '')
-            ).all()
-            
-            # Add up direct expenses (no splits)
-            direct_total = 0
-            for expense in direct_expenses:
-                amount = getattr(expense, 'amount_base', expense.amount)
-                direct_total += amount
-            
-            monthly_spent += direct_total
-            app.logger.debug(f"Month {month}: Direct expenses (no splits) = {direct_total}")
-            
-            # 2. Get expenses that have user splits but no category splits
-            user_split_expenses = Expense.query.filter(
-                Expense.user_id == current_user.id,
-                Expense.date >= month_start,
-                Expense.date <= month_end,
-                Expense.has_category_splits == False,
-                Expense.split_with.isnot(None) & (Expense.split_with != '')
-            ).all()
-            
-            # Calculate user's portion for each user split expense
-            user_split_total = 0
-            for expense in user_split_expenses:
-                # Get split information with error handling
-                try:
-                    split_info = expense.calculate_splits()
-                    if not split_info:
-                        continue
-                    
-                    # Calculate user's portion
-                    user_amount = 0
-                    
-                    # Check if user is payer and not in split list
-                    if expense.paid_by == current_user.id and (
-                        not expense.split_with or 
-                        current_user.id not in expense.split_with.split(',')
-                    ):
-                        user_amount = split_info['payer']['amount']
-                    else:
-                        # Look for user in splits
-                        for split in split_info['splits']:
-                            if split['email'] == current_user.id:
-                                user_amount = split['amount']
-                                break
-                    
-                    user_split_total += user_amount
-                    
-                except Exception as e:
-                    app.logger.error(f"Error calculating splits for expense {expense.id}: {str(e)}")
-                    # Fallback: Just divide by number of participants (including payer)
-                    participants = 1  # Start with payer
-                    if expense.split_with:
-                        participants += len(expense.split_with.split(','))
-                    
-                    if participants > 0:
-                        user_split_total += expense.amount / participants
-            
-            monthly_spent += user_split_total
-            app.logger.debug(f"Month {month}: User split expenses = {user_split_total}")
-            
-            # 3. Get expenses with category splits
-            split_expenses = Expense.query.filter(
-                Expense.user_id == current_user.id,
-                Expense.date >= month_start,
-                Expense.date <= month_end,
-                Expense.has_category_splits == True
-            ).all()
-            
-            # Process each split expense
-            category_split_total = 0
-            for split_expense in split_expenses:
-                # Get category splits for this expense
-                category_splits = CategorySplit.query.filter_by(expense_id=split_expense.id).all()
-                
-                # Calculate the base amount from category splits
-                split_amount = sum(split.amount for split in category_splits)
-                
-                # If expense also has user splits, calculate user's portion
-                if split_expense.split_with and split_expense.split_with.strip():
-                    try:
-                        split_info = split_expense.calculate_splits()
-                        if not split_info:
-                            # If no split info, treat as full amount
-                            category_split_total += split_amount
-                            continue
-                        
-                        # Calculate user's percentage of the total expense
-                        user_percentage = 0
-                        
-                        # Check if user is payer and not in split list
-                        if split_expense.paid_by == current_user.id and current_user.id not in split_expense.split_with.split(','):
-                            user_percentage = split_info['payer']['amount'] / split_expense.amount if split_expense.amount > 0 else 0
-                        else:
-                            # Look for user in splits
-                            for split in split_info['splits']:
-                                if split['email'] == current_user.id:
-                                    user_percentage = split['amount'] / split_expense.amount if split_expense.amount > 0 else 0
-                                    break
-                        
-                        # Apply user's percentage to the category amount
-                        category_split_total += split_amount * user_percentage
-                        
-                    except Exception as e:
-                        app.logger.error(f"Error calculating splits for expense {split_expense.id}: {str(e)}")
-                        # Fallback: Just divide by number of participants
-                        participants = 1  # Start with payer
-                        if split_expense.split_with:
-                            participants += len(split_expense.split_with.split(','))
-                        
-                        if participants > 0:
-                            category_split_total += split_amount / participants
-                else:
-                    # No user splits, use the full category split amount
-                    category_split_total += split_amount
-            
-            monthly_spent += category_split_total
-            app.logger.debug(f"Month {month}: Category split expenses = {category_split_total}")
-            
-            # Add the calculated amounts to the response
-            response['actual'].append(monthly_spent)
-            
-            # Set color based on whether spending exceeds budget
-            color = '#ef4444' if monthly_spent > monthly_budget else '#22c55e'
-            response['colors'].append(color)
-            
-            app.logger.debug(f"Month {month}: Total monthly spent = {monthly_spent}")
+        category_ids = None
     else:
         # Get specific budget
         budget = Budget.query.get_or_404(budget_id)
@@ -9565,187 +11631,25 @@ def budget_trends_data():
             return jsonify({'error': 'Unauthorized'}), 403
         
         app.logger.debug(f"Processing trends for single budget {budget_id}: {budget.name or 'Unnamed'}, amount={budget.amount}")
+        budgets = [budget]
+        category_ids = category_subtree(budget.category_id) if budget.include_subcategories else [budget.category_id]
+    
+    # Every month's spending at once, bucketed by month in SQL
+    per_month, per_week = budget_monthly_rates(budgets)
+    spent_by_month = monthly_share_totals(current_user.id, month_starts[0], range_end, category_ids)
+    
+    for month_start, month_end in zip(month_starts, month_starts[1:] + [range_end]):
+        monthly_budget = per_month + per_week * (month_end - month_start).days / 7
+        monthly_spent = spent_by_month.get(month_start.strftime('%Y-%m'), 0.0)
         
-        # Process each month
-        for i, month in enumerate(response['labels']):
-            month_date = datetime.strptime(month, '%b %Y')
-            month_start = month_date.replace(day=1)
-            if month_date.month == 12:
-                month_end = month_date.replace(year=month_date.year+1, month=1, day=1) - timedelta(days=1)
-            else:
-                month_end = month_date.replace(month=month_date.month+1, day=1) - timedelta(days=1)
-            
-            # Get budget amount for this month
-            monthly_budget = 0
-            if budget.period == 'monthly':
-                monthly_budget = budget.amount
-            elif budget.period == 'yearly':
-                monthly_budget = budget.amount / 12
-            elif budget.period == 'weekly':
-                # Calculate weeks in this month
-                weeks_in_month = (month_end - month_start).days / 7
-                monthly_budget = budget.amount * weeks_in_month
-                
-            response['budget'].append(monthly_budget)
-            app.logger.debug(f"Month {month}: Budget amount = {monthly_budget}")
-            
-            # Create list of categories to include
-            category_ids = [budget.category_id]
-            if budget.include_subcategories and budget.category:
-                category_ids.extend([subcat.id for subcat in budget.category.subcategories])
-            
-            # Calculate spending for this category
-            monthly_spent = 0
-            
-            # 1. Get direct expenses (not split by category, not split by user)
-            direct_expenses = Expense.query.filter(
-                Expense.user_id == current_user.id,
-                Expense.date >= month_start,
-                Expense.date <= month_end,
-                Expense.category_id.in_(category_ids),
-                Expense.has_category_splits == False,
-                Expense.split_with.is_(None) | (Expense.split_with == '')
-            ).all()
-            
-            # Add up direct expenses
-            direct_total = 0
-            for expense in direct_expenses:
-                amount = getattr(expense, 'amount_base', expense.amount)
-                direct_total += amount
-            
-            monthly_spent += direct_total
-            app.logger.debug(f"Month {month}: Direct expenses (no splits) = {direct_total}")
-            
-            # 2. Get expenses with user splits but not category splits
-            user_split_expenses = Expense.query.filter(
-                Expense.user_id == current_user.id,
-                Expense.date >= month_start,
-                Expense.date <= month_end,
-                Expense.category_id.in_(category_ids),
-                Expense.has_category_splits == False,
-                Expense.split_with.isnot(None) & (Expense.split_with != '')
-            ).all()
-            
-            # Process user split expenses
-            user_split_total = 0
-            for expense in user_split_expenses:
-                try:
-                    # Get split information
-                    split_info = expense.calculate_splits()
-                    if not split_info:
-                        continue
-                    
-                    # Calculate user's portion
-                    user_amount = 0
-                    
-                    # Check if user is payer and not in split list
-                    if expense.paid_by == current_user.id and (
-                        not expense.split_with or 
-                        current_user.id not in expense.split_with.split(',')
-                    ):
-                        user_amount = split_info['payer']['amount']
-                    else:
-                        # Look for user in splits
-                        for split in split_info['splits']:
-                            if split['email'] == current_user.id:
-                                user_amount = split['amount']
-                                break
-                    
-                    user_split_total += user_amount
-                    
-                except Exception as e:
-                    app.logger.error(f"Error calculating splits for expense {expense.id}: {str(e)}")
-                    # Fallback: Just divide by number of participants (including payer)
-                    participants = 1  # Start with payer
-                    if expense.split_with:
-                        participants += len(expense.split_with.split(','))
-                    
-                    if participants > 0:
-                        user_split_total += expense.amount / participants
-            
-            monthly_spent += user_split_total
-            app.logger.debug(f"Month {month}: User split expenses = {user_split_total}")
-            
-            # 3. Get category splits for these categories
-            category_splits = CategorySplit.query.join(Expense).filter(
-                Expense.user_id == current_user.id,
-                Expense.date >= month_start,
-                Expense.date <= month_end,
-                CategorySplit.category_id.in_(category_ids)
-            ).all()
-            
-            # Group by expense to avoid double counting
-            expense_splits = {}
-            for split in category_splits:
-                if split.expense_id not in expense_splits:
-                    expense_splits[split.expense_id] = []
-                expense_splits[split.expense_id].append(split)
-            
-            # Process each expense with category splits
-            category_split_total = 0
-            for expense_id, splits in expense_splits.items():
-                try:
-                    # Get the expense
-                    expense = Expense.query.get(expense_id)
-                    if not expense:
-                        continue
-                    
-                    # Calculate total relevant split amount
-                    relevant_amount = sum(split.amount for split in splits)
-                    
-                    # If expense also has user splits, calculate user's portion
-                    if expense.split_with and expense.split_with.strip():
-                        split_info = expense.calculate_splits()
-                        if not split_info:
-                            # If no split info, treat as full amount
-                            category_split_total += relevant_amount
-                            continue
-                        
-                        # Calculate user's percentage of the total expense
-                        user_percentage = 0
-                        
-                        # Check if user is payer and not in split list
-                        if expense.paid_by == current_user.id and current_user.id not in expense.split_with.split(','):
-                            user_percentage = split_info['payer']['amount'] / expense.amount if expense.amount > 0 else 0
-                        else:
-                            # Look for user in splits
-                            for split in split_info['splits']:
-                                if split['email'] == current_user.id:
-                                    user_percentage = split['amount'] / expense.amount if expense.amount > 0 else 0
-                                    break
-                        
-                        # Apply user's percentage to the category amount
-                        user_portion = relevant_amount * user_percentage
-                        category_split_total += user_portion
-                        app.logger.debug(f"Expense {expense_id}: User percentage {user_percentage}, Amount {relevant_amount}, User portion {user_portion}")
-                        
-                    else:
-                        # No user splits, use the full category split amount
-                        category_split_total += relevant_amount
-                        
-                except Exception as e:
-                    app.logger.error(f"Error processing expense {expense_id} with category splits: {str(e)}")
-                    # Fallback: Just divide by number of participants
-                    expense = Expense.query.get(expense_id)
-                    if expense and expense.split_with:
-                        participants = 1 + len(expense.split_with.split(','))
-                        relevant_amount = sum(split.amount for split in splits)
-                        category_split_total += relevant_amount / participants
-                    else:
-                        # If no split info or can't get expense, add full amount
-                        category_split_total += sum(split.amount for split in splits)
-            
-            monthly_spent += category_split_total
-            app.logger.debug(f"Month {month}: Category split expenses = {category_split_total}")
-            
-            # Add the calculated amounts to the response
-            response['actual'].append(monthly_spent)
-            
-            # Set color based on whether spending exceeds budget
-            color = '#ef4444' if monthly_spent > monthly_budget else '#22c55e'
-            response['colors'].append(color)
-            
-            app.logger.debug(f"Month {month}: Total monthly spent = {monthly_spent}, Budget = {monthly_budget}")
+        response['budget'].append(monthly_budget)
+        response['actual'].append(monthly_spent)
+        
+        # Set color based on whether spending exceeds budget
+        color = '#ef4444' if monthly_spent > monthly_budget else '#22c55e'
+        response['colors'].append(color)
+        
+        app.logger.debug(f"Month {month_start.strftime('%b %Y')}: Total monthly spent = {monthly_spent}, Budget = {monthly_budget}")
             
     # Debug log the final response data
     app.logger.debug(f"Budget trends response: labels={response['labels']}")
@@ -9774,9 +11678,7 @@ def budget_transactions(budget_id):
     transactions = []
     
     # Create list of categories to include
-    category_ids = [budget.category_id]
-    if budget.include_subcategories and budget.category:
-        category_ids.extend([subcat.id for subcat in budget.category.subcategories])
+    category_ids = category_subtree(budget.category_id) if budget.include_subcategories else [budget.category_id]
     
     # 1. Get expenses directly assigned to these categories (not split by category)
     direct_expenses = Expense.query.filter(
@@ -9802,6 +11704,11 @@ def budget_transactions(budget_id):
         reverse=True
     )[:50]  # Limit to 50 transactions
     
+    # Calculate user splits for every listed transaction at once
+    all_expense_splits = calculate_splits_batch(
+        [expense for expense in all_expenses if expense.split_with and expense.split_with.strip()]
+    )
+    
     # Format transactions for the response
     for expense in all_expenses:
         # Initialize basic transaction info
@@ -9816,7 +11723,7 @@ def budget_transactions(budget_id):
         }
         
         # Get split information if needed
-        split_info = expense.calculate_splits() if transaction['has_user_splits'] else None
+        split_info = all_expense_splits[expense.id] if transaction['has_user_splits'] else None
         
         # Handle amount based on split type
         if expense.has_category_splits:
@@ -9947,7 +11854,7 @@ def budget_summary_data():
         
         # Calculate totals
         total_budget = sum(budget.amount for budget in monthly_budgets)
-        total_spent = sum(budget.calculate_spent_amount() for budget in monthly_budgets)
+        total_spent = sum(evaluate_budgets(monthly_budgets).values())
         
         # Get budgets with their data
         budget_data = []
@@ -10121,36 +12028,21 @@ def generate_monthly_report_data(user_id, year, month):
     base_currency = get_base_currency()
     currency_symbol = base_currency['symbol'] if isinstance(base_currency, dict) else base_currency.symbol
     
-    # Get user's expenses for the month
-    query_filters = [
-        or_(
-            Expense.user_id == user_id,
-            Expense.split_with.like(f'%{user_id}%')
-        ),
+    # Get user's expenses for the month along with their share of each (in the base currency)
+    expense_rows = db.session.query(Expense, in_base_currency(ExpenseShare.amount)).join(
+        ExpenseShare, ExpenseShare.expense_id == Expense.id
+    ).filter(
+        ExpenseShare.user_id == user_id,
+        ExpenseShare.amount > 0,
         Expense.date >= start_date,
         Expense.date <= end_date
-    ]
-    
-    expenses_raw = Expense.query.filter(and_(*query_filters)).order_by(Expense.date).all()
+    ).order_by(Expense.date).all()
     
     # Calculate user's portion of expenses
     expenses = []
     total_spent = 0
     
-    for expense in expenses_raw:
-        # Calculate splits
-        splits = expense.calculate_splits()
-        
-        # Get user's portion
-        user_portion = 0
-        if expense.paid_by == user_id:
-            user_portion = splits['payer']['amount']
-        else:
-            for split in splits['splits']:
-                if split['email'] == user_id:
-                    user_portion = split['amount']
-                    break
-        
+    for expense, user_portion in expense_rows:
         if user_portion > 0:
             expenses.append({
                 'id': expense.id,
@@ -10165,12 +12057,11 @@ def generate_monthly_report_data(user_id, year, month):
     budgets = Budget.query.filter_by(user_id=user_id, active=True).all()
     budget_status = []
     
+    # Spending of each budget in its period ending the month, from the recorded period totals
+    period_spent = budget_period_spent(budgets, day=end_date)
+    
     for budget in budgets:
-        # Calculate budget status for this specific month
-        spent = 0
-        for expense in expenses:
-            if hasattr(expense, 'category_id') and expense.category_id == budget.category_id:
-                spent += expense['amount']
+        spent = period_spent[budget.id]
         
         percentage = (spent / budget.amount * 100) if budget.amount > 0 else 0
         status = 'under'
@@ -10238,31 +12129,11 @@ def generate_monthly_report_data(user_id, year, month):
     else:
         prev_end_date = datetime(prev_year, prev_month + 1, 1) - timedelta(days=1)
     
-    prev_query_filters = [
-        or_(
-            Expense.user_id == user_id,
-            Expense.split_with.like(f'%{user_id}%')
-        ),
+    prev_total = expense_share_query(
+        user_id,
         Expense.date >= prev_start_date,
         Expense.date <= prev_end_date
-    ]
-    
-    prev_expenses = Expense.query.filter(and_(*prev_query_filters)).all()
-    prev_total = 0
-    
-    for expense in prev_expenses:
-        splits = expense.calculate_splits()
-        user_portion = 0
-        
-        if expense.paid_by == user_id:
-            user_portion = splits['payer']['amount']
-        else:
-            for split in splits['splits']:
-                if split['email'] == user_id:
-                    user_portion = split['amount']
-                    break
-        
-        prev_total += user_portion
+    ).scalar()
     
     # Calculate spending trend
     if prev_total > 0:
@@ -10597,15 +12468,12 @@ def financial_utility_processor():
         
         # Get regular account balances
         accounts = Account.query.filter_by(user_id=user_id).all()
-        for account in accounts:
-            balance = account.balance or 0
-            
-            # Convert to user currency if needed
-            if account.currency_code and account.currency_code != user_currency_code:
-                converted_balance = convert_currency(balance, account.currency_code, user_currency_code)
-            else:
-                converted_balance = balance
-            
+        converted_balances = convert_many(
+            [account.balance or 0 for account in accounts],
+            [account.currency_code or user_currency_code for account in accounts],
+            user_currency_code
+        ).tolist()
+        for account, converted_balance in zip(accounts, converted_balances):
             # Add to appropriate total
             if account.type in ['checking', 'savings', 'investment'] and converted_balance > 0:
                 account_assets += converted_balance
@@ -11530,10 +13398,7 @@ def stats():
     
     # Build the filter query - only expenses where user is involved
     query_filters = [
-        or_(
-            Expense.user_id == current_user.id,
-            Expense.split_with.like(f'%{current_user.id}%')
-        ),
+        Expense.id.in_(involved_expense_ids(current_user.id)),
         Expense.date >= start_date,
         Expense.date <= end_date
     ]
@@ -11585,9 +13450,11 @@ def stats():
         else:
             current_date = current_date.replace(month=current_date.month + 1)
     
+    expense_splits = calculate_splits_batch(expenses)
+    
     for expense in expenses:
         # Calculate splits for this expense
-        splits = expense.calculate_splits()
+        splits = expense_splits[expense.id]
         
         # Create a record of the user's portion only
         user_portion = 0
@@ -11602,6 +13469,9 @@ def stats():
                     user_portion = split['amount']
                     break
         
+        # Totals are kept in the base currency
+        user_portion *= expense.base_factor
+        
         # Only add to list if user has a portion
         if user_portion > 0:
             expense_data = {
@@ -11667,34 +13537,11 @@ def stats():
             
     # Calculate spending trend compared to previous period
     previous_period_start = start_date - (end_date - start_date)
-    previous_period_filters = [
-        or_(
-            Expense.user_id == current_user.id,
-            Expense.split_with.like(f'%{current_user.id}%')
-        ),
+    previous_total = expense_share_query(
+        current_user.id,
         Expense.date >= previous_period_start,
         Expense.date < start_date
-    ]
-    
-    # Initialize previous_total before querying
-    previous_total = 0
-    
-    previous_expenses = Expense.query.filter(and_(*previous_period_filters)).all()
-    
-    # Process previous expenses and calculate total
-    for expense in previous_expenses:
-        splits = expense.calculate_splits()
-        user_portion = 0
-        
-        if expense.paid_by == current_user.id:
-            user_portion = splits['payer']['amount']
-        else:
-            for split in splits['splits']:
-                if split['email'] == current_user.id:
-                    user_portion = split['amount']
-                    break
-        
-        previous_total += user_portion
+    ).scalar()
     
     # Then calculate spending trend
     if previous_total > 0:
@@ -11763,7 +13610,7 @@ def stats():
     chronological_items = []
     
     for expense in expenses:
-        splits = expense.calculate_splits()
+        splits = expense_splits[expense.id]
         
         # If current user paid
         if expense.paid_by == current_user.id:
@@ -11868,6 +13715,7 @@ def stats():
         }
         
         # Calculate totals per actual category and monthly trends
+        top_level_ids = top_level_category_ids(current_user.id)
         for expense_data in current_user_expenses:
             # Get category ID, default to uncategorized
             cat_id = uncategorized_id
@@ -11882,10 +13730,10 @@ def stats():
                 cat_id = expense_obj.category_id
                 app.logger.info(f"Found category_id: {cat_id}")
                 
-                # If it's a subcategory, use parent category ID instead
-                category = Category.query.get(cat_id)
-                if category and category.parent_id and category.parent_id in user_categories:
-                    cat_id = category.parent_id
+                # If it's a subcategory (at any depth), use its top-level category instead
+                top_level_id = top_level_ids.get(cat_id)
+                if top_level_id is not None and top_level_id != cat_id and top_level_id in user_categories:
+                    cat_id = top_level_id
                     app.logger.info(f"Using parent category: {cat_id}")
             
             # Only process if we have this category
@@ -12152,20 +14000,14 @@ def handle_comparison_request():
     
     # Get expenses for both periods - reuse your existing query logic
     primary_query_filters = [
-        or_(
-            Expense.user_id == current_user.id,
-            Expense.split_with.like(f'%{current_user.id}%')
-        ),
+        Expense.id.in_(involved_expense_ids(current_user.id)),
         Expense.date >= primary_start_date,
         Expense.date <= primary_end_date
     ]
     primary_expenses_raw = Expense.query.filter(and_(*primary_query_filters)).order_by(Expense.date).all()
     
     comparison_query_filters = [
-        or_(
-            Expense.user_id == current_user.id,
-            Expense.split_with.like(f'%{current_user.id}%')
-        ),
+        Expense.id.in_(involved_expense_ids(current_user.id)),
         Expense.date >= comparison_start_date,
         Expense.date <= comparison_end_date
     ]
@@ -12177,9 +14019,12 @@ def handle_comparison_request():
     primary_total = 0
     comparison_total = 0
     
+    primary_splits = calculate_splits_batch(primary_expenses_raw)
+    comparison_splits = calculate_splits_batch(comparison_expenses_raw)
+    
     # Process primary period expenses
     for expense in primary_expenses_raw:
-        splits = expense.calculate_splits()
+        splits = primary_splits[expense.id]
         user_portion = 0
         
         if expense.paid_by == current_user.id:
@@ -12205,7 +14050,7 @@ def handle_comparison_request():
     
     # Process comparison period expenses
     for expense in comparison_expenses_raw:
-        splits = expense.calculate_splits()
+        splits = comparison_splits[expense.id]
         user_portion = 0
         
         if expense.paid_by == current_user.id:
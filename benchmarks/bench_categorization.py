@@ -0,0 +1,106 @@
+"""
+Benchmark auto-categorization with and without the naive Bayes fallback.
+
+Seeds a categorized history of synthetic bank descriptions (some for merchants
+the default mapping rules know, most for merchants only the history knows),
+then categorizes a held-out set with the mapping rules alone and with rules
+plus the classifier, reporting throughput, how many rows got a category and
+how many of those were right, e.g.:
+
+    python benchmarks/bench_categorization.py --history 5000 50000 --test 5000
+"""
+import argparse
+import random
+import string
+import time
+
+from bench_utils import load_app, reset_database
+
+
+def merchant_name(rng):
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 9)))
+
+
+def build_catalog(app_module, user_id, rng, merchants_per_category=15):
+    """(description template, category_id) pairs: every rule keyword plus made-up merchants per category"""
+    catalog = [
+        (mapping.keyword.upper() + ' {}', mapping.category_id)
+        for mapping in app_module.CategoryMapping.query.filter_by(user_id=user_id, is_regex=False)
+    ]
+    for category in app_module.Category.query.filter_by(user_id=user_id):
+        for _ in range(merchants_per_category):
+            name = f'{merchant_name(rng)} {merchant_name(rng)}'.upper()
+            catalog.append((f'POS PURCHASE {name} #{{}}', category.id))
+    return catalog
+
+
+def describe(rng, template):
+    return template.format(rng.randint(1000, 99999))
+
+
+def run_case(label, categorize, test_rows):
+    start = time.perf_counter()
+    predictions = [categorize(description) for description, _ in test_rows]
+    elapsed = time.perf_counter() - start
+
+    covered = sum(1 for prediction in predictions if prediction)
+    correct = sum(1 for prediction, (_, truth) in zip(predictions, test_rows) if prediction == truth)
+    print(f"{label:<24} {len(test_rows) / elapsed:>12.0f} {covered / len(test_rows):>10.1%} "
+          f"{correct / max(covered, 1):>10.1%} {correct / len(test_rows):>10.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--history', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--test', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    app_module = load_app()
+    app = app_module.app
+    db = app_module.db
+
+    for size in args.history:
+        with app.app_context():
+            reset_database(app_module)
+            user_id = 'bench@example.com'
+            db.session.add(app_module.User(id=user_id, name='Bench', password_hash=''))
+            db.session.commit()
+            app_module.create_default_categories(user_id)
+            app_module.create_default_category_mappings(user_id)
+
+            rng = random.Random(args.seed)
+            catalog = build_catalog(app_module, user_id, rng)
+            history = [rng.choice(catalog) for _ in range(size)]
+            db.session.bulk_insert_mappings(app_module.Expense, [
+                {
+                    'description': describe(rng, template), 'category_id': category_id, 'amount': 10.0,
+                    'date': app_module.datetime.utcnow(), 'card_used': 'Bench', 'split_method': 'equal',
+                    'paid_by': user_id, 'user_id': user_id
+                }
+                for template, category_id in history
+            ])
+            db.session.commit()
+            test_rows = [(describe(rng, template), category_id) for template, category_id in
+                         (rng.choice(catalog) for _ in range(args.test))]
+
+            # Each size starts from a fresh database, so nothing cached for the user still applies
+            app_module.category_matchers.entries.clear()
+            app_module.category_classifiers.entries.clear()
+            start = time.perf_counter()
+            app_module.category_classifiers.get(user_id)
+            train_seconds = time.perf_counter() - start
+
+            print(f"\n{size} categorized transactions ({len(catalog)} merchants, trained in {train_seconds:.2f}s)")
+            print(f"{'case':<24} {'rows/s':>12} {'coverage':>10} {'precision':>10} {'accuracy':>10}")
+            run_case('rules only', lambda description: app_module.auto_categorize_transaction(description, user_id), test_rows)
+            run_case('rules + classifier', lambda description: (
+                app_module.auto_categorize_transaction(description, user_id)
+                or app_module.predict_category(description, user_id)
+            ), test_rows)
+            # Drop the match counts the rules recorded; nothing here is meant to be kept
+            db.session.rollback()
+
+
+if __name__ == '__main__':
+    main()
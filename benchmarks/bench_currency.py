@@ -0,0 +1,53 @@
+"""
+Benchmark bulk currency conversion.
+
+Converts the same column of amounts in mixed currencies with a per-row
+convert_currency() loop and with a single convert_many() call, checks that
+both agree and reports the speed-up, e.g.:
+
+    python benchmarks/bench_currency.py --rows 100000
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from bench_utils import load_app, measure, print_results, reset_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    app_module = load_app()
+    with app_module.app.app_context():
+        reset_database(app_module)
+        # Include a code the table doesn't know, which must pass through unchanged
+        codes = [currency.code for currency in app_module.Currency.query.all()] + ['XXX']
+        to_code = 'EUR'
+
+        rng = random.Random(args.seed)
+        for size in args.rows:
+            amounts = [round(rng.uniform(1, 500), 2) for _ in range(size)]
+            from_codes = [rng.choice(codes) for _ in range(size)]
+
+            results = []
+            start = time.perf_counter()
+            with measure(app_module, 'convert_currency() per row', results):
+                looped = [app_module.convert_currency(amount, code, to_code) for amount, code in zip(amounts, from_codes)]
+            loop_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            with measure(app_module, 'convert_many()', results):
+                vectorized = app_module.convert_many(amounts, from_codes, to_code)
+            vector_seconds = time.perf_counter() - start
+
+            assert np.allclose(looped, vectorized), 'convert_many() disagrees with convert_currency()'
+            print_results(f'{size} rows ({loop_seconds / vector_seconds:.1f}x faster)', results)
+
+
+if __name__ == '__main__':
+    main()
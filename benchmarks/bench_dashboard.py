@@ -0,0 +1,91 @@
+"""
+Benchmark the /dashboard page and its activity feed against growing histories.
+
+For each history size it seeds a fresh database, fills the expense ledgers and
+then times the dashboard render, the first activity page and a page deep in
+the history, reporting HTML/JSON payload sizes alongside, e.g.:
+
+    python benchmarks/bench_dashboard.py --sizes 1000 10000 100000
+
+With the grouped aggregates and keyset-paginated feed, time and payload should
+stay roughly flat as the history grows.
+"""
+import argparse
+import time
+
+from bench_utils import load_app, print_results, reset_database, seed_users, seed_expenses, QueryCounter
+
+
+def fill_ledgers(app_module, batch_size=5000):
+    """Build expense_shares and expense_participants for every seeded expense"""
+    db = app_module.db
+    Expense = app_module.Expense
+    last_id = 0
+    while True:
+        batch = Expense.query.filter(Expense.id > last_id).order_by(Expense.id).limit(batch_size).all()
+        if not batch:
+            break
+        db.session.bulk_insert_mappings(app_module.ExpenseShare, app_module.build_expense_share_rows(batch))
+        db.session.bulk_insert_mappings(app_module.ExpenseParticipant, app_module.build_expense_participant_rows(batch))
+        db.session.commit()
+        last_id = batch[-1].id
+        db.session.expunge_all()
+
+
+def timed_get(app_module, client, label, url, results):
+    """GET a url, recording time, query count and response size"""
+    counter = QueryCounter(app_module.db.engine)
+    start = time.perf_counter()
+    with counter:
+        response = client.get(url)
+    elapsed = time.perf_counter() - start
+    assert response.status_code == 200, f'{url} returned {response.status_code}'
+    results.append((f'{label} ({len(response.data) // 1024} KB)', elapsed, counter.count))
+    return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--users', type=int, default=5)
+    parser.add_argument('--deep-pages', type=int, default=20)
+    args = parser.parse_args()
+
+    app_module = load_app()
+    app = app_module.app
+    app.config['TESTING'] = True
+    db = app_module.db
+
+    for size in args.sizes:
+        with app.app_context():
+            reset_database(app_module)
+            dev_user_id = app_module.DEV_USER_EMAIL
+            user_ids = seed_users(app_module, args.users)
+            db.session.add(app_module.User(id=dev_user_id, name='Developer', is_admin=True))
+            db.session.commit()
+
+            start = time.perf_counter()
+            seed_expenses(app_module, [dev_user_id] + user_ids, size, owner_id=dev_user_id)
+            fill_ledgers(app_module)
+            print(f'\nSeeded {size} expenses with ledgers in {time.perf_counter() - start:.1f}s')
+
+        client = app.test_client()
+        results = []
+        timed_get(app_module, client, 'GET /dashboard', '/dashboard', results)
+        timed_get(app_module, client, 'GET /dashboard (warm)', '/dashboard', results)
+        page = timed_get(app_module, client, 'GET /dashboard/activity', '/dashboard/activity', results).json
+
+        # Walk the feed, then time the page reached after --deep-pages pages
+        for _ in range(args.deep_pages - 1):
+            if not page['next_cursor']:
+                break
+            page = client.get(f"/dashboard/activity?cursor={page['next_cursor']}").json
+        if page['next_cursor']:
+            timed_get(app_module, client, f'activity page {args.deep_pages + 1}',
+                      f"/dashboard/activity?cursor={page['next_cursor']}", results)
+
+        print_results(f'{size} expenses', results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark the `split_with LIKE '%user%'` membership filter against the
+indexed expense_participants table.
+
+For each sampled user it prints the query plan of both filters and the time
+to count and fetch the ids of the expenses that user is involved in, e.g.:
+
+    python benchmarks/bench_expense_participants.py --rows 1000000
+
+Pass --database-uri to run against PostgreSQL instead of SQLite (the tables
+in that database are dropped and recreated).
+"""
+import argparse
+import time
+
+from sqlalchemy import or_, text
+
+from bench_utils import load_app, print_results, reset_database, seed_users, seed_expenses
+
+
+def explain(app_module, query):
+    """Return the database's query plan for an ORM query"""
+    engine = app_module.db.engine
+    sql = str(query.statement.compile(dialect=engine.dialect, compile_kwargs={'literal_binds': True}))
+    prefix = 'EXPLAIN QUERY PLAN ' if engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    rows = app_module.db.session.execute(text(prefix + sql)).fetchall()
+    return '\n'.join('    ' + str(row[-1]) for row in rows)
+
+
+def timed(results, label, func, repeat):
+    """Run func `repeat` times and record the best wall time"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    results.append((label, best, 1))
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--sample-users', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--database-uri', default=None)
+    args = parser.parse_args()
+
+    app_module = load_app(database_uri=args.database_uri)
+    db = app_module.db
+    Expense = app_module.Expense
+
+    with app_module.app.app_context():
+        reset_database(app_module)
+        user_ids = seed_users(app_module, args.users)
+
+        start = time.perf_counter()
+        seed_expenses(app_module, user_ids, args.rows)
+        print(f'Seeded {args.rows} expenses in {time.perf_counter() - start:.1f}s')
+
+        # Populate participants the same way the backfill command does
+        start = time.perf_counter()
+        last_id = 0
+        while True:
+            batch = db.session.query(Expense.id, Expense.user_id, Expense.split_with).filter(
+                Expense.id > last_id
+            ).order_by(Expense.id).limit(20000).all()
+            if not batch:
+                break
+            db.session.bulk_insert_mappings(
+                app_module.ExpenseParticipant, app_module.build_expense_participant_rows(batch)
+            )
+            db.session.commit()
+            last_id = batch[-1].id
+        participant_count = app_module.ExpenseParticipant.query.count()
+        print(f'Built {participant_count} participant rows in {time.perf_counter() - start:.1f}s')
+
+        if db.engine.dialect.name == 'postgresql':
+            db.session.execute(text('ANALYZE'))
+            db.session.commit()
+
+        # user0 pays most seeded expenses, so sample the more typical users after it
+        for user_id in user_ids[1:1 + args.sample_users]:
+            like_query = db.session.query(Expense.id).filter(
+                or_(Expense.user_id == user_id, Expense.split_with.like(f'%{user_id}%'))
+            )
+            indexed_query = db.session.query(Expense.id).filter(
+                Expense.id.in_(app_module.involved_expense_ids(user_id))
+            )
+
+            print(f'\nPlan for {user_id}, split_with LIKE:')
+            print(explain(app_module, like_query))
+            print(f'Plan for {user_id}, expense_participants:')
+            print(explain(app_module, indexed_query))
+
+            results = []
+            like_count = timed(results, 'LIKE: count', like_query.count, args.repeat)
+            indexed_count = timed(results, 'participants: count', indexed_query.count, args.repeat)
+            timed(results, 'LIKE: fetch ids', like_query.all, args.repeat)
+            timed(results, 'participants: fetch ids', indexed_query.all, args.repeat)
+            print_results(f'{user_id}: {indexed_count} expenses (LIKE matched {like_count})', results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark the group settlement planner.
+
+Part one times plan_settlements() alone on random net balances. Part two
+builds synthetic groups with many shared expenses and times
+calculate_group_settlement_plan(), i.e. the grouped balance query plus the
+planner. Both report how many transfers the plan needs compared with
+settling every pairwise IOU directly, e.g.:
+
+    python benchmarks/bench_settlement_planner.py --members 10 100 500 --expenses 100000
+"""
+import argparse
+import random
+import time
+
+from bench_utils import load_app, measure, print_results, reset_database, seed_users, seed_expenses
+
+
+def check_plan(net_balances, transfers):
+    """Make sure applying the transfers leaves every member within a cent of zero"""
+    remaining = dict(net_balances)
+    for payer_id, receiver_id, amount in transfers:
+        remaining[payer_id] += amount
+        remaining[receiver_id] -= amount
+    worst = max((abs(amount) for amount in remaining.values()), default=0)
+    assert worst < 0.01 * len(remaining), f'plan leaves {worst:.2f} unsettled'
+
+
+def bench_planner(plan_settlements, sizes, seed):
+    rng = random.Random(seed)
+    results = []
+    for size in sizes:
+        net_balances = {f'user{i}': round(rng.uniform(-500, 500), 2) for i in range(size - 1)}
+        net_balances[f'user{size - 1}'] = -round(sum(net_balances.values()), 2)
+
+        start = time.perf_counter()
+        transfers = plan_settlements(net_balances)
+        elapsed = time.perf_counter() - start
+
+        check_plan(net_balances, transfers)
+        results.append((f'{size} members: {len(transfers)} transfers', elapsed, 0))
+    print_results('plan_settlements() on random balances', results)
+
+
+def bench_groups(app_module, member_counts, expense_count):
+    db = app_module.db
+    for member_count in member_counts:
+        reset_database(app_module)
+        user_ids = seed_users(app_module, member_count)
+
+        group = app_module.Group(name='Benchmark group', created_by=user_ids[0])
+        group.members = app_module.User.query.all()
+        db.session.add(group)
+        db.session.commit()
+
+        seed_expenses(app_module, user_ids, expense_count, group_id=group.id)
+
+        # Build the pair balances straight from history rather than one expense at a time
+        start = time.perf_counter()
+        deltas = app_module.compute_pair_balances_from_history(batch_size=5000)
+        rows = []
+        for (user_id, other_user_id), amount in deltas.items():
+            rows.append({'user_id': user_id, 'other_user_id': other_user_id, 'amount': amount})
+            rows.append({'user_id': other_user_id, 'other_user_id': user_id, 'amount': -amount})
+        db.session.bulk_insert_mappings(app_module.UserPairBalance, rows)
+        db.session.commit()
+        print(f'\n{member_count} members: built {len(deltas)} pair balances in {time.perf_counter() - start:.1f}s')
+
+        results = []
+        with measure(app_module, 'calculate_group_settlement_plan()', results):
+            plan = app_module.calculate_group_settlement_plan(group)
+
+        net_balances = {balance['user_id']: balance['amount'] for balance in plan['balances']}
+        check_plan(net_balances, [
+            (transfer['payer_id'], transfer['receiver_id'], transfer['amount'])
+            for transfer in plan['transfers']
+        ])
+
+        pairwise = sum(1 for amount in deltas.values() if abs(amount) > 0.01)
+        print_results(
+            f'{member_count} members, {expense_count} expenses: '
+            f'{len(plan["transfers"])} transfers instead of {pairwise} pairwise IOUs',
+            results
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--members', type=int, nargs='+', default=[10, 100, 500])
+    parser.add_argument('--expenses', type=int, default=100000)
+    parser.add_argument('--planner-sizes', type=int, nargs='+', default=[10, 100, 500, 5000, 50000])
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    app_module = load_app()
+    bench_planner(app_module.plan_settlements, args.planner_sizes, args.seed)
+
+    with app_module.app.app_context():
+        bench_groups(app_module, args.members, args.expenses)
+
+
+if __name__ == '__main__':
+    main()
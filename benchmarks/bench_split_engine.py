@@ -0,0 +1,50 @@
+"""
+Benchmark per-expense calculate_splits() against calculate_splits_batch().
+
+Reports wall time and the number of SQL statements issued for each
+expense count, e.g.:
+
+    python benchmarks/bench_split_engine.py --sizes 1000 10000 50000
+"""
+import argparse
+
+from bench_utils import load_app, measure, print_results, reset_database, seed_users, seed_expenses
+
+
+def legacy_calculate_splits(app_module, expense):
+    """The pre-batch lookup pattern: one user query for the payer and one per participant"""
+    User = app_module.User
+    User.query.filter_by(id=expense.paid_by).first()
+    for user_id in (expense.split_with.split(',') if expense.split_with else []):
+        User.query.filter_by(id=user_id.strip()).first()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--users', type=int, default=10)
+    args = parser.parse_args()
+
+    app_module = load_app()
+    with app_module.app.app_context():
+        for size in args.sizes:
+            reset_database(app_module)
+            user_ids = seed_users(app_module, args.users)
+            seed_expenses(app_module, user_ids, size)
+            expenses = app_module.Expense.query.all()
+
+            results = []
+            with measure(app_module, 'legacy user lookups (N+1)', results):
+                for expense in expenses:
+                    legacy_calculate_splits(app_module, expense)
+            with measure(app_module, 'calculate_splits() per expense', results):
+                for expense in expenses:
+                    expense.calculate_splits()
+            with measure(app_module, 'calculate_splits_batch()', results):
+                app_module.calculate_splits_batch(expenses)
+
+            print_results(f'{size} expenses, {args.users} users', results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""
+Shared helpers for the benchmark scripts in this directory.
+
+Each benchmark runs against a throwaway SQLite database so it can be run
+without touching the real application database:
+
+    python benchmarks/bench_split_engine.py --sizes 1000 10000
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+# Add app directory to path so we can import app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def load_app(db_path=None, database_uri=None):
+    """
+    Import the application bound to a scratch database.
+    Defaults to a temporary SQLite file; pass database_uri to benchmark against
+    another server (its tables are dropped and recreated).
+    """
+    if database_uri is None:
+        if db_path is None:
+            handle, db_path = tempfile.mkstemp(prefix='dollardollar_bench_', suffix='.db')
+            os.close(handle)
+        database_uri = f'sqlite:///{db_path}'
+    os.environ['SQLALCHEMY_DATABASE_URI'] = database_uri
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    import app as app_module
+    return app_module
+
+
+class QueryCounter:
+    """Count SQL statements executed on an engine while the context is active"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _before_cursor_execute(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        from sqlalchemy import event
+        event.listen(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        return self
+
+    def __exit__(self, *exc):
+        from sqlalchemy import event
+        event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        return False
+
+
+@contextmanager
+def measure(app_module, label, results):
+    """Record elapsed time and query count for the wrapped block"""
+    counter = QueryCounter(app_module.db.engine)
+    start = time.perf_counter()
+    with counter:
+        yield
+    elapsed = time.perf_counter() - start
+    results.append((label, elapsed, counter.count))
+
+
+def print_results(title, results):
+    print(f"\n{title}")
+    print(f"{'case':<48} {'seconds':>10} {'queries':>10}")
+    for label, elapsed, queries in results:
+        print(f"{label:<48} {elapsed:>10.3f} {queries:>10}")
+
+
+def reset_database(app_module):
+    db = app_module.db
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    app_module.init_default_currencies()
+
+
+def seed_users(app_module, count):
+    """Create `count` users and return their ids"""
+    db = app_module.db
+    user_ids = [f'user{i}@example.com' for i in range(count)]
+    db.session.bulk_insert_mappings(app_module.User, [
+        {'id': user_id, 'name': f'User {i}', 'password_hash': ''}
+        for i, user_id in enumerate(user_ids)
+    ])
+    db.session.commit()
+    return user_ids
+
+
+def seed_expenses(app_module, user_ids, count, owner_id=None, seed=42, days=730, group_id=None):
+    """
+    Insert `count` expenses shared between random subsets of `user_ids`.
+    Roughly a third use each split method so every code path is exercised.
+    """
+    rng = random.Random(seed)
+    db = app_module.db
+    owner_id = owner_id or user_ids[0]
+    now = datetime.utcnow()
+    rows = []
+    for i in range(count):
+        participants = rng.sample(user_ids, rng.randint(1, min(4, len(user_ids))))
+        paid_by = owner_id if rng.random() < 0.6 else rng.choice(user_ids)
+        split_with = [user_id for user_id in participants if user_id != paid_by]
+        amount = round(rng.uniform(1, 500), 2)
+        method = ('equal', 'percentage', 'custom')[i % 3]
+        split_details = None
+        if method != 'equal' and split_with:
+            everyone = split_with + [paid_by]
+            if method == 'percentage':
+                values = {user_id: 100.0 / len(everyone) for user_id in everyone}
+            else:
+                values = {user_id: amount / len(everyone) for user_id in everyone}
+            import json
+            split_details = json.dumps({'type': method, 'values': values})
+        elif method != 'equal':
+            method = 'equal'
+        rows.append({
+            'description': f'Expense {i}',
+            'amount': amount,
+            'original_amount': amount,
+            'currency_code': 'USD',
+            'date': now - timedelta(days=rng.randint(0, days), minutes=rng.randint(0, 1440)),
+            'card_used': rng.choice(['Visa', 'Amex', 'Debit']),
+            'split_method': method,
+            'split_value': 0,
+            'split_details': split_details,
+            'paid_by': paid_by,
+            'user_id': paid_by,
+            'split_with': ','.join(split_with) if split_with else None,
+            'transaction_type': 'expense',
+            'has_category_splits': False,
+            'group_id': group_id,
+        })
+        if len(rows) >= 5000:
+            db.session.bulk_insert_mappings(app_module.Expense, rows)
+            rows = []
+    if rows:
+        db.session.bulk_insert_mappings(app_module.Expense, rows)
+    db.session.commit()
@@ -0,0 +1,214 @@
+import re
+import threading
+import time
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r'[a-z]{2,}')
+
+# Words that say nothing about where money went
+STOP_WORDS = frozenset({
+    'the', 'an', 'and', 'or', 'but', 'on', 'in', 'with', 'for', 'to', 'from', 'by', 'at', 'of',
+    'pos', 'purchase', 'debit', 'credit', 'card', 'payment', 'transaction', 'ref', 'inc', 'llc', 'co'
+})
+
+
+def tokenize(description):
+    """Lowercase word tokens of a description, without numbers and stop words"""
+    if not description:
+        return []
+    return [token for token in TOKEN_PATTERN.findall(description.lower()) if token not in STOP_WORDS]
+
+
+class NaiveBayesCategoryModel:
+    """
+    Multinomial naive Bayes over description tokens
+    Token counts per category are held in a float32 (categories x vocabulary)
+    array that grows as new tokens and categories show up, so the model can be
+    trained once from history and then updated one transaction at a time.
+    Predicting reads only the columns of the description's tokens and scores
+    every category with a single dot product.
+    """
+
+    def __init__(self, alpha=0.1):
+        """
+        Args:
+            alpha: Additive (Laplace) smoothing of the token counts
+        """
+        self.alpha = alpha
+        self.vocabulary = {}  # Token -> column
+        self.category_ids = []  # Row -> category id
+        self.category_rows = {}  # Category id -> row
+        self.token_counts = np.zeros((8, 256), dtype=np.float32)
+        self.token_totals = np.zeros(8, dtype=np.float64)  # Tokens seen per category
+        self.document_counts = np.zeros(8, dtype=np.float64)  # Transactions seen per category
+        self.documents = 0
+
+    def category_row(self, category_id):
+        row = self.category_rows.get(category_id)
+        if row is None:
+            row = len(self.category_ids)
+            if row == self.token_counts.shape[0]:
+                self.token_counts = np.vstack([self.token_counts, np.zeros_like(self.token_counts)])
+                self.token_totals = np.concatenate([self.token_totals, np.zeros_like(self.token_totals)])
+                self.document_counts = np.concatenate([self.document_counts, np.zeros_like(self.document_counts)])
+            self.category_rows[category_id] = row
+            self.category_ids.append(category_id)
+        return row
+
+    def token_column(self, token):
+        column = self.vocabulary.get(token)
+        if column is None:
+            column = len(self.vocabulary)
+            if column == self.token_counts.shape[1]:
+                self.token_counts = np.hstack([self.token_counts, np.zeros_like(self.token_counts)])
+            self.vocabulary[token] = column
+        return column
+
+    def learn(self, tokens, category_id, weight=1):
+        """Add one categorized description (weight -1 takes a previously learned one back out)"""
+        if not tokens or category_id is None:
+            return
+        if weight < 0 and category_id not in self.category_rows:
+            return
+        row = self.category_row(category_id)
+        columns = [self.token_column(token) for token in tokens]
+        np.add.at(self.token_counts[row], columns, weight)
+
+        # Counts never go below zero, even if history changed since it was learned
+        np.maximum(self.token_counts[row], 0, out=self.token_counts[row])
+        self.token_totals[row] = max(0.0, self.token_totals[row] + weight * len(columns))
+        self.document_counts[row] = max(0.0, self.document_counts[row] + weight)
+        self.documents = max(0, self.documents + weight)
+
+    def learn_many(self, documents):
+        """Learn (tokens, category_id) pairs with one scatter-add, for training from history"""
+        rows, columns = [], []
+        for tokens, category_id in documents:
+            if not tokens or category_id is None:
+                continue
+            row = self.category_row(category_id)
+            rows.extend([row] * len(tokens))
+            columns.extend(self.token_column(token) for token in tokens)
+            self.document_counts[row] += 1
+            self.documents += 1
+        if rows:
+            np.add.at(self.token_counts, (rows, columns), 1)
+            np.add.at(self.token_totals, rows, 1)
+
+    def predict(self, tokens):
+        """(category_id, probability) of the most likely category, or None without known tokens"""
+        columns = [self.vocabulary[token] for token in tokens if token in self.vocabulary]
+        if not columns or not self.documents:
+            return None
+        columns, frequencies = np.unique(columns, return_counts=True)
+
+        # Read each array once, so a concurrent learn() that grows them can't mix shapes
+        token_counts, token_totals, document_counts = self.token_counts, self.token_totals, self.document_counts
+        rows = len(self.category_ids)
+        known = document_counts[:rows] > 0
+        log_prior = np.log(np.where(known, document_counts[:rows], 1.0) / max(self.documents, 1))
+        log_likelihood = (
+            np.log(token_counts[:rows, columns] + self.alpha)
+            - np.log(token_totals[:rows] + self.alpha * len(self.vocabulary))[:, None]
+        )
+        scores = np.where(known, log_prior + log_likelihood @ frequencies, -np.inf)
+
+        best = int(np.argmax(scores))
+        probabilities = np.exp(scores - scores[best])
+        return self.category_ids[best], float(1.0 / probabilities.sum())
+
+
+class CategoryClassifierCache:
+    """
+    Trained classifiers per user, shared by the threads of a worker
+    A user's model is trained from their categorized history on first use and
+    retrained when their categorization rules version moves (e.g. a category was
+    deleted) or the model is older than max_age. In between, transactions this
+    worker commits are learned incrementally.
+    """
+
+    def __init__(self, load_history, load_version, check_interval=5, max_age=3600, max_users=64):
+        """
+        Args:
+            load_history: Callable(user_id) returning (description, category_id) rows
+            load_version: Callable(user_id) returning the user's rules version
+            check_interval: Seconds between version checks for a user
+            max_age: Seconds before a model is retrained from history, picking up
+                     what other workers learned
+            max_users: Models kept before the least recently trained is dropped
+        """
+        self.load_history = load_history
+        self.load_version = load_version
+        self.check_interval = check_interval
+        self.max_age = max_age
+        self.max_users = max_users
+
+        self.entries = {}  # user_id -> [model, version, checked_at, trained_at]
+        self.lock = threading.Lock()
+
+        # Stats for monitoring (per process)
+        self.stats = {
+            'trainings': 0,
+            'version_checks': 0,
+            'updates': 0
+        }
+
+    def train(self, user_id):
+        model = NaiveBayesCategoryModel()
+        model.learn_many((tokenize(description), category_id) for description, category_id in self.load_history(user_id))
+        self.stats['trainings'] += 1
+        return model
+
+    def get(self, user_id):
+        """The user's trained model, retrained if it is stale"""
+        now = time.monotonic()
+        entry = self.entries.get(user_id)
+        if entry is not None and now - entry[3] < self.max_age:
+            if entry[2] is not None and now - entry[2] < self.check_interval:
+                return entry[0]
+
+            version = self.load_version(user_id)
+            self.stats['version_checks'] += 1
+            if entry[1] == version:
+                entry[2] = now
+                return entry[0]
+        else:
+            version = self.load_version(user_id)
+
+        model = self.train(user_id)
+        with self.lock:
+            self.entries.pop(user_id, None)
+            self.entries[user_id] = [model, version, now, now]
+            while len(self.entries) > self.max_users:
+                self.entries.pop(next(iter(self.entries)))
+        return model
+
+    def learn(self, user_id, changes):
+        """
+        Apply committed (description, category_id, weight) changes to a user's model,
+        if this worker has one; otherwise they are part of its history when trained
+        """
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return
+        with self.lock:
+            for description, category_id, weight in changes:
+                entry[0].learn(tokenize(description), category_id, weight)
+        self.stats['updates'] += len(changes)
+
+    def invalidate(self, user_id=None):
+        """Force a version check for one user (None means every user) before the next prediction"""
+        with self.lock:
+            for key in ([user_id] if user_id is not None else list(self.entries)):
+                if key in self.entries:
+                    self.entries[key][2] = None
+
+    def get_stats(self):
+        """Get cache stats"""
+        return {
+            'users': len(self.entries),
+            'trainings': self.stats['trainings'],
+            'version_checks': self.stats['version_checks'],
+            'updates': self.stats['updates']
+        }
@@ -0,0 +1,261 @@
+import re
+import threading
+import time
+from collections import deque
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over a set of literal keywords
+    One pass over a text finds every keyword it contains, however many keywords
+    there are, instead of one substring search per keyword.
+    """
+
+    def __init__(self, keywords):
+        """
+        Args:
+            keywords: Iterable of non-empty strings
+        """
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]  # Keywords ending at each state, including via fail links
+        self.keywords = []
+
+        for keyword in dict.fromkeys(keywords):
+            self.add(keyword)
+        self.link()
+
+    def add(self, keyword):
+        state = 0
+        for char in keyword:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = next_state
+        self.output[state].append(len(self.keywords))
+        self.keywords.append(keyword)
+
+    def link(self):
+        # Breadth-first, so a state's fail target is always linked before the state
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def first_positions(self, text):
+        """{keyword: index of its first occurrence} for every keyword found in text"""
+        positions = {}
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for keyword_index in self.output[state]:
+                keyword = self.keywords[keyword_index]
+                if keyword not in positions:
+                    positions[keyword] = index - len(keyword) + 1
+        return positions
+
+
+class MappingRule:
+    """
+    The parts of a CategoryMapping the matcher scores, as loaded when the matcher
+    was built; never changed afterwards, since matchers are shared between threads
+    """
+    __slots__ = ('id', 'keyword', 'category_id', 'is_regex', 'priority', 'match_count')
+
+    def __init__(self, id, keyword, category_id, is_regex, priority, match_count):
+        self.id = id
+        self.keyword = keyword
+        self.category_id = category_id
+        self.is_regex = bool(is_regex)
+        self.priority = priority or 0
+        self.match_count = match_count or 0
+
+
+class CategoryMatcher:
+    """
+    A user's active category mappings, compiled once
+    Literal keywords (and regexes that don't compile, which fall back to substring
+    matching) go into one keyword automaton; valid regexes are combined into a single
+    alternation that rules out non-matching descriptions in one search before the
+    individual patterns are tried.
+    """
+    BACKREFERENCE = re.compile(r'\\[1-9]|\(\?P=')
+
+    def __init__(self, rules):
+        """
+        Args:
+            rules: MappingRules
+        """
+        self.rules = list(rules)
+        self.literal_rules = {}  # Lowercased keyword -> rules using it
+        self.always_rules = []  # Empty keywords match every description
+        self.regex_rules = []  # (rule, compiled pattern)
+
+        for rule in self.rules:
+            if rule.is_regex:
+                try:
+                    self.regex_rules.append((rule, re.compile(rule.keyword, re.IGNORECASE)))
+                    continue
+                except re.error:
+                    pass  # If regex is invalid, fall back to simple substring search
+            keyword = rule.keyword.lower()
+            if keyword:
+                self.literal_rules.setdefault(keyword, []).append(rule)
+            else:
+                self.always_rules.append(rule)
+
+        self.automaton = KeywordAutomaton(self.literal_rules)
+
+        # Patterns with backreferences or inline flags can't share one regex, so they are always tried
+        self.union_rules = []
+        self.standalone_rules = []
+        for rule, pattern in self.regex_rules:
+            if self.BACKREFERENCE.search(pattern.pattern) or not self.compiles(f'(?:{pattern.pattern})'):
+                self.standalone_rules.append((rule, pattern))
+            else:
+                self.union_rules.append((rule, pattern))
+
+        self.regex_union = None
+        if self.union_rules:
+            self.regex_union = self.compiles('|'.join(f'(?:{pattern.pattern})' for _, pattern in self.union_rules))
+            if self.regex_union is None:  # e.g. the same group name in two patterns
+                self.standalone_rules += self.union_rules
+                self.union_rules = []
+
+    @staticmethod
+    def compiles(pattern):
+        """The compiled pattern, or None if it doesn't compile"""
+        try:
+            return re.compile(pattern, re.IGNORECASE)
+        except re.error:
+            return None
+
+    def score(self, rule, position, match_count):
+        """
+        Match score based on:
+        1. Priority (user-defined importance)
+        2. Usage count (previous successful matches)
+        3. Keyword length (longer keywords are more specific)
+        4. Keyword position (earlier in the string is better, simple keywords only)
+        """
+        score = (rule.priority * 100) + (match_count * 10) + len(rule.keyword)
+        if not rule.is_regex:
+            if position == 0:  # Matches at the start
+                score += 50
+            elif position > 0:  # Adjust based on how early it appears
+                score += max(0, 30 - position)
+        return score
+
+    def matches(self, description, pending=None):
+        """
+        (rule, score, match_count) for every rule matching an already lowercased description.
+        pending: {mapping id: matches} counted since the matcher was built
+        """
+        pending = pending or {}
+        found = [(rule, 0) for rule in self.always_rules]
+
+        for keyword, position in self.automaton.first_positions(description).items():
+            found.extend((rule, position) for rule in self.literal_rules[keyword])
+
+        # One search rules out all of the combined patterns when none of them match
+        regex_rules = self.standalone_rules
+        if self.union_rules and self.regex_union.search(description):
+            regex_rules = self.union_rules + regex_rules
+        found.extend((rule, -1) for rule, pattern in regex_rules if pattern.search(description))
+
+        scored = []
+        for rule, position in found:
+            match_count = rule.match_count + pending.get(rule.id, 0)
+            scored.append((rule, self.score(rule, position, match_count), match_count))
+        return scored
+
+    def best_match(self, description, pending=None):
+        """The highest scoring rule for a description, or None (see matches() for pending)"""
+        best = None
+        for rule, score, match_count in self.matches(description, pending):
+            # Ties go to higher priority, then more matches, then the older mapping
+            key = (score, rule.priority, match_count, -rule.id)
+            if best is None or key > best[0]:
+                best = (key, rule)
+        return best[1] if best else None
+
+
+class CategoryMatcherCache:
+    """
+    Compiled matchers per user, shared by the threads of a worker
+    A cached matcher is rebuilt when the user's version stamp moved - it changes
+    with every write to their mappings, match counts included (checked at most
+    once per check interval), so categorizing a whole import normally costs no
+    mapping queries.
+    """
+
+    def __init__(self, load_rules, load_version, check_interval=5, max_users=256):
+        """
+        Args:
+            load_rules: Callable(user_id) returning the user's active MappingRules
+            load_version: Callable(user_id) returning the user's version stamp
+            check_interval: Seconds between version checks for a user
+            max_users: Matchers kept before the least recently built is dropped
+        """
+        self.load_rules = load_rules
+        self.load_version = load_version
+        self.check_interval = check_interval
+        self.max_users = max_users
+
+        self.entries = {}  # user_id -> [matcher, version, checked_at]
+        self.lock = threading.Lock()
+
+        # Stats for monitoring (per process)
+        self.stats = {
+            'builds': 0,
+            'version_checks': 0
+        }
+
+    def invalidate(self, user_id=None):
+        """Force a version check for one user (None means every user) before the next match"""
+        with self.lock:
+            for key in ([user_id] if user_id is not None else list(self.entries)):
+                if key in self.entries:
+                    self.entries[key][2] = None
+
+    def get(self, user_id):
+        """The user's compiled matcher, rebuilt if their mappings changed"""
+        now = time.monotonic()
+        entry = self.entries.get(user_id)
+        if entry is not None and entry[2] is not None and now - entry[2] < self.check_interval:
+            return entry[0]
+
+        version = self.load_version(user_id)
+        self.stats['version_checks'] += 1
+        if entry is not None and entry[1] == version:
+            entry[2] = now
+            return entry[0]
+
+        matcher = CategoryMatcher(self.load_rules(user_id))
+        self.stats['builds'] += 1
+        with self.lock:
+            self.entries.pop(user_id, None)
+            self.entries[user_id] = [matcher, version, now]
+            while len(self.entries) > self.max_users:
+                self.entries.pop(next(iter(self.entries)))
+        return matcher
+
+    def get_stats(self):
+        """Get cache stats"""
+        return {
+            'users': len(self.entries),
+            'builds': self.stats['builds'],
+            'version_checks': self.stats['version_checks']
+        }
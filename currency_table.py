@@ -0,0 +1,175 @@
+import threading
+import time
+from bisect import bisect_right
+
+import numpy as np
+
+
+class RateHistoryIndex:
+    """
+    Historical rates held as sorted per-currency arrays
+    Answers "rate in force on date D" (the latest rate on or before D) with a
+    binary search, so a lookup is O(log n) in the length of the history.
+    """
+
+    def __init__(self, rows):
+        """
+        Args:
+            rows: Iterable of (code, date, rate_to_base), sorted by code then date
+        """
+        self.days = {}
+        self.rates = {}
+        for code, day, rate_to_base in rows:
+            self.days.setdefault(code, []).append(day.toordinal())
+            self.rates.setdefault(code, []).append(rate_to_base)
+
+    def rate_on(self, code, day):
+        """Rate of `code` on `day` (a date or datetime), or None before its first entry"""
+        days = self.days.get(code)
+        if not days:
+            return None
+        position = bisect_right(days, day.toordinal()) - 1
+        return self.rates[code][position] if position >= 0 else None
+
+    def size(self):
+        return sum(len(days) for days in self.days.values())
+
+
+class CurrencyRateTable:
+    """
+    Process-wide copy of the currencies table used by convert_currency
+    Every write to the currencies table bumps a shared version stamp; each worker
+    compares its copy against that stamp (at most once per check interval) and
+    reloads when it changed, so a conversion is normally a dict lookup and a multiply.
+    """
+
+    def __init__(self, load_rates, load_version, load_history=None, check_interval=5):
+        """
+        Args:
+            load_rates: Callable returning ({code: rate_to_base}, base_code)
+            load_version: Callable returning the current shared version stamp
+            load_history: Callable returning (code, date, rate_to_base) rows sorted
+                          by code and date, for conversions as of a past date
+            check_interval: Seconds between version checks
+        """
+        self.load_rates = load_rates
+        self.load_version = load_version
+        self.load_history = load_history
+        self.check_interval = check_interval
+
+        self.rates = {}
+        self.base_code = None
+        self.history = None  # Built on the first as-of lookup
+        self.version = None
+        self.checked_at = None
+        self.lock = threading.Lock()
+
+        # Stats for monitoring (per process)
+        self.stats = {
+            'loads': 0,
+            'version_checks': 0
+        }
+
+    def invalidate(self):
+        """Force a version check before the next conversion"""
+        self.checked_at = None
+
+    def ensure_current(self):
+        """Reload the rates if the shared version moved since the last check"""
+        now = time.monotonic()
+        if self.checked_at is not None and now - self.checked_at < self.check_interval:
+            return
+
+        with self.lock:
+            if self.checked_at is not None and now - self.checked_at < self.check_interval:
+                return  # Another thread checked while we waited
+
+            version = self.load_version()
+            self.stats['version_checks'] += 1
+            if version != self.version or self.checked_at is None:
+                self.rates, self.base_code = self.load_rates()
+                self.history = None
+                self.version = version
+                self.stats['loads'] += 1
+            self.checked_at = now
+
+    def base_currency_code(self):
+        """Code of the base currency, or None if there is none"""
+        self.ensure_current()
+        return self.base_code
+
+    def rate_to_base(self, code, on_date=None):
+        """
+        How much of the base currency equals 1 unit of `code`, on `on_date` if given.
+        Falls back to the current rate when the history has nothing that early.
+        """
+        if code == self.base_code:
+            return 1.0
+        if on_date is not None and self.load_history is not None:
+            history = self.history
+            if history is None:
+                with self.lock:
+                    if self.history is None:
+                        self.history = RateHistoryIndex(self.load_history())
+                    history = self.history
+            rate = history.rate_on(code, on_date)
+            if rate is not None:
+                return rate
+        return self.rates[code]
+
+    def convert(self, amount, from_code, to_code, on_date=None):
+        """Convert an amount from one currency to another, at the rates of on_date if given"""
+        if from_code == to_code:
+            return amount
+
+        self.ensure_current()
+        rates, base_code = self.rates, self.base_code
+
+        if from_code not in rates or to_code not in rates:
+            return amount  # Return original if either currency not found
+        if base_code is None:
+            return amount  # Cannot convert without a base currency
+
+        # rate_to_base is how much of the base currency equals 1 unit of a currency
+        amount_in_base = amount if from_code == base_code else amount * self.rate_to_base(from_code, on_date)
+        if to_code == base_code:
+            return amount_in_base
+        return amount_in_base / self.rate_to_base(to_code, on_date)
+
+    def factor(self, from_code, to_code, on_date=None):
+        """Multiplier that convert() applies to an amount in from_code"""
+        rates, base_code = self.rates, self.base_code
+        if from_code == to_code or from_code not in rates or to_code not in rates or base_code is None:
+            return 1.0
+        to_base = self.rate_to_base(from_code, on_date)
+        return to_base if to_code == base_code else to_base / self.rate_to_base(to_code, on_date)
+
+    def convert_many(self, amounts, from_codes, to_code):
+        """
+        Convert a whole column of amounts at once
+        from_codes is either one currency code for every amount or a sequence with
+        one code per amount. Returns a float array with the same results as calling
+        convert() on each amount.
+        """
+        amounts = np.asarray(amounts, dtype=float)
+        self.ensure_current()
+
+        if isinstance(from_codes, str) or from_codes is None:
+            return amounts * self.factor(from_codes, to_code)
+
+        # Rate vector with one factor per distinct currency, indexed by code for each row
+        index = {code: position for position, code in enumerate(set(from_codes))}
+        factors = np.array([self.factor(code, to_code) for code in index], dtype=float)
+        rows = np.fromiter(map(index.__getitem__, from_codes), dtype=np.intp, count=len(amounts))
+        return amounts * factors[rows]
+
+    def get_stats(self):
+        """Get table stats"""
+        return {
+            'currencies': len(self.rates),
+            'base_code': self.base_code,
+            'version': self.version,
+            'history_rates': self.history.size() if self.history is not None else None,
+            'loads': self.stats['loads'],
+            'version_checks': self.stats['version_checks']
+        }
@@ -0,0 +1,177 @@
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+
+
+class LRUCacheBackend:
+    """
+    In-process LRU store
+    Fast, but every gunicorn worker keeps its own copy of the entries
+    """
+    name = 'memory'
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def set(self, key, user_id, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            count = len(self.entries)
+            self.entries.clear()
+        return count
+
+    def size(self):
+        return len(self.entries)
+
+
+class DatabaseCacheBackend:
+    """
+    Entries stored as JSON in a database table, shared by every worker
+    Writes go through their own connection so they never commit the caller's session.
+    """
+    name = 'database'
+
+    def __init__(self, get_engine, table):
+        """
+        Args:
+            get_engine: Callable returning the SQLAlchemy engine (resolved per call
+                        because Flask-SQLAlchemy only exposes it in an app context)
+            table: Table with cache_key, user_id, payload and created_at columns
+        """
+        self.get_engine = get_engine
+        self.table = table
+
+    def get(self, key):
+        with self.get_engine().connect() as connection:
+            row = connection.execute(
+                select(self.table.c.payload).where(self.table.c.cache_key == key)
+            ).first()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, user_id, value):
+        try:
+            with self.get_engine().begin() as connection:
+                # Entries for older versions can never be read again, so a user keeps one row
+                connection.execute(self.table.delete().where(self.table.c.user_id == user_id))
+                connection.execute(self.table.insert().values(
+                    cache_key=key,
+                    user_id=user_id,
+                    payload=json.dumps(value),
+                    created_at=datetime.utcnow()
+                ))
+        except IntegrityError:
+            # Another worker stored the same entry first
+            pass
+
+    def clear(self):
+        with self.get_engine().begin() as connection:
+            return connection.execute(self.table.delete()).rowcount
+
+    def size(self):
+        with self.get_engine().connect() as connection:
+            return connection.execute(select(func.count()).select_from(self.table)).scalar()
+
+
+class NullCacheBackend:
+    """Backend that stores nothing, for turning the cache off"""
+    name = 'none'
+
+    def get(self, key):
+        return None
+
+    def set(self, key, user_id, value):
+        pass
+
+    def clear(self):
+        return 0
+
+    def size(self):
+        return 0
+
+
+class DashboardCache:
+    """
+    Cache for the computed dashboard summary of each user
+    Entries are keyed by user, the user's data version and the day, so bumping the
+    version on every write (or the date changing) makes stale entries unreachable
+    instead of having to find and delete them.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+        # Stats for monitoring (per process)
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'errors': 0
+        }
+
+    def make_key(self, user_id, version, day):
+        return f"dashboard:{user_id}:{version}:{day}"
+
+    def get(self, user_id, version, day):
+        """Return the cached summary or None"""
+        try:
+            value = self.backend.get(self.make_key(user_id, version, day))
+        except Exception:
+            # A broken cache must never break the dashboard
+            self.stats['errors'] += 1
+            value = None
+
+        if value is None:
+            self.stats['misses'] += 1
+        else:
+            self.stats['hits'] += 1
+        return value
+
+    def set(self, user_id, version, day, value):
+        try:
+            self.backend.set(self.make_key(user_id, version, day), user_id, value)
+        except Exception:
+            self.stats['errors'] += 1
+
+    def clear(self):
+        return self.backend.clear()
+
+    def get_stats(self):
+        """Get cache stats"""
+        total_requests = self.stats['hits'] + self.stats['misses']
+        hit_rate = (self.stats['hits'] / total_requests * 100) if total_requests > 0 else 0
+
+        return {
+            'backend': self.backend.name,
+            'hits': self.stats['hits'],
+            'misses': self.stats['misses'],
+            'errors': self.stats['errors'],
+            'hit_rate': f"{hit_rate:.2f}%",
+            'entries': self.backend.size()
+        }
+
+
+def create_dashboard_cache(backend_name, get_engine=None, table=None, max_entries=512):
+    """Build a DashboardCache for the configured backend ('memory', 'database' or 'none')"""
+    if backend_name == 'database':
+        return DashboardCache(DatabaseCacheBackend(get_engine, table))
+    if backend_name == 'none':
+        return DashboardCache(NullCacheBackend())
+    return DashboardCache(LRUCacheBackend(max_entries=max_entries))
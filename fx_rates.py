@@ -0,0 +1,108 @@
+import re
+from datetime import date, datetime, timedelta
+
+
+def date_chunks(start, end, chunk_days=90):
+    """Split [start, end] into consecutive (chunk_start, chunk_end) ranges of at most chunk_days"""
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end)
+        yield chunk_start, chunk_end
+        chunk_start = chunk_end + timedelta(days=1)
+
+
+def parse_timeseries(payload, codes=None):
+    """
+    Turn a Frankfurter time-series response into (code, date, rate_to_base) rows
+
+    The API quotes how many units of each currency one unit of the base buys,
+    while rate_to_base is the inverse (base units per one unit of the currency).
+    Only codes in `codes` are kept when it is given.
+    """
+    rows = []
+    for day, quotes in (payload.get('rates') or {}).items():
+        day = datetime.strptime(day, '%Y-%m-%d').date()
+        for code, quote in quotes.items():
+            if codes is not None and code not in codes:
+                continue
+            if quote:
+                rows.append((code, day, 1 / quote))
+    rows.sort()
+    return rows
+
+
+class LocalResponse:
+    """The part of requests.Response the rate ingestion uses"""
+
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self.payload = payload
+
+    def json(self):
+        return self.payload
+
+
+class LocalRatesAPI:
+    """
+    Offline stand-in for the Frankfurter rates API
+    Serves /latest and /<start>..<end> in the same JSON shape from a fixed rate
+    table, with no quotes on weekends like the real API. Pass it wherever the
+    requests module is expected, e.g. ingest_currency_rates(..., http=LocalRatesAPI(rates)).
+    """
+    range_pattern = re.compile(r'/(\d{4}-\d{2}-\d{2})\.\.(\d{4}-\d{2}-\d{2})?$')
+
+    def __init__(self, rates, base='USD', drift=None):
+        """
+        Args:
+            rates: {code: units per 1 base}
+            base: Currency the table is quoted against
+            drift: Optional callable (code, date) -> multiplier, for rates that move over time
+        """
+        self.rates = rates
+        self.base = base
+        self.drift = drift
+        self.requests = []  # URLs served, for checking what a caller fetched
+
+    def units(self, code, day):
+        if code == self.base:
+            return 1.0
+        return self.rates[code] * (self.drift(code, day) if self.drift else 1.0)
+
+    def day_quotes(self, day, base):
+        # Cross rates through the table's own base
+        base_units = self.units(base, day)
+        codes = set(self.rates) | {self.base}
+        return {
+            code: round(self.units(code, day) / base_units, 6)
+            for code in sorted(codes) if code != base
+        }
+
+    def get(self, url, params=None, timeout=None):
+        self.requests.append(url)
+        path, _, query = url.partition('?')
+        base = self.base
+        for pair in query.split('&'):
+            key, _, value = pair.partition('=')
+            if key == 'from' and value:
+                base = value
+        base = (params or {}).get('from', base)
+
+        if path.endswith('/latest'):
+            today = date.today()
+            return LocalResponse(200, {'amount': 1.0, 'base': base, 'date': today.isoformat(),
+                                       'rates': self.day_quotes(today, base)})
+
+        match = self.range_pattern.search(path)
+        if not match:
+            return LocalResponse(404, {'message': 'not found'})
+
+        start = datetime.strptime(match.group(1), '%Y-%m-%d').date()
+        end = datetime.strptime(match.group(2), '%Y-%m-%d').date() if match.group(2) else date.today()
+        rates = {}
+        day = start
+        while day <= end:
+            if day.weekday() < 5:
+                rates[day.isoformat()] = self.day_quotes(day, base)
+            day += timedelta(days=1)
+        return LocalResponse(200, {'amount': 1.0, 'base': base, 'start_date': start.isoformat(),
+                                   'end_date': end.isoformat(), 'rates': rates})
@@ -0,0 +1,39 @@
+"""Add expense_shares table
+
+Revision ID: 3f9a6c2d1b7e
+Revises: 5c900eb00454
+Create Date: 2026-10-18 10:12:04.318221
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a6c2d1b7e'
+down_revision = '5c900eb00454'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('expense_shares',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('expense_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.String(length=120), nullable=False),
+    sa.Column('amount', sa.Float(), nullable=False),
+    sa.Column('original_amount', sa.Float(), nullable=True),
+    sa.Column('currency_code', sa.String(length=3), nullable=True),
+    sa.ForeignKeyConstraint(['expense_id'], ['expenses.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_expense_shares_expense_id', 'expense_shares', ['expense_id'], unique=False)
+    op.create_index('ix_expense_shares_user_expense', 'expense_shares', ['user_id', 'expense_id'], unique=False)
+    # Populate the table for existing expenses with: flask backfill-expense-shares
+
+
+def downgrade():
+    op.drop_index('ix_expense_shares_user_expense', table_name='expense_shares')
+    op.drop_index('ix_expense_shares_expense_id', table_name='expense_shares')
+    op.drop_table('expense_shares')
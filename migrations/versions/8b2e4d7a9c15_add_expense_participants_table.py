@@ -0,0 +1,57 @@
+"""Add expense_participants table
+
+Replaces the `split_with LIKE '%user%'` membership scans. Compare query plans
+and latency of both filters with benchmarks/bench_expense_participants.py.
+
+Revision ID: 8b2e4d7a9c15
+Revises: 3f9a6c2d1b7e
+Create Date: 2026-10-18 11:02:47.905113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2e4d7a9c15'
+down_revision = '3f9a6c2d1b7e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('expense_participants',
+    sa.Column('expense_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.String(length=120), nullable=False),
+    sa.ForeignKeyConstraint(['expense_id'], ['expenses.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('expense_id', 'user_id')
+    )
+    op.create_index('ix_expense_participants_user_expense', 'expense_participants', ['user_id', 'expense_id'], unique=False)
+
+    # Populate from the owner and split_with columns of existing expenses
+    connection = op.get_bind()
+    user_ids = {row[0] for row in connection.execute(sa.text('SELECT id FROM users'))}
+    participants = sa.table('expense_participants',
+        sa.column('expense_id', sa.Integer),
+        sa.column('user_id', sa.String)
+    )
+
+    rows = []
+    for expense_id, owner_id, split_with in connection.execute(sa.text('SELECT id, user_id, split_with FROM expenses')).fetchall():
+        involved = {owner_id}
+        if split_with:
+            involved.update(user_id.strip() for user_id in split_with.split(',') if user_id.strip() in user_ids)
+        rows.extend({'expense_id': expense_id, 'user_id': user_id} for user_id in involved)
+
+        if len(rows) >= 5000:
+            op.bulk_insert(participants, rows)
+            rows = []
+
+    if rows:
+        op.bulk_insert(participants, rows)
+
+
+def downgrade():
+    op.drop_index('ix_expense_participants_user_expense', table_name='expense_participants')
+    op.drop_table('expense_participants')
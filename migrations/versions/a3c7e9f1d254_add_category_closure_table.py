@@ -0,0 +1,62 @@
+"""Add category_closure table
+
+Every (ancestor, descendant) pair of the category tree, so "a category and
+everything under it" is one indexed join at any depth. Populated here from the
+existing parent links; `flask rebuild-category-closure` rebuilds it at any time.
+
+Revision ID: a3c7e9f1d254
+Revises: f4a9c2e6b803
+Create Date: 2026-10-18 21:06:14.583920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c7e9f1d254'
+down_revision = 'f4a9c2e6b803'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('category_closure',
+    sa.Column('ancestor_id', sa.Integer(), nullable=False),
+    sa.Column('descendant_id', sa.Integer(), nullable=False),
+    sa.Column('depth', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['ancestor_id'], ['categories.id'], ),
+    sa.ForeignKeyConstraint(['descendant_id'], ['categories.id'], ),
+    sa.PrimaryKeyConstraint('ancestor_id', 'descendant_id')
+    )
+    op.create_index('ix_category_closure_descendant', 'category_closure', ['descendant_id'], unique=False)
+
+    # Walk each category up through its parents
+    connection = op.get_bind()
+    parents = dict(connection.execute(sa.text('SELECT id, parent_id FROM categories')).fetchall())
+    closure = sa.table('category_closure',
+        sa.column('ancestor_id', sa.Integer),
+        sa.column('descendant_id', sa.Integer),
+        sa.column('depth', sa.Integer)
+    )
+
+    rows = []
+    for category_id in parents:
+        ancestor_id, depth, seen = category_id, 0, set()
+        while ancestor_id in parents and ancestor_id not in seen:
+            seen.add(ancestor_id)
+            rows.append({'ancestor_id': ancestor_id, 'descendant_id': category_id, 'depth': depth})
+            ancestor_id = parents[ancestor_id]
+            depth += 1
+
+        if len(rows) >= 5000:
+            op.bulk_insert(closure, rows)
+            rows = []
+
+    if rows:
+        op.bulk_insert(closure, rows)
+
+
+def downgrade():
+    op.drop_index('ix_category_closure_descendant', table_name='category_closure')
+    op.drop_table('category_closure')
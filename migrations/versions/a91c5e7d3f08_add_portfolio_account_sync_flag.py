@@ -0,0 +1,29 @@
+"""Add portfolios.account_sync_pending
+
+Dirty flag for the background job that copies portfolio values into their
+linked account balances, replacing the sync that ran on every dashboard view
+and login. Existing linked portfolios start flagged so the first run syncs them.
+
+Revision ID: a91c5e7d3f08
+Revises: f2b8d6e4a913
+Create Date: 2026-10-18 17:05:33.718240
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a91c5e7d3f08'
+down_revision = 'f2b8d6e4a913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('portfolios', sa.Column('account_sync_pending', sa.Boolean(), server_default=sa.false(), nullable=False))
+    op.execute(sa.text('UPDATE portfolios SET account_sync_pending = TRUE WHERE account_id IS NOT NULL'))
+
+
+def downgrade():
+    op.drop_column('portfolios', 'account_sync_pending')
@@ -0,0 +1,36 @@
+"""Add balance_snapshots table
+
+Daily account balances for the dashboard net-worth chart. After upgrading,
+reconstruct the past year once from the transaction history:
+
+    flask backfill-balance-snapshots
+
+Revision ID: b6d3f9a2c471
+Revises: a91c5e7d3f08
+Create Date: 2026-10-18 18:12:47.309516
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6d3f9a2c471'
+down_revision = 'a91c5e7d3f08'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('balance_snapshots',
+    sa.Column('account_id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('balance', sa.Float(), nullable=False),
+    sa.Column('balance_base', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['account_id'], ['accounts.id'], ),
+    sa.PrimaryKeyConstraint('account_id', 'date')
+    )
+
+
+def downgrade():
+    op.drop_table('balance_snapshots')
@@ -0,0 +1,38 @@
+"""Add budget_period_totals table
+
+Spending of each budget per period, kept current as expenses are written, with
+rows of past periods kept as history. After upgrading, record the current
+periods once and check the table at any time with:
+
+    flask verify-budget-totals --rebuild
+
+Revision ID: b9d4f2a6c318
+Revises: a3c7e9f1d254
+Create Date: 2026-10-18 22:31:52.160447
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b9d4f2a6c318'
+down_revision = 'a3c7e9f1d254'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('budget_period_totals',
+    sa.Column('budget_id', sa.Integer(), nullable=False),
+    sa.Column('period_start', sa.DateTime(), nullable=False),
+    sa.Column('period_end', sa.DateTime(), nullable=False),
+    sa.Column('spent', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['budget_id'], ['budgets.id'], ),
+    sa.PrimaryKeyConstraint('budget_id', 'period_start')
+    )
+
+
+def downgrade():
+    op.drop_table('budget_period_totals')
@@ -0,0 +1,90 @@
+"""Add user_pair_balances table and expense_shares.paid_by
+
+Populated here from the existing expense_shares rows and settlements. The
+balances are only as complete as the shares, so an install that never ran
+`flask backfill-expense-shares` should run it and then
+`flask verify-pair-balances --rebuild`.
+
+Revision ID: c4d81f3e6a20
+Revises: 8b2e4d7a9c15
+Create Date: 2026-10-18 12:31:09.562874
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d81f3e6a20'
+down_revision = '8b2e4d7a9c15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_pair_balances',
+    sa.Column('user_id', sa.String(length=120), nullable=False),
+    sa.Column('other_user_id', sa.String(length=120), nullable=False),
+    sa.Column('amount', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['other_user_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'other_user_id')
+    )
+    op.add_column('expense_shares', sa.Column('paid_by', sa.String(length=120), nullable=True))
+    op.create_foreign_key('fk_expense_shares_paid_by', 'expense_shares', 'users', ['paid_by'], ['id'])
+
+    # Shares are owed to the expense's payer, unless the payer is no longer a user
+    connection = op.get_bind()
+    connection.execute(sa.text(
+        'UPDATE expense_shares SET paid_by = ('
+        ' SELECT expenses.paid_by FROM expenses JOIN users ON users.id = expenses.paid_by'
+        ' WHERE expenses.id = expense_shares.expense_id)'
+    ))
+
+    # Net what each debtor owes each creditor, keyed by the ordered pair like add_pair_delta()
+    debts = connection.execute(sa.text(
+        'SELECT paid_by, user_id, SUM(amount) FROM expense_shares'
+        ' WHERE paid_by IS NOT NULL AND paid_by <> user_id GROUP BY paid_by, user_id'
+    )).fetchall()
+    # Paying someone back means they now owe the payer that much more
+    debts += connection.execute(sa.text(
+        'SELECT payer_id, receiver_id, SUM(amount) FROM settlements'
+        ' WHERE payer_id <> receiver_id GROUP BY payer_id, receiver_id'
+    )).fetchall()
+
+    deltas = {}
+    for creditor_id, debtor_id, amount in debts:
+        if creditor_id < debtor_id:
+            deltas[(creditor_id, debtor_id)] = deltas.get((creditor_id, debtor_id), 0.0) + (amount or 0.0)
+        else:
+            deltas[(debtor_id, creditor_id)] = deltas.get((debtor_id, creditor_id), 0.0) - (amount or 0.0)
+
+    balances = sa.table('user_pair_balances',
+        sa.column('user_id', sa.String),
+        sa.column('other_user_id', sa.String),
+        sa.column('amount', sa.Float),
+        sa.column('updated_at', sa.DateTime)
+    )
+    now = datetime.utcnow()
+    rows = []
+    for (user_id, other_user_id), amount in deltas.items():
+        if abs(amount) < 1e-9:
+            continue
+        rows.append({'user_id': user_id, 'other_user_id': other_user_id, 'amount': amount, 'updated_at': now})
+        rows.append({'user_id': other_user_id, 'other_user_id': user_id, 'amount': -amount, 'updated_at': now})
+
+        if len(rows) >= 5000:
+            op.bulk_insert(balances, rows)
+            rows = []
+
+    if rows:
+        op.bulk_insert(balances, rows)
+
+
+def downgrade():
+    op.drop_constraint('fk_expense_shares_paid_by', 'expense_shares', type_='foreignkey')
+    op.drop_column('expense_shares', 'paid_by')
+    op.drop_table('user_pair_balances')
@@ -0,0 +1,27 @@
+"""Add users.category_rules_version
+
+Bumped whenever a user's category mappings change, so every worker knows when
+to recompile its cached matcher for that user.
+
+Revision ID: c5e8a1d7f402
+Revises: b9d4f2a6c318
+Create Date: 2026-10-18 23:14:09.627381
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e8a1d7f402'
+down_revision = 'b9d4f2a6c318'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('category_rules_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    op.drop_column('users', 'category_rules_version')
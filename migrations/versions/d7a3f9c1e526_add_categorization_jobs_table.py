@@ -0,0 +1,41 @@
+"""Add categorization_jobs table
+
+Progress of background bulk categorization runs, polled by the transactions page.
+
+Revision ID: d7a3f9c1e526
+Revises: c5e8a1d7f402
+Create Date: 2026-10-18 23:42:37.905164
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7a3f9c1e526'
+down_revision = 'c5e8a1d7f402'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('categorization_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.String(length=120), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=True),
+    sa.Column('processed', sa.Integer(), nullable=True),
+    sa.Column('categorized', sa.Integer(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_categorization_jobs_user_id'), 'categorization_jobs', ['user_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_categorization_jobs_user_id'), table_name='categorization_jobs')
+    op.drop_table('categorization_jobs')
@@ -0,0 +1,32 @@
+"""Add currency_table_version
+
+Shared version stamp of the currencies table. Workers keep the exchange rates
+in memory and reload them when this version moves.
+
+Revision ID: d7e2a4c8b156
+Revises: b6d3f9a2c471
+Create Date: 2026-10-18 18:54:21.640173
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7e2a4c8b156'
+down_revision = 'b6d3f9a2c471'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('currency_table_version',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('currency_table_version')
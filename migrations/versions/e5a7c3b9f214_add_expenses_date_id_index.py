@@ -0,0 +1,27 @@
+"""Add (date, id) index on expenses
+
+Backs the keyset-paginated dashboard activity feed (/dashboard/activity),
+which orders and seeks on (date, id).
+
+Revision ID: e5a7c3b9f214
+Revises: c4d81f3e6a20
+Create Date: 2026-10-18 15:41:09.327514
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a7c3b9f214'
+down_revision = 'c4d81f3e6a20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_expenses_date_id', 'expenses', ['date', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_expenses_date_id', table_name='expenses')
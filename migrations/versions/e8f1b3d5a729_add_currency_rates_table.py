@@ -0,0 +1,35 @@
+"""Add currency_rates table
+
+Daily exchange rate history for converting transactions at the rate of their
+own date. After upgrading, load the range you need, e.g.:
+
+    flask ingest-currency-rates --start 2024-01-01
+
+Revision ID: e8f1b3d5a729
+Revises: d7e2a4c8b156
+Create Date: 2026-10-18 19:37:02.815447
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8f1b3d5a729'
+down_revision = 'd7e2a4c8b156'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('currency_rates',
+    sa.Column('code', sa.String(length=3), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('rate_to_base', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['code'], ['currencies.code'], ),
+    sa.PrimaryKeyConstraint('code', 'date')
+    )
+
+
+def downgrade():
+    op.drop_table('currency_rates')
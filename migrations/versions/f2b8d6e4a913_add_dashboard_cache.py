@@ -0,0 +1,40 @@
+"""Add dashboard cache table and users.dashboard_version
+
+users.dashboard_version is bumped whenever a user's data changes and is part
+of every dashboard cache key. dashboard_cache_entries backs the shared
+'database' cache backend (DASHBOARD_CACHE_BACKEND=database).
+
+Revision ID: f2b8d6e4a913
+Revises: e5a7c3b9f214
+Create Date: 2026-10-18 16:27:51.604128
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b8d6e4a913'
+down_revision = 'e5a7c3b9f214'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('dashboard_cache_entries',
+    sa.Column('cache_key', sa.String(length=255), nullable=False),
+    sa.Column('user_id', sa.String(length=120), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('cache_key')
+    )
+    op.create_index(op.f('ix_dashboard_cache_entries_user_id'), 'dashboard_cache_entries', ['user_id'], unique=False)
+
+    op.add_column('users', sa.Column('dashboard_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    op.drop_column('users', 'dashboard_version')
+
+    op.drop_index(op.f('ix_dashboard_cache_entries_user_id'), table_name='dashboard_cache_entries')
+    op.drop_table('dashboard_cache_entries')
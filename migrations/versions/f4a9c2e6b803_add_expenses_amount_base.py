@@ -0,0 +1,30 @@
+"""Add expenses.amount_base
+
+Each expense's amount in the base currency at the rate of its own date, kept
+up to date on every write so aggregations can SUM it directly. After
+upgrading, fill existing rows:
+
+    flask backfill-amount-base
+
+Revision ID: f4a9c2e6b803
+Revises: e8f1b3d5a729
+Create Date: 2026-10-18 20:21:48.950312
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4a9c2e6b803'
+down_revision = 'e8f1b3d5a729'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('expenses', sa.Column('amount_base', sa.Float(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('expenses', 'amount_base')
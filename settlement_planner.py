@@ -0,0 +1,42 @@
+import heapq
+
+
+def plan_settlements(net_balances):
+    """
+    Compute a small set of transfers that settles every balance in a group.
+
+    net_balances maps user id -> net amount (positive: the user is owed money,
+    negative: the user owes money). Returns a list of (payer_id, receiver_id, amount)
+    tuples. Greedy min-cash-flow: the largest debtor repeatedly pays the largest
+    creditor, so every transfer clears at least one member (at most n - 1
+    transfers) and the whole plan runs in O(n log n).
+    """
+    # Work in whole cents so repeated subtraction can't leave float dust behind
+    creditors = []
+    debtors = []
+    for user_id, amount in net_balances.items():
+        cents = int(round(amount * 100))
+        if cents > 0:
+            creditors.append((-cents, user_id))
+        elif cents < 0:
+            debtors.append((cents, user_id))
+
+    # Max-heaps keyed on the amount still to be received / paid
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
+
+    transfers = []
+    while creditors and debtors:
+        credit, creditor_id = heapq.heappop(creditors)
+        debt, debtor_id = heapq.heappop(debtors)
+
+        amount = min(-credit, -debt)
+        transfers.append((debtor_id, creditor_id, amount / 100))
+
+        # Whoever isn't fully settled goes back on the heap with the remainder
+        if -credit > amount:
+            heapq.heappush(creditors, (credit + amount, creditor_id))
+        if -debt > amount:
+            heapq.heappush(debtors, (debt + amount, debtor_id))
+
+    return transfers
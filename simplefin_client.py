@@ -218,7 +218,7 @@ class SimpleFin:
 
     def create_transactions_from_account(self, account_data, db_account, user_id, 
                                         detect_transfer_func=None, auto_categorize_func=None, 
-                                        get_category_id_func=None):
+                                        get_category_id_func=None, predict_category_func=None):
         """
         Create Expense model instances from processed account data, applying transfer detection
         and auto-categorization.
@@ -230,6 +230,7 @@ class SimpleFin:
         - detect_transfer_func: Function to detect internal transfers
         - auto_categorize_func: Function for auto-categorization
         - get_category_id_func: Function to get or create a category by name
+        - predict_category_func: Function suggesting a category from the user's history
         
         Returns:
         - Tuple of (list of transactions, imported_count)
@@ -247,7 +248,8 @@ class SimpleFin:
                     user_id,
                     detect_transfer_func,
                     auto_categorize_func,
-                    get_category_id_func
+                    get_category_id_func,
+                    predict_category_func
                 )
                 
                 if transaction:
@@ -262,7 +264,7 @@ class SimpleFin:
 
     def create_transaction_instance(self, trans_data, db_account, user_id, 
                                   detect_transfer_func=None, auto_categorize_func=None,
-                                  get_category_id_func=None):
+                                  get_category_id_func=None, predict_category_func=None):
         """
         Create a single transaction model instance with transfer detection and categorization.
         
@@ -273,6 +275,7 @@ class SimpleFin:
         - detect_transfer_func: Function to detect internal transfers
         - auto_categorize_func: Function for auto-categorization
         - get_category_id_func: Function to get or create a category by name
+        - predict_category_func: Function suggesting a category from the user's history
         
         Returns:
         - Tuple of (Transaction model instance, is_transfer boolean)
@@ -370,6 +373,16 @@ class SimpleFin:
                 except Exception as e:
                     self.app.logger.error(f"Error in category lookup: {str(e)}")
             
+            # Last resort: the category the user's past transactions suggest
+            if not category_id and predict_category_func:
+                try:
+                    category_id = predict_category_func(
+                        trans_data.get('description', ''),
+                        user_id
+                    )
+                except Exception as e:
+                    self.app.logger.error(f"Error in category prediction: {str(e)}")
+            
             # Set the category if we found one
             if category_id:
                 transaction.category_id = category_id
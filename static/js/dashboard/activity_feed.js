@@ -0,0 +1,161 @@
+/**
+ * Dashboard Activity Feed - Dollar Dollar Bill Y'all
+ *
+ * Loads dashboard transactions page by page from /dashboard/activity.
+ * Every `.activity-feed` container holds a `.activity-feed-rows` tbody and a
+ * `.activity-feed-sentinel`; when the sentinel scrolls into view the next page
+ * is fetched with the container's keyset cursor. Containers without a
+ * `data-next-cursor` attribute (the monthly details) start from the first page.
+ */
+const ActivityFeed = (function() {
+    const endpoint = '/dashboard/activity';
+
+    function init() {
+        document.addEventListener('DOMContentLoaded', function() {
+            document.querySelectorAll('.activity-feed').forEach(watchFeed);
+        });
+
+        return {
+            loadNextPage
+        };
+    }
+
+    // Load the next page whenever the feed's sentinel becomes visible
+    function watchFeed(feed) {
+        const sentinel = feed.querySelector('.activity-feed-sentinel');
+        if (!sentinel) {
+            return;
+        }
+
+        if (!('IntersectionObserver' in window)) {
+            // Old browsers: replace the spinner with a manual button
+            sentinel.innerHTML = '<button type="button" class="btn btn-sm btn-outline-light">Load more</button>';
+            sentinel.querySelector('button').addEventListener('click', () => loadNextPage(feed));
+            return;
+        }
+
+        const observer = new IntersectionObserver(function(entries) {
+            if (entries.some(entry => entry.isIntersecting)) {
+                loadNextPage(feed);
+            }
+        }, { rootMargin: '200px' });
+        observer.observe(sentinel);
+        feed._activityObserver = observer;
+    }
+
+    function loadNextPage(feed) {
+        if (feed.dataset.loading === 'true' || feed.dataset.done === 'true') {
+            return;
+        }
+
+        const params = new URLSearchParams();
+        if (feed.dataset.nextCursor) {
+            params.set('cursor', feed.dataset.nextCursor);
+        }
+        if (feed.dataset.month) {
+            params.set('month', feed.dataset.month);
+        }
+        if (feed.dataset.expensesOnly) {
+            params.set('expenses_only', feed.dataset.expensesOnly);
+        }
+
+        feed.dataset.loading = 'true';
+        fetch(`${endpoint}?${params.toString()}`, { headers: { 'Accept': 'application/json' } })
+            .then(response => response.json())
+            .then(data => {
+                if (!data.success) {
+                    throw new Error(data.message || 'Failed to load activity');
+                }
+
+                const rows = feed.querySelector('.activity-feed-rows');
+                data.transactions.forEach(item => rows.appendChild(renderActivityRow(item)));
+
+                if (!rows.children.length) {
+                    rows.innerHTML = '<tr><td colspan="7" class="text-center text-muted">No transactions</td></tr>';
+                }
+
+                feed.dataset.nextCursor = data.next_cursor || '';
+                if (!data.next_cursor) {
+                    finishFeed(feed);
+                }
+            })
+            .catch(error => {
+                console.error('Error loading activity:', error);
+                const sentinel = feed.querySelector('.activity-feed-sentinel');
+                if (sentinel) {
+                    sentinel.textContent = 'Could not load more transactions.';
+                }
+                finishFeed(feed);
+            })
+            .finally(() => {
+                feed.dataset.loading = 'false';
+            });
+    }
+
+    function finishFeed(feed) {
+        feed.dataset.done = 'true';
+        if (feed._activityObserver) {
+            feed._activityObserver.disconnect();
+        }
+        const sentinel = feed.querySelector('.activity-feed-sentinel');
+        if (sentinel && !sentinel.textContent.includes('Could not')) {
+            sentinel.remove();
+        }
+    }
+
+    // Same markup as templates/partials/activity_row.html
+    function renderActivityRow(item) {
+        const symbol = window.baseCurrencySymbol || '$';
+        const money = amount => `${symbol}${Number(amount).toFixed(2)}`;
+
+        const row = document.createElement('tr');
+        row.dataset.expenseId = item.id;
+        if (item.has_category_splits) {
+            row.classList.add('multi-category-split');
+        }
+
+        let typeBadge = '';
+        if (item.transaction_type !== 'expense') {
+            const label = item.transaction_type.charAt(0).toUpperCase() + item.transaction_type.slice(1);
+            typeBadge = ` <span class="badge bg-secondary ms-1">${escapeHtml(label)}</span>`;
+        }
+
+        let categories = item.has_category_splits
+            ? '<div class="multi-category-indicator badge"><i class="fas fa-tags me-1"></i> Split</div>'
+            : '';
+        categories += item.categories.map(category => `
+            <span class="badge category-badge" style="background-color: ${escapeHtml(category.color)};">
+                <i class="fas ${escapeHtml(category.icon)}"></i> ${escapeHtml(category.name)}
+                ${category.amount !== null ? `<span class="category-amount">${money(category.amount)}</span>` : ''}
+            </span>`).join('');
+        if (!item.categories.length) {
+            categories += '<span class="text-muted">-</span>';
+        }
+
+        const portions = item.portions.map(portion => `
+            <small class="d-block mb-1">
+                <span class="badge" style="background-color: ${escapeHtml(portion.color)};">${escapeHtml(portion.name)}</span>:
+                ${money(portion.amount)}
+            </small>`).join('');
+
+        row.innerHTML = `
+            <td>${escapeHtml(item.date)}</td>
+            <td>${escapeHtml(item.description)}${typeBadge}</td>
+            <td class="categories-cell">${categories}</td>
+            <td>${money(item.amount)}</td>
+            <td>${escapeHtml(item.payer)}</td>
+            <td>${escapeHtml(item.card_used)}</td>
+            <td>${portions}</td>`;
+        return row;
+    }
+
+    // Also escapes quotes, since values end up inside attributes (style, class)
+    const HTML_ESCAPES = {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;', '`': '&#96;'};
+
+    function escapeHtml(value) {
+        const text = value === null || value === undefined ? '' : String(value);
+        return text.replace(/[&<>"'`]/g, char => HTML_ESCAPES[char]);
+    }
+
+    return init();
+})();
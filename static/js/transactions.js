@@ -600,23 +600,52 @@ function performBulkCategorization() {
         bulkBtn.innerHTML = '<i class="fas fa-spinner fa-spin me-2"></i>Categorizing...';
     }
     
-    // Perform AJAX request
+    // Start the categorization job on the server
     fetch('/bulk_categorize_transactions', {
         method: 'POST',
         headers: {
             'X-Requested-With': 'XMLHttpRequest'
         }
     })
+    .then(response => response.json())
+    .then(data => {
+        if (!data.success) {
+            throw new Error(data.job && data.job.error ? data.job.error : 'Bulk categorization failed');
+        }
+        pollBulkCategorization(data.job.id);
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        showMessage(`Error during categorization: ${error.message}`, 'error');
+        resetBulkCategorizeButton();
+    });
+}
+
+// Follow the job's progress until it finishes
+function pollBulkCategorization(jobId) {
+    fetch(`/bulk_categorize_transactions/status?job_id=${jobId}`)
     .then(response => {
         if (!response.ok) {
-            throw new Error('Bulk categorization failed');
+            throw new Error('Could not get categorization progress');
         }
-        // Just get the response text instead of expecting JSON
-        return response.text();
+        return response.json();
     })
     .then(data => {
+        const job = data.job;
+        if (job.status === 'failed') {
+            throw new Error(job.error || 'Bulk categorization failed');
+        }
+        if (job.status !== 'done') {
+            const bulkBtn = document.getElementById('bulkCategorizeBtn');
+            if (bulkBtn) {
+                bulkBtn.innerHTML = `<i class="fas fa-spinner fa-spin me-2"></i>Categorizing... ${job.percentage}%`;
+            }
+            setTimeout(() => pollBulkCategorization(jobId), 1000);
+            return;
+        }
+
         // Show success message
-        showMessage('Auto-categorization complete! Page will reload to show changes.', 'success', {
+        showMessage(`Categorized ${job.categorized} of ${job.total} transactions! Page will reload to show changes.`, 'success', {
             autoHide: true,
             delay: 3000,
             onClose: function() {
@@ -628,11 +657,14 @@ function performBulkCategorization() {
     .catch(error => {
         console.error('Error:', error);
         showMessage(`Error during categorization: ${error.message}`, 'error');
-        
-        // Reset button state
-        if (bulkBtn) {
-            bulkBtn.disabled = false;
-            bulkBtn.innerHTML = '<i class="fas fa-tags me-2"></i>Auto-Categorize';
-        }
+        resetBulkCategorizeButton();
     });
+}
+
+function resetBulkCategorizeButton() {
+    const bulkBtn = document.getElementById('bulkCategorizeBtn');
+    if (bulkBtn) {
+        bulkBtn.disabled = false;
+        bulkBtn.innerHTML = '<i class="fas fa-tags me-2"></i>Auto-Categorize';
+    }
 }
\ No newline at end of file